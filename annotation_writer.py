@@ -0,0 +1,108 @@
+import os
+import json
+from os.path import isfile
+
+
+class AnnotationWriter:
+    """
+    Streams AcTiV-D style Protocol4 annotations to disk one frame at a time.
+
+    Frames are buffered and flushed every flush_every frames. After each flush a checkpoint
+    (<xml_path>.checkpoint) records how many frames and bytes are safely on disk, so an interrupted run can reopen
+    the file with resume=True and append from the last checkpoint. The closing tag is written by close(), which
+    keeps the checkpoint flagged complete: resuming a finished file reports all of its frames as written, so callers
+    skip them, and only the closing tag is rewritten.
+    :param xml_path (str)    : annotation file to write, e.g. gtraining_Ge.xml
+    :param channel (str)     : channel attribute of the Protocol4 element
+    :param resume (bool)     : continue from an existing checkpoint instead of starting over
+    :param flush_every (int) : number of frames buffered between flushes
+    """
+    def __init__(self, xml_path, channel, resume=False, flush_every=1000):
+        self.xml_path = xml_path
+        self.checkpoint_path = xml_path + ".checkpoint"
+        self.flush_every = flush_every
+        self.buffer = []
+        self.frames_written = 0
+
+        checkpoint = self.read_checkpoint() if resume else None
+        if checkpoint is not None:
+            # Drop anything written after the last checkpoint, which may end mid-frame
+            self.file = open(xml_path, 'r+b')
+            self.file.truncate(checkpoint['offset'])
+            self.file.seek(checkpoint['offset'])
+            self.frames_written = checkpoint['frames']
+            if checkpoint.get('complete'):
+                print("{0} is already complete with {1} frames".format(xml_path, self.frames_written))
+            else:
+                print("Resuming {0} after {1} frames".format(xml_path, self.frames_written))
+        else:
+            self.file = open(xml_path, 'wb')
+            self.file.write('''<?xml version="1.0" encoding="UTF-8"?>\n\n<Protocol4 channel="{0}">\n\n'''
+                            .format(channel).encode('utf-8'))
+            self.checkpoint()
+
+    def read_checkpoint(self):
+        if not (isfile(self.checkpoint_path) and isfile(self.xml_path)):
+            return None
+        try:
+            with open(self.checkpoint_path, 'r') as f:
+                checkpoint = json.load(f)
+        except ValueError:
+            return None
+        if os.path.getsize(self.xml_path) < checkpoint['offset']:
+            return None
+        return checkpoint
+
+    def add_frame(self, frame_id, extension, rectangles):
+        """
+        Queue one frame.
+        :param frame_id (int)      : frame id, also used in the image file name
+        :param extension (str)     : image file extension, e.g. jpg
+        :param rectangles (list)   : (rectangle id, height, width, y, x) tuples
+        """
+        frame_xml = '''<frame source="vd00" id="{0}" ext="{1}">\n'''.format(str(frame_id), extension)
+        for rectangle_id, height, width, y, x in rectangles:
+            frame_xml += '''<rectangle id="{4}" height="{0}" width="{1}" y="{2}" x="{3}"/>\n'''.format(
+                height, width, y, x, rectangle_id)
+        frame_xml += '''</frame>\n'''
+        self.buffer.append(frame_xml)
+
+        if len(self.buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if len(self.buffer) == 0:
+            return
+        self.file.write("".join(self.buffer).encode('utf-8'))
+        self.frames_written += len(self.buffer)
+        self.buffer = []
+        self.checkpoint()
+
+    def checkpoint(self, offset=None, complete=False):
+        # Make the frames durable before the checkpoint claims them
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        temp_path = self.checkpoint_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({'frames': self.frames_written, 'offset': self.file.tell() if offset is None else offset,
+                       'complete': complete}, f)
+        os.replace(temp_path, self.checkpoint_path)
+
+    def close(self):
+        self.flush()
+        # The offset stays in front of the closing tag so a resumed run can still append more frames
+        offset = self.file.tell()
+        self.file.write("\n</Protocol4>".encode('utf-8'))
+        self.checkpoint(offset, complete=True)
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Leave the file open-ended at the last checkpoint so the run can be resumed
+            self.flush()
+            self.file.close()
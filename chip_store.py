@@ -0,0 +1,97 @@
+import os
+import json
+from multiprocessing import Pool
+import numpy as np
+
+
+def inventory_signature(chip_paths):
+    # (size, mtime_ns) per chip; any change to the inventory invalidates the atlas
+    signature = []
+    for chip_path in chip_paths:
+        stat = os.stat(chip_path)
+        signature.append([stat.st_size, stat.st_mtime_ns])
+    return signature
+
+
+def decode_chip(chip_path):
+    import cv2
+    return cv2.imread(chip_path)
+
+
+class ChipAtlas:
+    """
+    Chip inventory decoded once into a packed pixel buffer (<prefix>.bin) plus an offset/shape index
+    (<prefix>.json). The buffer is memory mapped read only, so chips are zero-copy slices and the pages are shared
+    between worker processes.
+    :param atlas_prefix (str) : path prefix of the atlas files
+    """
+    def __init__(self, atlas_prefix):
+        with open(atlas_prefix + ".json", 'r') as f:
+            index = json.load(f)
+        self.paths = index['paths']
+        self.offsets = index['offsets']
+        self.shapes = [tuple(shape) for shape in index['shapes']]
+        if os.path.getsize(atlas_prefix + ".bin") > 0:
+            self.pixels = np.memmap(atlas_prefix + ".bin", dtype=np.uint8, mode='r')
+        else:
+            self.pixels = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def chip(self, i):
+        """
+        Decoded BGR chip as a read only view into the atlas, or None if the chip could not be decoded.
+        """
+        rows, cols, channels = self.shapes[i]
+        if rows == 0:
+            return None
+        start = self.offsets[i]
+        return self.pixels[start:start + rows * cols * channels].reshape(rows, cols, channels)
+
+    @staticmethod
+    def is_current(atlas_prefix, chip_paths):
+        if not (os.path.isfile(atlas_prefix + ".json") and os.path.isfile(atlas_prefix + ".bin")):
+            return False
+        try:
+            with open(atlas_prefix + ".json", 'r') as f:
+                index = json.load(f)
+        except ValueError:
+            return False
+        return index['paths'] == chip_paths and index['signature'] == inventory_signature(chip_paths)
+
+    @staticmethod
+    def build(atlas_prefix, chip_paths, num_workers=None):
+        # Decode in parallel but write in inventory order so chip i always maps to chip_paths[i]
+        offsets = []
+        shapes = []
+        offset = 0
+        with open(atlas_prefix + ".bin.tmp", 'wb') as f, Pool(processes=num_workers) as pool:
+            for chip_path, chip in zip(chip_paths, pool.imap(decode_chip, chip_paths, chunksize=64)):
+                if chip is None:
+                    print("Warning - could not decode {0}; skipping".format(chip_path))
+                    shapes.append((0, 0, 3))
+                    offsets.append(offset)
+                    continue
+                chip = np.ascontiguousarray(chip)
+                f.write(chip.tobytes())
+                shapes.append(chip.shape)
+                offsets.append(offset)
+                offset += chip.nbytes
+
+        index = {'paths': chip_paths, 'signature': inventory_signature(chip_paths), 'offsets': offsets,
+                 'shapes': shapes}
+        with open(atlas_prefix + ".json.tmp", 'w') as f:
+            json.dump(index, f)
+        # Index is replaced last so a half written atlas is never considered current
+        os.replace(atlas_prefix + ".bin.tmp", atlas_prefix + ".bin")
+        os.replace(atlas_prefix + ".json.tmp", atlas_prefix + ".json")
+        print("Packed {0} chips ({1:.1f} MB) into {2}.bin".format(len(chip_paths), offset / float(1 << 20),
+                                                                  atlas_prefix))
+
+    @classmethod
+    def load_or_build(cls, atlas_prefix, chip_paths, num_workers=None):
+        if not cls.is_current(atlas_prefix, chip_paths):
+            print("Building chip atlas at {0}".format(atlas_prefix))
+            cls.build(atlas_prefix, chip_paths, num_workers)
+        return cls(atlas_prefix)
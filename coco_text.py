@@ -20,12 +20,15 @@ __version__ = '1.1'
 
 # The following API functions are defined:
 #  COCO_Text  - COCO-Text api class that loads COCO annotations and prepare data structures.
+#  createCatIndex - Build the inverted category indexes used by the category queries (built lazily otherwise).
 #  getAnnIds  - Get ann ids that satisfy given filter conditions.
 #  getImgIds  - Get img ids that satisfy given filter conditions.
 #  loadAnns   - Load anns with the specified ids.
 #  loadImgs   - Load imgs with the specified ids.
 #  showAnns   - Display the specified annotations.
 #  loadRes    - Load algorithm results and create API for accessing them.
+#  columns    - Columnar NumPy view of the annotations for vectorized queries (COCO_TextColumns).
+#  loadSnapshot / saveSnapshot - Load or save the built index next to the annotation file for fast re-loads.
 # Throughout the API "ann"=annotation, "cat"=category, and "img"=image.
 
 # COCO-Text Toolbox.        Version 1.1
@@ -36,26 +39,33 @@ __version__ = '1.1'
 
 import json
 import datetime
-import matplotlib.pyplot as plt
-from matplotlib.collections import PatchCollection
-from matplotlib.patches import Rectangle, PathPatch
-from matplotlib.path import Path
+import pickle
 import numpy as np
 import copy
 import os
+from itertools import chain
+
+# Snapshot of the built index written next to the annotation file, e.g. COCO_Text.json.snapshot.pkl
+SNAPSHOT_SUFFIX = '.snapshot.pkl'
+# Version 2 keeps the string keyed imgs/anns/imgToAnns in dataset; older snapshots are rebuilt
+SNAPSHOT_VERSION = 2
 
 class COCO_Text:
-    def __init__(self, annotation_file=None):
+    def __init__(self, annotation_file=None, use_snapshot=True):
         """
         Constructor of COCO-Text helper class for reading and visualizing annotations.
         :param annotation_file (str): location of annotation file
+        :param use_snapshot (bool)  : load the index from (and save it to) a snapshot next to the annotation file
         :return:
         """
         # load dataset
         self.dataset = {}
         self.anns = {}
         self.imgToAnns = {}
+        self.catToAnns = {}
         self.catToImgs = {}
+        self.catToAnnSets = {}
+        self.columnar = None
         self.imgs = {}
         self.cats = {}
         self.val = []
@@ -65,10 +75,61 @@ class COCO_Text:
             assert os.path.isfile(annotation_file), "file does not exist"
             print ('loading annotations into memory...')
             time_t = datetime.datetime.utcnow()
+            if use_snapshot and self.loadSnapshot(annotation_file):
+                print (datetime.datetime.utcnow() - time_t)
+                return
             dataset = json.load(open(annotation_file, 'r'))
             print (datetime.datetime.utcnow() - time_t)
             self.dataset = dataset
             self.createIndex()
+            if use_snapshot:
+                self.saveSnapshot(annotation_file)
+
+    @staticmethod
+    def snapshotSignature(annotation_file):
+        stat = os.stat(annotation_file)
+        return (SNAPSHOT_VERSION, stat.st_size, stat.st_mtime_ns)
+
+    def loadSnapshot(self, annotation_file):
+        """
+        Load the index from the snapshot of annotation_file if it is still current.
+        :param annotation_file (str) : location of annotation file
+        :return: loaded (bool)       : False if there is no current snapshot
+        """
+        snapshot_file = annotation_file + SNAPSHOT_SUFFIX
+        if not os.path.isfile(snapshot_file):
+            return False
+        try:
+            with open(snapshot_file, 'rb') as f:
+                signature = pickle.load(f)
+                if signature != self.snapshotSignature(annotation_file):
+                    print ('snapshot is out of date; rebuilding')
+                    return False
+                snapshot = pickle.load(f)
+        except (pickle.UnpicklingError, EOFError, ValueError):
+            print ('snapshot is unreadable; rebuilding')
+            return False
+        print ('loaded index snapshot %s'%(snapshot_file))
+        self.__dict__.update(snapshot)
+        return True
+
+    def saveSnapshot(self, annotation_file):
+        """
+        Save the built index next to annotation_file so later runs skip the json parse and index build.
+        :param annotation_file (str) : location of annotation file
+        :return:
+        """
+        snapshot_file = annotation_file + SNAPSHOT_SUFFIX
+        snapshot = {key: getattr(self, key) for key in ('dataset', 'imgToAnns', 'imgs', 'anns', 'cats',
+                                                        'val', 'test', 'train')}
+        try:
+            # Signature is pickled first so a stale snapshot is rejected without loading the rest
+            with open(snapshot_file + '.tmp', 'wb') as f:
+                pickle.dump(self.snapshotSignature(annotation_file), f, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(snapshot, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(snapshot_file + '.tmp', snapshot_file)
+        except OSError as e:
+            print ('could not write snapshot %s: %s'%(snapshot_file, e))
 
     def createIndex(self):
         # create index
@@ -80,8 +141,48 @@ class COCO_Text:
         self.val       = [int(cocoid) for cocoid in self.dataset['imgs'] if self.dataset['imgs'][cocoid]['set'] == 'val']
         self.test      = [int(cocoid) for cocoid in self.dataset['imgs'] if self.dataset['imgs'][cocoid]['set'] == 'test']
         self.train     = [int(cocoid) for cocoid in self.dataset['imgs'] if self.dataset['imgs'][cocoid]['set'] == 'train']
+        # Category indexes are built lazily on first use; see createCatIndex
+        self.catToAnns = {}
+        self.catToImgs = {}
+        self.catToAnnSets = {}
+        self.columnar = None
         print ('index created!')
 
+    def createCatIndex(self, catTypes=('legibility', 'class', 'language')):
+        """
+        Build the inverted index from category value to ann ids for the given category types. Called lazily by the
+        category queries; call it directly to pay the cost up front.
+        :param catTypes (tuple of str) : category types to index, e.g. ('legibility', 'class', 'language')
+        :return:
+        """
+        for catType in catTypes:
+            if catType in self.catToAnns:
+                continue
+            index = {}
+            # Ann ids are kept in self.anns order so query results keep the order of a full scan
+            for annId, ann in self.anns.items():
+                if catType in ann:
+                    index.setdefault(ann[catType], []).append(annId)
+            self.catToAnns[catType] = index
+
+    def annsWithCat(self, catType, cat):
+        self.createCatIndex((catType,))
+        return self.catToAnns[catType].get(cat, [])
+
+    def getAnnSetByCat(self, properties):
+        # Memoized set form of getAnnByCat for intersections
+        key = tuple(map(tuple, properties))
+        if key not in self.catToAnnSets:
+            self.catToAnnSets[key] = set(self.getAnnByCat(properties))
+        return self.catToAnnSets[key]
+
+    def getImgSetByCat(self, properties):
+        # Images having at least one ann that satisfies all given properties
+        key = tuple(map(tuple, properties))
+        if key not in self.catToImgs:
+            self.catToImgs[key] = set([self.anns[annid]['image_id'] for annid in self.getAnnByCat(properties)])
+        return self.catToImgs[key]
+
     def info(self):
         """
         Print information about the annotation file.
@@ -100,7 +201,12 @@ class COCO_Text:
             : get anns for given categories - anns have to satisfy all given property tuples
         :return: ids (int array)       : integer array of ann ids
         """
-        return self.filtering(self.anns, [lambda d, x=a, y=b:d[x] == y for (a,b) in properties])
+        if len(properties) == 0:
+            return list(self.anns.keys())
+        # Walk the shortest posting list and probe the others
+        postings = sorted([self.annsWithCat(a, b) for (a, b) in properties], key=len)
+        others = [set(posting) for posting in postings[1:]]
+        return [annId for annId in postings[0] if all(annId in other for other in others)]
 
     def getAnnIds(self, imgIds=[], catIds=[], areaRng=[]):
         """
@@ -118,10 +224,10 @@ class COCO_Text:
             anns = self.anns.keys()
         else:
             if not len(imgIds) == 0:
-                anns = sum([self.imgToAnns[imgId] for imgId in imgIds if imgId in self.imgToAnns],[])
+                anns = list(chain.from_iterable(self.imgToAnns[imgId] for imgId in imgIds if imgId in self.imgToAnns))
             else:
                 anns = self.anns.keys()
-            anns = anns if len(catIds)  == 0 else list(set(anns).intersection(set(self.getAnnByCat(catIds)))) 
+            anns = anns if len(catIds)  == 0 else list(set(anns).intersection(self.getAnnSetByCat(catIds)))
             anns = anns if len(areaRng) == 0 else [ann for ann in anns if self.anns[ann]['area'] > areaRng[0] and self.anns[ann]['area'] < areaRng[1]]
         return anns
 
@@ -140,7 +246,7 @@ class COCO_Text:
         else:
             ids = set(imgIds)
             if not len(catIds) == 0:
-                ids  = ids.intersection(set([self.anns[annid]['image_id'] for annid in self.getAnnByCat(catIds)]))
+                ids  = ids.intersection(self.getImgSetByCat(catIds))
         return list(ids)
 
     def loadAnns(self, ids=[]):
@@ -154,6 +260,15 @@ class COCO_Text:
         elif type(ids) == int:
             return [self.anns[ids]]
 
+    def columns(self):
+        """
+        Columnar NumPy view of the annotations, built on first use.
+        :return: columns (COCO_TextColumns) : vectorized annotation store
+        """
+        if self.columnar is None:
+            self.columnar = COCO_TextColumns(self.anns, self.imgToAnns)
+        return self.columnar
+
     def loadImgs(self, ids=[]):
         """
         Load anns with the specified ids.
@@ -173,6 +288,11 @@ class COCO_Text:
         """
         if len(anns) == 0:
             return 0
+        # Plotting imports are deferred so loading annotations does not pay for matplotlib
+        import matplotlib.pyplot as plt
+        from matplotlib.collections import PatchCollection
+        from matplotlib.patches import Rectangle, PathPatch
+        from matplotlib.path import Path
         ax = plt.gca()
         boxes = []
         color = []
@@ -234,3 +354,92 @@ class COCO_Text:
 
         return res
 
+
+class COCO_TextColumns:
+    # Categorical annotation properties stored as integer codes
+    CAT_TYPES = ('legibility', 'class', 'language')
+
+    def __init__(self, anns, imgToAnns):
+        """
+        Columnar store of COCO-Text annotations with vectorized filters.
+        :param anns (dict)      : ann id -> ann, as COCO_Text.anns
+        :param imgToAnns (dict) : img id -> ann ids, as COCO_Text.imgToAnns
+        :return:
+        """
+        annList = list(anns.values())
+        self.annIds = np.array(list(anns.keys()), dtype=np.int64)
+        self.imageIds = np.array([ann['image_id'] for ann in annList], dtype=np.int64)
+        self.bboxes = np.array([ann['bbox'] for ann in annList], dtype=np.float64).reshape(-1, 4)
+        self.areas = np.array([ann.get('area', 0) for ann in annList], dtype=np.float64)
+
+        # Each categorical column holds codes into self.categories[catType]; -1 where the property is missing
+        self.categories = {}
+        self.codes = {}
+        for catType in self.CAT_TYPES:
+            values = {}
+            codes = np.array([values.setdefault(ann[catType], len(values)) if catType in ann else -1
+                              for ann in annList], dtype=np.int16)
+            self.categories[catType] = list(values)
+            self.codes[catType] = codes
+
+        # Rows grouped by image in imgToAnns order: rows of image i are imgRows[imgStarts[i]:imgStarts[i+1]]
+        rowOf = {annId: row for row, annId in enumerate(self.annIds.tolist())}
+        self.imgIndex = {}
+        rows = []
+        for imgId, imgAnnIds in imgToAnns.items():
+            self.imgIndex[imgId] = (len(rows), len(rows) + len(imgAnnIds))
+            rows.extend(rowOf[annId] for annId in imgAnnIds)
+        self.imgRows = np.array(rows, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.annIds)
+
+    def catMask(self, catIds):
+        """
+        Boolean mask of anns satisfying all (category type, category) tuples.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for catType, cat in catIds:
+            if catType not in self.codes or cat not in self.categories[catType]:
+                return np.zeros(len(self), dtype=bool)
+            mask &= self.codes[catType] == self.categories[catType].index(cat)
+        return mask
+
+    def mask(self, imgIds=[], catIds=[], areaRng=[]):
+        """
+        Boolean mask of anns that satisfy given filter conditions, with the same semantics as COCO_Text.getAnnIds.
+        """
+        imgIds = imgIds if type(imgIds) == list else [imgIds]
+        catIds = catIds if type(catIds) == list else [catIds]
+        mask = self.catMask(catIds)
+        if len(imgIds) > 0:
+            mask &= np.isin(self.imageIds, np.array(imgIds, dtype=np.int64))
+        if len(areaRng) > 0:
+            mask &= (self.areas > areaRng[0]) & (self.areas < areaRng[1])
+        return mask
+
+    def getAnnIds(self, imgIds=[], catIds=[], areaRng=[]):
+        """
+        Ann ids that satisfy given filter conditions, as an int array in ann order.
+        """
+        return self.annIds[self.mask(imgIds, catIds, areaRng)]
+
+    def getImgIds(self, imgIds=[], catIds=[], areaRng=[]):
+        """
+        Sorted unique img ids that have at least one ann satisfying the given filter conditions.
+        """
+        return np.unique(self.imageIds[self.mask(imgIds, catIds, areaRng)])
+
+    def annRows(self, imgId):
+        """
+        Row indices of the anns of one image, in imgToAnns order.
+        """
+        start, end = self.imgIndex.get(imgId, (0, 0))
+        return self.imgRows[start:end]
+
+    def imgBboxes(self, imgId):
+        """
+        Nx4 [x,y,width,height] boxes of the anns of one image, in imgToAnns order.
+        """
+        return self.bboxes[self.annRows(imgId)]
+
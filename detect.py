@@ -0,0 +1,541 @@
+import os
+import re
+import sys
+import json
+import time
+from glob import glob
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+import numpy as np
+from global_config import ONE_IMAGE_SIZE, INPUT_HEIGHT, INPUT_WIDTH, USE_GRAYSCALE
+
+# Exported by object_detection/export_inference_graph.py, see readme step 7
+DEFAULT_GRAPH = "/prog/models/exported/frozen_inference_graph.pb"
+DEFAULT_LABELS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "object-detection.pbtxt")
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Standard inputs and outputs of an exported object detection graph
+INPUT_TENSOR = 'image_tensor:0'
+OUTPUT_TENSORS = ('detection_boxes:0', 'detection_scores:0', 'detection_classes:0', 'num_detections:0')
+
+
+class DetectionEngine:
+    """
+    Frozen detection graph loaded once into a resident session. Tensors are looked up once at load time, so each
+    call is a single session run on a whole batch.
+    :param graph_path (str)    : frozen_inference_graph.pb
+    :param cpu_only (bool)     : hide GPUs from the session
+    :param num_threads (int)   : intra/inter op threads; None lets TensorFlow decide
+    """
+    def __init__(self, graph_path=DEFAULT_GRAPH, cpu_only=False, num_threads=None):
+        # TensorFlow is only needed by the engine itself; image loading and output helpers stay importable without it
+        import tensorflow as tf
+        if hasattr(tf, 'compat') and hasattr(tf.compat, 'v1'):
+            tf = tf.compat.v1
+
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            graph_def = tf.GraphDef()
+            with tf.gfile.GFile(graph_path, 'rb') as fid:
+                graph_def.ParseFromString(fid.read())
+            tf.import_graph_def(graph_def, name='')
+
+        config = tf.ConfigProto(device_count={'GPU': 0} if cpu_only else {})
+        if num_threads is not None:
+            config.intra_op_parallelism_threads = num_threads
+            config.inter_op_parallelism_threads = num_threads
+        self.session = tf.Session(graph=self.graph, config=config)
+
+        self.image_tensor = self.graph.get_tensor_by_name(INPUT_TENSOR)
+        self.output_tensors = [self.graph.get_tensor_by_name(name) for name in OUTPUT_TENSORS]
+
+    def detect(self, images):
+        """
+        Run one batch. All images must have the same shape.
+        :param images (list or ndarray) : HxWx3 uint8 RGB images, or an NxHxWx3 array
+        :return: list of (boxes, scores, classes) per image; boxes are normalized [ymin, xmin, ymax, xmax]
+        """
+        batch = images if isinstance(images, np.ndarray) else np.stack(images)
+        boxes, scores, classes, num_detections = self.session.run(self.output_tensors,
+                                                                  feed_dict={self.image_tensor: batch})
+        results = []
+        for i in range(len(batch)):
+            n = int(num_detections[i])
+            results.append((boxes[i, :n], scores[i, :n], classes[i, :n].astype(np.int64)))
+        return results
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def load_label_map(label_map_path=DEFAULT_LABELS):
+    """
+    Class names from a label map such as data/object-detection.pbtxt, without the object detection protos.
+    :return: labels (dict) : class id -> name (display_name when given)
+    """
+    with open(label_map_path, 'r') as f:
+        text = f.read()
+    labels = {}
+    for item in re.findall(r'item\s*\{([^}]*)\}', text):
+        class_id = re.search(r'\bid\s*:\s*(\d+)', item)
+        name = re.search(r'\bdisplay_name\s*:\s*[\'"]([^\'"]*)[\'"]', item) or \
+            re.search(r'\bname\s*:\s*[\'"]([^\'"]*)[\'"]', item)
+        if class_id is not None and name is not None:
+            labels[int(class_id.group(1))] = name.group(1)
+    return labels
+
+
+def list_images(inputs):
+    # Expand files, folders and glob patterns into a sorted list of image files
+    image_paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            image_paths.extend(sorted(os.path.join(item, name) for name in os.listdir(item)
+                                      if name.lower().endswith(IMAGE_EXTENSIONS)))
+        elif os.path.isfile(item):
+            image_paths.append(item)
+        else:
+            image_paths.extend(sorted(glob(item)))
+    return image_paths
+
+
+def to_model_input(image, resize=True):
+    """
+    RGB uint8 array for the graph, converted straight from the decoded buffer without an intermediate Python list.
+    With ONE_IMAGE_SIZE and resize the image is resized to INPUT_WIDTH x INPUT_HEIGHT; normalized boxes are
+    unaffected. Tiled inference keeps full resolution (resize=False).
+    """
+    if USE_GRAYSCALE:
+        image = image.convert('L').convert('RGB')
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+    if resize and ONE_IMAGE_SIZE and image.size != (INPUT_WIDTH, INPUT_HEIGHT):
+        image = image.resize((INPUT_WIDTH, INPUT_HEIGHT), Image.BILINEAR)
+    return np.asarray(image)
+
+
+def load_image(image_path, resize=True):
+    """
+    Decode one image for the detector. Safe to call from worker threads; PIL releases the GIL while decoding.
+    :return: (image_path, original (width, height), HxWx3 uint8 array), or (image_path, None, None) if unreadable
+    """
+    try:
+        with Image.open(image_path) as image:
+            size = image.size
+            return image_path, size, to_model_input(image, resize)
+    except Image.DecompressionBombError as error:
+        print("Skipping {0}: {1}".format(image_path, error), file=sys.stderr)
+        return image_path, None, None
+    except (IOError, OSError):
+        print("Could not read {0}; skipping".format(image_path), file=sys.stderr)
+        return image_path, None, None
+
+
+def load_full_image(image_path, max_pixels=None):
+    """
+    Decode one image at full resolution for tiled detection, kept as a PIL image so tiles are converted to model
+    input one at a time instead of converting the whole image at once. Grayscale JPEGs for USE_GRAYSCALE are decoded
+    straight to one channel. Images over max_pixels, or over Pillow's decompression bomb limit unless main lifted it,
+    are skipped.
+    :return: (image_path, (width, height), loaded PIL image), or (image_path, None, None) if unreadable or too big
+    """
+    try:
+        image = Image.open(image_path)
+    except Image.DecompressionBombError as error:
+        print("Skipping {0}: {1}".format(image_path, error), file=sys.stderr)
+        return image_path, None, None
+    except (IOError, OSError):
+        print("Could not read {0}; skipping".format(image_path), file=sys.stderr)
+        return image_path, None, None
+    try:
+        size = image.size
+        if max_pixels is not None and size[0] * size[1] > max_pixels:
+            print("Skipping {0}: {1}x{2} is over {3:.0f} megapixels".format(
+                image_path, size[0], size[1], max_pixels / 1e6), file=sys.stderr)
+            image.close()
+            return image_path, None, None
+        if USE_GRAYSCALE and image.format == 'JPEG':
+            image.draft('L', size)
+        image.load()
+        return image_path, size, image
+    except (IOError, OSError):
+        image.close()
+        print("Could not read {0}; skipping".format(image_path), file=sys.stderr)
+        return image_path, None, None
+
+
+def prefetch(function, items, executor, depth):
+    # Ordered map over a thread pool that keeps at most depth results in flight
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(function, item))
+        if len(pending) >= depth:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def size_batches(loaded, batch_size, max_pending=None):
+    """
+    Group decoded images into batches of equal shape, since a batch is fed as one array. Images wait in one bucket
+    per shape; a bucket is emitted when full, and when more than max_pending images are waiting the fullest bucket is
+    emitted early so memory stays bounded with many distinct sizes.
+    :param loaded (iterable) : (image_path, size, array) from load_image
+    :return: iterator of lists of (image_path, size, array)
+    """
+    if max_pending is None:
+        max_pending = 4 * batch_size
+    buckets = OrderedDict()
+    pending = 0
+    for item in loaded:
+        if item[2] is None:
+            continue
+        bucket = buckets.setdefault(item[2].shape, [])
+        bucket.append(item)
+        pending += 1
+        if len(bucket) >= batch_size:
+            del buckets[item[2].shape]
+            pending -= len(bucket)
+            yield bucket
+        elif pending > max_pending:
+            shape = max(buckets, key=lambda key: len(buckets[key]))
+            pending -= len(buckets[shape])
+            yield buckets.pop(shape)
+    for bucket in buckets.values():
+        yield bucket
+
+
+def to_coco_results(image_id, size, detections, min_score=0.0):
+    """
+    Detections of one image in COCO results format, as read by evaluate_detections.load_detections.
+    :param size (tuple)       : (width, height) of the original image
+    :param detections (tuple) : (boxes, scores, classes) from DetectionEngine.detect
+    :return: list of {'image_id', 'category_id', 'bbox': [x,y,width,height] in pixels, 'score'}
+    """
+    boxes, scores, classes = detections
+    keep = scores >= min_score
+    width, height = size
+    pixels = boxes[keep] * np.array([height, width, height, width], dtype=np.float64)
+    return [{'image_id': image_id, 'category_id': int(category), 'score': round(float(score), 5),
+             'bbox': [round(float(xmin), 2), round(float(ymin), 2), round(float(xmax - xmin), 2),
+                      round(float(ymax - ymin), 2)]}
+            for (ymin, xmin, ymax, xmax), score, category in zip(pixels, scores[keep], classes[keep])]
+
+
+def detect_images(engine, image_paths, batch_size=4, num_threads=4, prefetch_depth=16, with_images=False):
+    """
+    Stream detections for many images. Decoding runs on a thread pool ahead of the detector, so the graph is fed
+    while the next images are still being read. Results come in batch order, which with mixed sizes is not the
+    input order.
+    :param with_images (bool) : also yield the decoded model input array, e.g. to crop detections from
+    :return: iterator of (image_path, (width, height), (boxes, scores, classes)[, image array])
+    """
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        loaded = prefetch(load_image, image_paths, executor, max(prefetch_depth, batch_size))
+        for batch in size_batches(loaded, batch_size):
+            results = engine.detect([array for _, _, array in batch])
+            for (image_path, size, array), detections in zip(batch, results):
+                if with_images:
+                    yield image_path, size, detections, array
+                else:
+                    yield image_path, size, detections
+
+
+def tile_offsets(length, tile, overlap):
+    # Evenly spaced tile starts along one axis; neighbours overlap by at least overlap and the last tile ends flush
+    if not 0 <= overlap < tile:
+        raise ValueError("Tile overlap must be at least 0 and less than the tile size, got {0} for {1}".format(
+            overlap, tile))
+    if length <= tile:
+        return [0]
+    count = int(np.ceil((length - tile) / float(tile - overlap))) + 1
+    return np.linspace(0, length - tile, count).round().astype(int).tolist()
+
+
+def tile_boxes(width, height, tile_width, tile_height, overlap, pad=False):
+    """
+    Crop boxes of overlapping tiles. Tiles are all the same shape and can be run as one batch: tile_width x
+    tile_height, or the image size along an axis where the image is smaller. With pad, such tiles keep the full tile
+    size and PIL fills the part outside the image with zeros (needed for ONE_IMAGE_SIZE models).
+    :return: list of (left, upper, right, lower) boxes for Image.crop
+    """
+    if not pad:
+        tile_width, tile_height = min(tile_width, width), min(tile_height, height)
+    return [(x, y, x + tile_width, y + tile_height)
+            for y in tile_offsets(height, tile_height, min(overlap, tile_height - 1))
+            for x in tile_offsets(width, tile_width, min(overlap, tile_width - 1))]
+
+
+def non_max_suppression(boxes, scores, classes, iou_threshold=0.5, containment_threshold=0.8, cut=None,
+                        line_threshold=0.7):
+    """
+    Greedy per-class NMS that also merges text lines cut by tile borders. Going down by score, each kept box drops
+    the boxes of its class that overlap it by more than iou_threshold IoU, and absorbs the others where more than
+    containment_threshold of the smaller of the two lies inside the other: the kept box grows to their union, so a
+    fragment scoring above the whole line still yields the whole line. Boxes flagged as cut by a tile border are also
+    joined with any box of their class they overlap and line up with, i.e. whose extent across the cut matches by
+    more than line_threshold IoU, so a line longer than the tile overlap is put back together from its pieces. A
+    grown box is compared with the remaining boxes again until nothing more merges. Each pass compares the kept box
+    with all remaining boxes at once.
+    :param boxes (ndarray) : Nx4 [xmin, ymin, xmax, ymax]
+    :param cut (ndarray)   : optional bool per box, True when it touches a tile border inside the image
+    :return: (boxes, scores, classes) of the kept boxes, highest score first
+    """
+    order = np.argsort(-scores, kind='stable')
+    boxes = boxes[order].astype(np.float64)
+    scores = scores[order]
+    classes = classes[order]
+    cut = np.zeros(len(order), dtype=bool) if cut is None else cut[order]
+    areas = np.maximum(boxes[:, 2] - boxes[:, 0], 0) * np.maximum(boxes[:, 3] - boxes[:, 1], 0)
+    suppressed = np.zeros(len(order), dtype=bool)
+    keep = []
+    for i in range(len(order)):
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        rest = boxes[i + 1:]
+        while True:
+            widths = np.minimum(boxes[i, 2], rest[:, 2]) - np.maximum(boxes[i, 0], rest[:, 0])
+            heights = np.minimum(boxes[i, 3], rest[:, 3]) - np.maximum(boxes[i, 1], rest[:, 1])
+            intersection = np.maximum(widths, 0) * np.maximum(heights, 0)
+            iou = intersection / np.maximum(areas[i] + areas[i + 1:] - intersection, 1e-9)
+            contained = intersection / np.maximum(np.minimum(areas[i], areas[i + 1:]), 1e-9)
+            # Extent IoU along each axis: a piece cut by a vertical border keeps its y range and vice versa
+            same_rows = heights / np.maximum(np.maximum(boxes[i, 3], rest[:, 3]) - np.minimum(boxes[i, 1], rest[:, 1]),
+                                             1e-9)
+            same_cols = widths / np.maximum(np.maximum(boxes[i, 2], rest[:, 2]) - np.minimum(boxes[i, 0], rest[:, 0]),
+                                            1e-9)
+            pieces = (cut[i] | cut[i + 1:]) & (intersection > 0) & ((same_rows > line_threshold) |
+                                                                     (same_cols > line_threshold))
+            candidates = (classes[i + 1:] == classes[i]) & ~suppressed[i + 1:]
+            duplicates = candidates & (iou > iou_threshold)
+            merged = candidates & ~duplicates & ((contained > containment_threshold) | pieces)
+            suppressed[i + 1:] |= duplicates | merged
+            if not merged.any():
+                break
+            boxes[i, :2] = np.minimum(boxes[i, :2], rest[merged, :2].min(axis=0))
+            boxes[i, 2:] = np.maximum(boxes[i, 2:], rest[merged, 2:].max(axis=0))
+            areas[i] = (boxes[i, 2] - boxes[i, 0]) * (boxes[i, 3] - boxes[i, 1])
+            cut[i] |= cut[i + 1:][merged].any()
+    return boxes[keep], scores[keep], classes[keep]
+
+
+def detect_tiled(engine, image, tile_width, tile_height, overlap=96, batch_size=4, iou_threshold=0.5,
+                 containment_threshold=0.8):
+    """
+    Detect on overlapping tiles of a full resolution image and merge the results. Tiles are sized so the model's
+    resizer leaves them at native scale, so small text keeps its pixels. Only batch_size tiles are converted to model
+    input and run at once, so apart from the decoded image itself, memory does not grow with the image.
+    :param image (PIL.Image) : decoded image, e.g. from load_full_image
+    :return: (boxes, scores, classes) for the whole image, boxes normalized [ymin, xmin, ymax, xmax] as from
+             DetectionEngine.detect
+    """
+    cols, rows = image.size
+    crops = tile_boxes(cols, rows, tile_width, tile_height, overlap, pad=ONE_IMAGE_SIZE)
+    all_boxes, all_scores, all_classes, all_cut = [], [], [], []
+    for start in range(0, len(crops), batch_size):
+        chunk = crops[start:start + batch_size]
+        tiles = [to_model_input(image.crop(crop), resize=False) for crop in chunk]
+        for (x, y, right, lower), tile, (boxes, scores, classes) in zip(chunk, tiles, engine.detect(tiles)):
+            tile_rows, tile_cols = tile.shape[:2]
+            # Tile normalized [ymin, xmin, ymax, xmax] -> image pixels [xmin, ymin, xmax, ymax]
+            pixels = np.minimum(boxes[:, [1, 0, 3, 2]] * np.array([tile_cols, tile_rows, tile_cols, tile_rows]) +
+                                np.array([x, y, x, y]), np.array([cols, rows, cols, rows]))
+            # Boxes reaching a tile edge that is not an image edge may be pieces of something larger
+            all_cut.append(((pixels[:, 0] <= x + 1) & (x > 0)) | ((pixels[:, 1] <= y + 1) & (y > 0)) |
+                           ((pixels[:, 2] >= right - 1) & (right < cols)) |
+                           ((pixels[:, 3] >= lower - 1) & (lower < rows)))
+            all_boxes.append(pixels)
+            all_scores.append(scores)
+            all_classes.append(classes)
+        del tiles
+
+    boxes = np.concatenate(all_boxes) if all_boxes else np.zeros((0, 4))
+    scores = np.concatenate(all_scores) if all_scores else np.zeros(0)
+    classes = np.concatenate(all_classes) if all_classes else np.zeros(0, dtype=np.int64)
+    cut = np.concatenate(all_cut) if all_cut else np.zeros(0, dtype=bool)
+    boxes, scores, classes = non_max_suppression(boxes, scores, classes, iou_threshold, containment_threshold, cut)
+    return boxes[:, [1, 0, 3, 2]] / np.array([rows, cols, rows, cols], dtype=np.float64), scores, classes
+
+
+def detect_images_tiled(engine, image_paths, tile_size, overlap=96, batch_size=4, max_pixels=None):
+    """
+    Tiled counterpart of detect_images. Images are decoded at full resolution one at a time, and each is closed
+    before the next is decoded, so at most one full image is held and peak memory is bounded by max_pixels (about
+    3 MB per megapixel) plus one batch of tiles. Images over max_pixels are skipped.
+    :param tile_size (tuple) : (width, height) of a tile
+    :return: iterator of (image_path, (width, height), (boxes, scores, classes)), in input order
+    """
+    tile_width, tile_height = tile_size
+    for image_path in image_paths:
+        image_path, size, image = load_full_image(image_path, max_pixels)
+        if image is None:
+            continue
+        with image:
+            detections = detect_tiled(engine, image, tile_width, tile_height, overlap, batch_size)
+        del image
+        yield image_path, size, detections
+
+
+def tile_size_for(pipeline_config):
+    """
+    Tile size at which the model's image_resizer keeps pixels at native scale: INPUT_WIDTH x INPUT_HEIGHT with
+    ONE_IMAGE_SIZE, otherwise max_dimension x min_dimension of the keep_aspect_ratio_resizer, whose scale factor
+    min_dimension / shorter side is then 1.
+    """
+    if ONE_IMAGE_SIZE:
+        return INPUT_WIDTH, INPUT_HEIGHT
+    from parse_activ import load_resizer_bounds
+    bounds = load_resizer_bounds(pipeline_config) if pipeline_config is not None else None
+    min_dimension, max_dimension = bounds if bounds is not None else (600, 1024)
+    return max_dimension, min_dimension
+
+
+def main(graph_path, inputs, output_file, batch_size=4, num_threads=4, prefetch_depth=16, min_score=0.05,
+         cpu_only=False, tiled=False, pipeline_config=None, tile_overlap=96, max_megapixels=200):
+
+    if tiled:
+        tile_size = tile_size_for(pipeline_config)
+        if not 0 <= tile_overlap < min(tile_size):
+            raise ValueError("Tile overlap must be at least 0 and less than the {0}x{1} tile, got {2}".format(
+                tile_size[0], tile_size[1], tile_overlap))
+        # Oversized images are what tiling is for; load_full_image applies max_megapixels instead
+        Image.MAX_IMAGE_PIXELS = None
+
+    image_paths = list_images(inputs)
+    print("Detecting text in {0} images".format(len(image_paths)), file=sys.stderr)
+
+    out = sys.stdout if output_file == '-' else open(output_file, 'w')
+    try:
+        with DetectionEngine(graph_path, cpu_only) as engine:
+            # The first run builds the graph's kernels; keep it out of the throughput figure
+            engine.detect([np.zeros((INPUT_HEIGHT, INPUT_WIDTH, 3), dtype=np.uint8)])
+
+            if tiled:
+                print("Tiling images into {0}x{1} tiles overlapping by {2} px".format(
+                    tile_size[0], tile_size[1], tile_overlap), file=sys.stderr)
+                # Full resolution images can be huge, so they are decoded one at a time with no prefetch
+                results = detect_images_tiled(engine, image_paths, tile_size, tile_overlap, batch_size,
+                                              max_megapixels * 1e6)
+            else:
+                results = detect_images(engine, image_paths, batch_size, num_threads, prefetch_depth)
+
+            start = time.time()
+            counter = 0
+            megapixels = 0.0
+            for image_path, size, detections in results:
+                for result in to_coco_results(image_path, size, detections, min_score):
+                    out.write(json.dumps(result) + "\n")
+                counter += 1
+                megapixels += size[0] * size[1] / 1e6
+                if counter % 100 == 0:
+                    print("\t{0} images, {1:.2f} images/sec".format(counter, counter / (time.time() - start)),
+                          file=sys.stderr)
+            elapsed = time.time() - start
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print("Detected {0} images ({1:.1f} megapixels) in {2:.1f} s ({3:.2f} images/sec, {4:.2f} megapixels/sec)".format(
+        counter, megapixels, elapsed, counter / elapsed if elapsed > 0 else 0.0,
+        megapixels / elapsed if elapsed > 0 else 0.0), file=sys.stderr)
+
+
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Detect Arabic and English text with an exported frozen graph')
+
+    parser.add_argument(
+        'inputs',
+        type=str,
+        nargs='+',
+        help='Image files, folders of images or glob patterns')
+
+    parser.add_argument(
+        '--graph',
+        type=str,
+        default=DEFAULT_GRAPH,
+        help='Exported frozen graph. Default = /prog/models/exported/frozen_inference_graph.pb')
+
+    parser.add_argument(
+        '--output',
+        type=str,
+        default='detections.jsonl',
+        help='JSON lines output in COCO results format, or - for stdout. Default = detections.jsonl')
+
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=4,
+        help='Images per session run; batches only hold images of the same size. Default = 4')
+
+    parser.add_argument(
+        '--num_threads',
+        type=int,
+        default=4,
+        help='Number of image decoding threads. Default = 4')
+
+    parser.add_argument(
+        '--prefetch',
+        type=int,
+        default=16,
+        help='Number of images decoded ahead of the detector; --tile decodes one image at a time. Default = 16')
+
+    parser.add_argument(
+        '--min_score',
+        type=float,
+        default=0.05,
+        help='Drop detections scoring below this. Default = 0.05')
+
+    parser.add_argument(
+        '--cpu_only',
+        default=False,
+        action='store_true',
+        help='Run the graph on CPU even if a GPU is available. Default = False')
+
+    parser.add_argument(
+        '--tile',
+        default=False,
+        action='store_true',
+        help='Detect on overlapping full resolution tiles sized to the model resizer, for HD and oversized images. \
+             --batch_size then counts tiles. Default = False')
+
+    parser.add_argument(
+        '--pipeline_config',
+        type=str,
+        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "model",
+                             "faster_rcnn_resnet50_coco.config"),
+        help='Model pipeline config whose keep_aspect_ratio_resizer sets the tile size with --tile. \
+             Default = models/model/faster_rcnn_resnet50_coco.config')
+
+    parser.add_argument(
+        '--tile_overlap',
+        type=int,
+        default=96,
+        help='Minimum overlap between neighbouring tiles in pixels; text shorter than this is always seen whole by \
+             some tile. Must be less than the tile size. Default = 96')
+
+    parser.add_argument(
+        '--max_megapixels',
+        type=float,
+        default=200,
+        help='With --tile, skip images larger than this instead of Pillow\'s default decompression bomb limit. \
+             Tiled mode holds one decoded image at a time at 3 MB per megapixel, so peak memory is about 3 MB x \
+             this (600 MB at the default) plus one batch of tiles. Default = 200')
+
+    args = parser.parse_args()
+    if args.tile:
+        tile_size = tile_size_for(args.pipeline_config)
+        if not 0 <= args.tile_overlap < min(tile_size):
+            parser.error("--tile_overlap must be at least 0 and less than the {0}x{1} tile".format(*tile_size))
+    main(args.graph, args.inputs, args.output, args.batch_size, args.num_threads, args.prefetch, args.min_score,
+         args.cpu_only, args.tile, args.pipeline_config, args.tile_overlap, args.max_megapixels)
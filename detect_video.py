@@ -0,0 +1,441 @@
+import os
+import re
+import sys
+import json
+import time
+import queue
+import threading
+import numpy as np
+from global_config import ONE_IMAGE_SIZE, INPUT_HEIGHT, INPUT_WIDTH, USE_GRAYSCALE
+from detect import DetectionEngine, DEFAULT_GRAPH, IMAGE_EXTENSIONS, list_images, to_coco_results
+
+
+def frame_number(path):
+    # Last number in the file name, e.g. 11 for France24_vd01_frame_11.png
+    numbers = re.findall(r'\d+', os.path.basename(path))
+    return int(numbers[-1]) if numbers else -1
+
+
+def read_video(video_path):
+    # (frame id, BGR frame) for every frame of a video file; ids follow the AcTiV <source>_frame_<n> naming
+    import cv2
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise IOError("Could not open {0}".format(video_path))
+    stem = os.path.splitext(os.path.basename(video_path))[0]
+    counter = 0
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                return
+            yield "{0}_frame_{1}".format(stem, counter), frame
+            counter += 1
+    finally:
+        capture.release()
+
+
+def read_frame_sequence(inputs):
+    # (image path, BGR frame) for a folder, glob or list of frame images, ordered by frame number
+    import cv2
+    for image_path in sorted(list_images(inputs), key=lambda path: (frame_number(path), path)):
+        frame = cv2.imread(image_path)
+        if frame is None:
+            print("Could not read {0}; skipping".format(image_path), file=sys.stderr)
+            continue
+        yield image_path, frame
+
+
+def background_reader(frames, depth=8):
+    """
+    Run a frame generator on its own thread, at most depth frames ahead. OpenCV releases the GIL while decoding, so
+    decoding overlaps with detection.
+    """
+    buffered = queue.Queue(maxsize=depth)
+    done = object()
+
+    def produce():
+        try:
+            for item in frames:
+                buffered.put(item)
+        except Exception as error:
+            buffered.put(error)
+        buffered.put(done)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        item = buffered.get()
+        if item is done:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+def frame_to_model_input(frame):
+    # BGR frame from OpenCV -> RGB uint8 array for the graph, following the same settings as detect.to_model_input
+    import cv2
+    if USE_GRAYSCALE:
+        image = cv2.cvtColor(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), cv2.COLOR_GRAY2RGB)
+    else:
+        image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    if ONE_IMAGE_SIZE and image.shape[:2] != (INPUT_HEIGHT, INPUT_WIDTH):
+        image = cv2.resize(image, (INPUT_WIDTH, INPUT_HEIGHT), interpolation=cv2.INTER_LINEAR)
+    return image
+
+
+def merge_rectangles(rectangles):
+    # Union overlapping or touching [y0, x0, y1, x1] rectangles until none overlap
+    merged = [list(rectangle) for rectangle in rectangles]
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(merged)):
+            for j in range(len(merged) - 1, i, -1):
+                a, b = merged[i], merged[j]
+                if a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]:
+                    merged[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del merged[j]
+                    changed = True
+    return merged
+
+
+class ChangeDetector:
+    """
+    Decides which parts of a frame need a fresh detection. The pixels inside the current text boxes are watched
+    closely and the rest of the frame coarsely: the picture around and behind captions and tickers changes on almost
+    every frame and does not matter unless new text appears in it. The frame is divided into a grid_rows x grid_cols
+    grid, and each watched box is summarized by the mean gray level of its pixels in every cell it covers (read from
+    one integral image per frame). A box is marked when its summary moved by more than threshold gray levels in any
+    cell since it was detected, or when the mean of a cell within one cell of it moved by more than the higher
+    background_threshold since then, e.g. a caption getting longer. plan() returns the cells of the marked boxes,
+    widened by one cell, as the regions to detect again; every other box is carried over. A cell further away whose
+    mean jumped by more than background_threshold since the previous frame means new text such as a caption or
+    ticker appearing, and the whole frame is detected. It is also detected on the first frame, when the frame size
+    changes, when the regions would cover more than max_region_fraction of the frame, and after max_reuse frames
+    without a full detection.
+    :param grid_rows (int), grid_cols (int) : resolution of the change signal
+    :param threshold (float)                : mean gray level change within a cell of a box that counts as new
+                                              content
+    :param max_reuse (int)                  : most consecutive frames without a full detection
+    :param watch_score (float)              : boxes scoring at least this are watched for changes
+    :param max_region_fraction (float)      : region area, as a fraction of the frame, above which the whole frame
+                                              is detected instead
+    :param background_threshold (float)     : mean gray level change of a cell outside the watched boxes that
+                                              counts as new text
+    """
+    def __init__(self, grid_rows=18, grid_cols=32, threshold=4.0, max_reuse=50, watch_score=0.5,
+                 max_region_fraction=0.5, background_threshold=32.0):
+        self.grid_rows = grid_rows
+        self.grid_cols = grid_cols
+        self.threshold = threshold
+        self.max_reuse = max_reuse
+        self.watch_score = watch_score
+        self.max_region_fraction = max_region_fraction
+        self.background_threshold = background_threshold
+        self.shape = None
+        self.integral = None
+        # Summary of each current box and the cell means around it when it was detected, in the order of the boxes
+        # passed to plan
+        self.summaries = []
+        self.surroundings = []
+        self.planned = []
+        self.since_full = 0
+        # Mean gray level of every grid cell in the previous frame
+        self.means = None
+
+    def summary(self, box):
+        # Mean gray level of the box's pixels in each grid cell it covers
+        rows, cols = self.shape[:2]
+        y0, x0 = int(max(np.floor(box[0]), 0)), int(max(np.floor(box[1]), 0))
+        y1, x1 = int(min(np.ceil(box[2]), rows)), int(min(np.ceil(box[3]), cols))
+        if y1 <= y0 or x1 <= x0:
+            return np.zeros((0, 0))
+        row_edges = np.unique(np.clip(np.arange(self.grid_rows + 1) * rows // self.grid_rows, y0, y1))
+        col_edges = np.unique(np.clip(np.arange(self.grid_cols + 1) * cols // self.grid_cols, x0, x1))
+        corners = self.integral[row_edges][:, col_edges]
+        sums = corners[1:, 1:] - corners[:-1, 1:] - corners[1:, :-1] + corners[:-1, :-1]
+        return sums / np.outer(np.diff(row_edges), np.diff(col_edges))
+
+    def box_cells(self, boxes, shape, margin=1):
+        # [row0, col0, row1, col1) grid cells under each [ymin, xmin, ymax, xmax] pixel box, widened by margin cells
+        rows, cols = shape[:2]
+        scale = np.array([self.grid_rows / float(rows), self.grid_cols / float(cols)] * 2)
+        cells = boxes * scale
+        starts = np.floor(cells[:, :2]).astype(np.int64) - margin
+        ends = np.ceil(cells[:, 2:]).astype(np.int64) + margin
+        return np.concatenate([np.maximum(starts, 0), np.minimum(ends, [self.grid_rows, self.grid_cols])], axis=1)
+
+    def cells_to_pixels(self, cells, shape):
+        # Pixel rectangle [y0, x0, y1, x1] covering a [row0, col0, row1, col1) cell rectangle
+        rows, cols = shape[:2]
+        row0, col0, row1, col1 = cells
+        return [row0 * rows // self.grid_rows, col0 * cols // self.grid_cols,
+                -(-row1 * rows // self.grid_rows), -(-col1 * cols // self.grid_cols)]
+
+    def plan(self, frame, boxes, scores):
+        """
+        :param boxes (ndarray)  : current Nx4 [ymin, xmin, ymax, xmax] pixel boxes, as carried into this frame
+        :param scores (ndarray) : their scores
+        :return: None to detect the whole frame, otherwise a list of pixel rectangles [y0, x0, y1, x1] to detect
+                 again (empty when every box can be reused)
+        """
+        import cv2
+        reference_shape = self.shape
+        self.shape = frame.shape
+        self.integral = cv2.integral(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), sdepth=cv2.CV_64F)
+        previous_means, self.means = self.means, self.summary([0, 0, frame.shape[0], frame.shape[1]])
+        self.planned = []
+        self.since_full += 1
+        if reference_shape is None or frame.shape != reference_shape or self.since_full > self.max_reuse:
+            return None
+
+        # New text away from the watched boxes and the cells next to them, which only a full detection finds
+        watched = np.flatnonzero(scores >= self.watch_score)
+        cells = self.box_cells(boxes[watched], frame.shape)
+        background = np.abs(self.means - previous_means) > self.background_threshold
+        for row0, col0, row1, col1 in cells:
+            background[row0:row1, col0:col1] = False
+        if background.any():
+            return None
+
+        # Changed text in a box, or text growing out of it into the cells around it
+        marked = [i for i, (row0, col0, row1, col1) in zip(watched, cells)
+                  if np.abs(self.summary(boxes[i]) - self.summaries[i]).max(initial=0) > self.threshold or
+                  np.abs(self.means[row0:row1, col0:col1] - self.surroundings[i]).max(initial=0) >
+                  self.background_threshold]
+        regions = merge_rectangles(self.box_cells(boxes[marked], frame.shape).tolist())
+        area = sum((row1 - row0) * (col1 - col0) for row0, col0, row1, col1 in regions)
+        if area > self.max_region_fraction * self.grid_rows * self.grid_cols:
+            return None
+        self.planned = regions
+        return [self.cells_to_pixels(cells, frame.shape) for cells in regions]
+
+    def extend(self, frame, fresh_boxes):
+        """
+        Grow the planned regions to cover the boxes just found in them plus one cell, e.g. a caption that got
+        longer and was cut by the region's edge.
+        :return: the grown pixel regions, or None when every box already fits
+        """
+        grown = merge_rectangles(self.planned + self.box_cells(fresh_boxes, frame.shape).tolist())
+        if sorted(grown) == sorted(self.planned):
+            return None
+        self.planned = grown
+        return [self.cells_to_pixels(cells, frame.shape) for cells in grown]
+
+    def update(self, kept, fresh_boxes, full=False):
+        """
+        Record the boxes that follow the frame last planned: the carried over boxes selected by kept keep their
+        summaries and surroundings, and the fresh boxes, appended after them, are summarized from this frame.
+        :param kept (ndarray) : bool per box passed to plan
+        :param full (bool)    : the whole frame was detected
+        """
+        if full:
+            self.since_full = 0
+        self.summaries = [summary for summary, keep in zip(self.summaries, kept) if keep] + \
+            [self.summary(box) for box in fresh_boxes]
+        self.surroundings = [surrounding for surrounding, keep in zip(self.surroundings, kept) if keep] + \
+            [self.means[row0:row1, col0:col1].copy()
+             for row0, col0, row1, col1 in self.box_cells(fresh_boxes, self.shape)]
+
+
+def detect_regions(engine, frame, regions):
+    # Detect on crops of the frame; crops of one shape share a session run. Boxes come back in frame pixels
+    crops = {}
+    for y0, x0, y1, x1 in regions:
+        crops.setdefault((y1 - y0, x1 - x0), []).append((y0, x0))
+    all_boxes, all_scores, all_classes = [], [], []
+    for (height, width), origins in crops.items():
+        images = [frame_to_model_input(np.ascontiguousarray(frame[y0:y0 + height, x0:x0 + width]))
+                  for y0, x0 in origins]
+        for (y0, x0), (boxes, scores, classes) in zip(origins, engine.detect(images)):
+            all_boxes.append(boxes * np.array([height, width, height, width]) + np.array([y0, x0, y0, x0]))
+            all_scores.append(scores)
+            all_classes.append(classes)
+    return (np.concatenate(all_boxes) if all_boxes else np.zeros((0, 4)),
+            np.concatenate(all_scores) if all_scores else np.zeros(0),
+            np.concatenate(all_classes) if all_classes else np.zeros(0, dtype=np.int64))
+
+
+def detect_frames(engine, frames, change_detector, max_grow=2):
+    """
+    Detections for a frame stream, re-running the detector only where text regions changed. Boxes whose pixels did
+    not change are carried over from the previous frame; changed regions are detected again on crops, grown while
+    boxes reach their edges, and their boxes replace the old ones whose centers fall inside them. When boxes still
+    reach the edges after max_grow steps, the whole frame is detected rather than keeping boxes cut short. Frames
+    are processed in order, since each plan depends on the boxes of the frame before.
+    :param frames (iterable) : (frame id, BGR frame)
+    :return: iterator of (frame id, (width, height), (boxes, scores, classes), fresh, regions) with boxes normalized
+             [ymin, xmin, ymax, xmax] as from DetectionEngine.detect, fresh a bool per box that is True when it
+             was detected in this frame, and regions None for a full detection or the list of re-detected pixel
+             rectangles
+    """
+    boxes = np.zeros((0, 4))
+    scores = np.zeros(0)
+    classes = np.zeros(0, dtype=np.int64)
+    fresh = np.zeros(0, dtype=bool)
+
+    for frame_id, frame in frames:
+        rows, cols = frame.shape[:2]
+        regions = change_detector.plan(frame, boxes, scores)
+        if regions is not None and len(regions) > 0:
+            new_boxes, new_scores, new_classes = detect_regions(engine, frame, regions)
+            for grow in range(max_grow + 1):
+                grown = change_detector.extend(frame, new_boxes)
+                if grown is None:
+                    break
+                if grow == max_grow:
+                    # Still cut by a region edge, e.g. a caption longer than the grown region
+                    regions = None
+                    break
+                regions = grown
+                new_boxes, new_scores, new_classes = detect_regions(engine, frame, regions)
+
+        if regions is None:
+            normalized, scores, classes = engine.detect([frame_to_model_input(frame)])[0]
+            boxes = normalized * np.array([rows, cols, rows, cols], dtype=np.float64)
+            fresh = np.ones(len(scores), dtype=bool)
+            change_detector.update(np.zeros(0, dtype=bool), boxes, full=True)
+        elif len(regions) > 0:
+            centers = np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2], axis=1)
+            stale = np.zeros(len(boxes), dtype=bool)
+            for y0, x0, y1, x1 in regions:
+                stale |= ((centers[:, 0] >= y0) & (centers[:, 0] < y1) & (centers[:, 1] >= x0) &
+                          (centers[:, 1] < x1))
+            boxes = np.concatenate([boxes[~stale], new_boxes])
+            scores = np.concatenate([scores[~stale], new_scores])
+            classes = np.concatenate([classes[~stale], new_classes])
+            fresh = np.concatenate([np.zeros(int((~stale).sum()), dtype=bool), np.ones(len(new_scores), dtype=bool)])
+            change_detector.update(~stale, new_boxes)
+        else:
+            fresh = np.zeros(len(scores), dtype=bool)
+
+        normalized = boxes / np.array([rows, cols, rows, cols], dtype=np.float64)
+        yield frame_id, (cols, rows), (normalized, scores, classes), fresh, regions
+
+
+def main(graph_path, inputs, output_file, threshold=4.0, max_reuse=50, grid_rows=18, grid_cols=32, min_score=0.05,
+         watch_score=0.5, cpu_only=False, background_threshold=32.0):
+
+    # A single file that is not an image is a video; anything else is a frame sequence
+    if len(inputs) == 1 and os.path.isfile(inputs[0]) and not inputs[0].lower().endswith(IMAGE_EXTENSIONS):
+        frames = read_video(inputs[0])
+    else:
+        frames = read_frame_sequence(inputs)
+
+    change_detector = ChangeDetector(grid_rows, grid_cols, threshold, max_reuse, watch_score,
+                                     background_threshold=background_threshold)
+    out = sys.stdout if output_file == '-' else open(output_file, 'w')
+    try:
+        with DetectionEngine(graph_path, cpu_only) as engine:
+            # The first run builds the graph's kernels; keep it out of the throughput figure
+            engine.detect([np.zeros((INPUT_HEIGHT, INPUT_WIDTH, 3), dtype=np.uint8)])
+
+            start = time.time()
+            counter = 0
+            full_runs = 0
+            region_frames = 0
+            detected_pixels = 0
+            total_pixels = 0
+            for frame_id, size, detections, fresh, regions in detect_frames(engine, background_reader(frames),
+                                                                            change_detector):
+                results = to_coco_results(frame_id, size, detections, min_score)
+                for result, is_fresh in zip(results, fresh[detections[1] >= min_score]):
+                    result['reused'] = not bool(is_fresh)
+                    out.write(json.dumps(result) + "\n")
+                counter += 1
+                total_pixels += size[0] * size[1]
+                if regions is None:
+                    full_runs += 1
+                    detected_pixels += size[0] * size[1]
+                elif len(regions) > 0:
+                    region_frames += 1
+                    detected_pixels += sum((y1 - y0) * (x1 - x0) for y0, x0, y1, x1 in regions)
+            elapsed = time.time() - start
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    skipped = counter - full_runs - region_frames
+    print("{0} frames in {1:.1f} s ({2:.2f} FPS); detector ran on {3} full frames and regions of {4} more, "
+          "skipped {5} ({6:.1%}); {7:.1%} of all pixels were detected".format(
+              counter, elapsed, counter / elapsed if elapsed > 0 else 0.0, full_runs, region_frames, skipped,
+              skipped / float(counter) if counter > 0 else 0.0,
+              detected_pixels / float(total_pixels) if total_pixels > 0 else 0.0), file=sys.stderr)
+
+
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Detect text in a video or frame sequence, re-running the detector only where text regions change')
+
+    parser.add_argument(
+        'inputs',
+        type=str,
+        nargs='+',
+        help='A video file, or frame images as files, folders or glob patterns')
+
+    parser.add_argument(
+        '--graph',
+        type=str,
+        default=DEFAULT_GRAPH,
+        help='Exported frozen graph. Default = /prog/models/exported/frozen_inference_graph.pb')
+
+    parser.add_argument(
+        '--output',
+        type=str,
+        default='detections.jsonl',
+        help='JSON lines output in COCO results format plus a reused flag, or - for stdout. \
+             Default = detections.jsonl')
+
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=4.0,
+        help='Mean gray level change of a grid cell around a text box that triggers a new detection of that \
+             region. Default = 4')
+
+    parser.add_argument(
+        '--max_reuse',
+        type=int,
+        default=50,
+        help='Most consecutive frames without a full frame detection. Default = 50')
+
+    parser.add_argument(
+        '--background_threshold',
+        type=float,
+        default=32.0,
+        help='Mean gray level change of a grid cell outside the current text boxes that counts as new text: next to \
+             a box it triggers a new detection of that region, further away (since the previous frame) a full frame \
+             detection. Default = 32')
+
+    parser.add_argument(
+        '--grid',
+        type=int,
+        nargs=2,
+        default=[18, 32],
+        help='Rows and columns of the change detection grid. Default = 18 32')
+
+    parser.add_argument(
+        '--min_score',
+        type=float,
+        default=0.05,
+        help='Drop detections scoring below this. Default = 0.05')
+
+    parser.add_argument(
+        '--watch_score',
+        type=float,
+        default=0.5,
+        help='Boxes scoring at least this are watched for changes. Default = 0.5')
+
+    parser.add_argument(
+        '--cpu_only',
+        default=False,
+        action='store_true',
+        help='Run the graph on CPU even if a GPU is available. Default = False')
+
+    args = parser.parse_args()
+    main(args.graph, args.inputs, args.output, args.threshold, args.max_reuse, args.grid[0], args.grid[1],
+         args.min_score, args.watch_score, args.cpu_only, args.background_threshold)
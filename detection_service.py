@@ -0,0 +1,438 @@
+import io
+import sys
+import json
+import time
+import queue
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from PIL import Image
+import numpy as np
+from detect import DetectionEngine, DEFAULT_GRAPH, DEFAULT_LABELS, load_label_map, to_model_input
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket catches everything slower
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class LatencyHistogram:
+    """
+    Thread safe fixed bucket histogram of request latencies in milliseconds.
+    """
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = np.array(bounds, dtype=np.float64)
+        self.counts = np.zeros(len(bounds) + 1, dtype=np.int64)
+        self.total_ms = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, latency_ms):
+        with self.lock:
+            self.counts[np.searchsorted(self.bounds, latency_ms, side='left')] += 1
+            self.total_ms += latency_ms
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q quantile
+        count = int(self.counts.sum())
+        if count == 0:
+            return None
+        bucket = int(np.searchsorted(np.cumsum(self.counts), q * count, side='left'))
+        # None when it falls in the overflow bucket; json has no infinity
+        return float(self.bounds[bucket]) if bucket < len(self.bounds) else None
+
+    def snapshot(self):
+        with self.lock:
+            count = int(self.counts.sum())
+            return {'count': count,
+                    'mean_ms': self.total_ms / count if count > 0 else None,
+                    'p50_ms': self.quantile(0.5), 'p90_ms': self.quantile(0.9), 'p99_ms': self.quantile(0.99),
+                    'buckets': [{'le_ms': bound, 'count': int(count)}
+                                for bound, count in zip(self.bounds.tolist() + [None], self.counts)]}
+
+
+class DetectionTimeout(Exception):
+    pass
+
+
+class PendingRequest:
+    __slots__ = ('image', 'done', 'result', 'error', 'abandoned')
+
+    def __init__(self, image):
+        self.image = image
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.abandoned = False
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent detection requests into batches for one resident DetectionEngine. A batch is run once it
+    holds max_batch_size requests or its first request has waited max_delay seconds, whichever comes first. Requests
+    of different image sizes in one batch are run as one session call per size. The queue is bounded; submit raises
+    queue.Full when it is, so callers can shed load instead of queueing without limit, and DetectionTimeout when a
+    result takes longer than timeout, so a stalled batch worker cannot hold request threads forever.
+    :param engine (DetectionEngine) : resident detector
+    :param max_batch_size (int)     : most requests per batch
+    :param max_delay (float)        : longest time in seconds a request waits for others to join its batch
+    :param max_queue (int)          : most requests waiting for a batch
+    :param timeout (float)          : longest time in seconds submit waits for a result
+    """
+    def __init__(self, engine, max_batch_size=8, max_delay=0.01, max_queue=64, timeout=30.0):
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.batch_sizes = np.zeros(max_batch_size + 1, dtype=np.int64)
+        self.max_queue_depth = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, image):
+        """
+        Detect one image, blocking until its batch has run.
+        :param image (ndarray) : HxWx3 uint8 RGB image
+        :return: (boxes, scores, classes) as from DetectionEngine.detect
+        """
+        request = PendingRequest(image)
+        self.queue.put_nowait(request)
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        if not request.done.wait(self.timeout):
+            # The worker skips abandoned requests that have not been run yet
+            request.abandoned = True
+            raise DetectionTimeout("no result after {0:.1f} s".format(self.timeout))
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def next_batch(self):
+        batch = [self.queue.get()]
+        if batch[0] is None:
+            return None
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                # Finish this batch, then stop
+                self.queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            if batch is None:
+                return
+            self.batch_sizes[len(batch)] += 1
+
+            by_shape = {}
+            for request in batch:
+                if request.abandoned:
+                    request.image = None
+                    continue
+                by_shape.setdefault(request.image.shape, []).append(request)
+            for requests in by_shape.values():
+                try:
+                    results = self.engine.detect([request.image for request in requests])
+                    for request, result in zip(requests, results):
+                        request.result = result
+                except Exception as error:
+                    for request in requests:
+                        request.error = error
+                for request in requests:
+                    request.image = None
+                    request.done.set()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+
+class DetectionService(ThreadingHTTPServer):
+    """
+    HTTP front end. POST /detect with the raw bytes of a JPEG or PNG image as the body returns
+    {"width", "height", "detections": [{"class", "label", "score", "box": [xmin, ymin, xmax, ymax]}]} in pixels.
+    GET /metrics returns latency and batching statistics, GET /health returns 200 once the model is loaded.
+    """
+    daemon_threads = True
+    # The default listen backlog of 5 drops connections under concurrent load, costing clients a 1 s SYN retry
+    request_queue_size = 128
+
+    def __init__(self, address, batcher, labels, min_score=0.5, max_body_bytes=32 * 1024 * 1024):
+        super().__init__(address, DetectionRequestHandler)
+        self.batcher = batcher
+        self.labels = labels
+        self.min_score = min_score
+        self.max_body_bytes = max_body_bytes
+        self.latency = LatencyHistogram()
+        self.started = time.time()
+        self.counter_lock = threading.Lock()
+        self.requests = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def count(self, field):
+        with self.counter_lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def metrics(self):
+        batcher = self.batcher
+        return {'uptime_s': time.time() - self.started,
+                'requests': self.requests, 'rejected': self.rejected, 'timeouts': self.timeouts,
+                'errors': self.errors,
+                'queue_depth': batcher.queue.qsize(), 'max_queue_depth': batcher.max_queue_depth,
+                'queue_capacity': batcher.queue.maxsize,
+                'batch_sizes': {str(size): int(count) for size, count in enumerate(batcher.batch_sizes) if count > 0},
+                'latency': self.latency.snapshot()}
+
+
+class DetectionRequestHandler(BaseHTTPRequestHandler):
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self.send_json(200, self.server.metrics())
+        elif self.path == '/health':
+            self.send_json(200, {'status': 'ok'})
+        else:
+            self.send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/detect':
+            self.send_json(404, {'error': 'not found'})
+            return
+        start = time.monotonic()
+        service = self.server
+        service.count('requests')
+
+        # The declared length is checked before anything is read, so a client cannot make the server allocate more
+        # than max_body_bytes. A rejected body is never read, so the connection is closed after the reply
+        try:
+            length = int(self.headers.get('Content-Length', ''))
+        except ValueError:
+            length = -1
+        if length < 0:
+            service.count('errors')
+            self.close_connection = True
+            self.send_json(400, {'error': 'Content-Length header is missing or invalid'})
+            return
+        if length > service.max_body_bytes:
+            service.count('errors')
+            self.close_connection = True
+            self.send_json(413, {'error': 'body is larger than {0} bytes'.format(service.max_body_bytes)})
+            return
+
+        # Decoding happens on this request's thread, so concurrent uploads decode in parallel
+        try:
+            body = self.rfile.read(length)
+            with Image.open(io.BytesIO(body)) as image:
+                width, height = image.size
+                image_np = to_model_input(image)
+        except Image.DecompressionBombError:
+            service.count('errors')
+            self.send_json(413, {'error': 'image has more than {0} pixels'.format(2 * Image.MAX_IMAGE_PIXELS)})
+            return
+        except (IOError, OSError, ValueError):
+            service.count('errors')
+            self.send_json(400, {'error': 'body is not a readable image'})
+            return
+
+        try:
+            boxes, scores, classes = service.batcher.submit(image_np)
+        except queue.Full:
+            service.count('rejected')
+            self.send_json(503, {'error': 'detection queue is full'})
+            return
+        except DetectionTimeout as error:
+            service.count('timeouts')
+            self.send_json(503, {'error': 'detection timed out: {0}'.format(error)})
+            return
+        except Exception as error:
+            service.count('errors')
+            self.send_json(500, {'error': str(error)})
+            return
+
+        keep = scores >= service.min_score
+        pixels = boxes[keep] * np.array([height, width, height, width], dtype=np.float64)
+        detections = [{'class': int(category), 'label': service.labels.get(int(category), str(category)),
+                       'score': round(float(score), 5),
+                       'box': [round(float(xmin), 1), round(float(ymin), 1), round(float(xmax), 1),
+                               round(float(ymax), 1)]}
+                      for (ymin, xmin, ymax, xmax), score, category in zip(pixels, scores[keep], classes[keep])]
+        self.send_json(200, {'width': width, 'height': height, 'detections': detections})
+        service.latency.observe((time.monotonic() - start) * 1000.0)
+
+    def log_message(self, format, *args):
+        # Per request access logs would dominate under load; /metrics has the aggregate view
+        pass
+
+
+def load_test(url, image_paths, concurrency=8, num_requests=100):
+    """
+    Send num_requests uploads, cycling through image_paths, from concurrency client threads and print client side
+    latency percentiles and throughput. Uses only the standard library.
+    """
+    import urllib.request
+    from urllib.error import HTTPError
+    from concurrent.futures import ThreadPoolExecutor
+
+    bodies = []
+    for image_path in image_paths:
+        with open(image_path, 'rb') as f:
+            bodies.append(f.read())
+
+    def post(i):
+        request = urllib.request.Request(url.rstrip('/') + '/detect', data=bodies[i % len(bodies)],
+                                         headers={'Content-Type': 'application/octet-stream'})
+        start = time.monotonic()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                status = response.status
+        except HTTPError as error:
+            status = error.code
+        return status, (time.monotonic() - start) * 1000.0
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(post, range(num_requests)))
+    elapsed = time.time() - start
+
+    latencies = np.array([latency for status, latency in results if status == 200])
+    failures = sum(1 for status, _ in results if status != 200)
+    print("{0} requests in {1:.1f} s ({2:.2f} requests/sec), {3} failed".format(
+        num_requests, elapsed, num_requests / elapsed, failures))
+    if len(latencies) > 0:
+        print("Latency ms: p50 {0:.1f}, p90 {1:.1f}, p99 {2:.1f}, max {3:.1f}".format(
+            *np.percentile(latencies, [50, 90, 99, 100])))
+
+
+def main(graph_path, label_map_path, host, port, max_batch_size=8, max_delay_ms=10, max_queue=64, min_score=0.5,
+         cpu_only=False, request_timeout=30.0, max_body_bytes=32 * 1024 * 1024):
+
+    labels = load_label_map(label_map_path)
+    engine = DetectionEngine(graph_path, cpu_only)
+    batcher = MicroBatcher(engine, max_batch_size, max_delay_ms / 1000.0, max_queue, request_timeout)
+    service = DetectionService((host, port), batcher, labels, min_score, max_body_bytes)
+    print("Serving {0} on http://{1}:{2} (POST /detect, GET /metrics)".format(graph_path, host, port),
+          file=sys.stderr)
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.server_close()
+        batcher.close()
+        engine.close()
+
+
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='HTTP service for the Arabic/English detector with micro-batching')
+
+    parser.add_argument(
+        '--graph',
+        type=str,
+        default=DEFAULT_GRAPH,
+        help='Exported frozen graph. Default = /prog/models/exported/frozen_inference_graph.pb')
+
+    parser.add_argument(
+        '--labels',
+        type=str,
+        default=DEFAULT_LABELS,
+        help='Label map. Default = data/object-detection.pbtxt')
+
+    parser.add_argument(
+        '--host',
+        type=str,
+        default='127.0.0.1',
+        help='Address to listen on. Default = 127.0.0.1')
+
+    parser.add_argument(
+        '--port',
+        type=int,
+        default=8500,
+        help='Port to listen on. Default = 8500')
+
+    parser.add_argument(
+        '--max_batch_size',
+        type=int,
+        default=8,
+        help='Most requests run together in one batch. Default = 8')
+
+    parser.add_argument(
+        '--max_delay_ms',
+        type=float,
+        default=10,
+        help='Longest a request waits for others to join its batch, in milliseconds. Default = 10')
+
+    parser.add_argument(
+        '--max_queue',
+        type=int,
+        default=64,
+        help='Requests allowed to wait for a batch before new ones are rejected with 503. Default = 64')
+
+    parser.add_argument(
+        '--request_timeout',
+        type=float,
+        default=30.0,
+        help='Seconds a request waits for its detections before it gets a 503. Default = 30')
+
+    parser.add_argument(
+        '--max_body_bytes',
+        type=int,
+        default=32 * 1024 * 1024,
+        help='Largest upload accepted; larger bodies get 413 without being read. Default = 33554432 (32 MB)')
+
+    parser.add_argument(
+        '--min_score',
+        type=float,
+        default=0.5,
+        help='Drop detections scoring below this. Default = 0.5')
+
+    parser.add_argument(
+        '--cpu_only',
+        default=False,
+        action='store_true',
+        help='Run the graph on CPU even if a GPU is available. Default = False')
+
+    parser.add_argument(
+        '--load_test',
+        type=str,
+        nargs='+',
+        default=None,
+        help='Instead of serving, load test the service at --host/--port with these images')
+
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=8,
+        help='Client threads for --load_test. Default = 8')
+
+    parser.add_argument(
+        '--num_requests',
+        type=int,
+        default=100,
+        help='Requests sent by --load_test. Default = 100')
+
+    args = parser.parse_args()
+    if args.load_test is not None:
+        load_test("http://{0}:{1}".format(args.host, args.port), args.load_test, args.concurrency, args.num_requests)
+    else:
+        main(args.graph, args.labels, args.host, args.port, args.max_batch_size, args.max_delay_ms, args.max_queue,
+             args.min_score, args.cpu_only, args.request_timeout, args.max_body_bytes)
@@ -0,0 +1,337 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import http.client
+from os.path import join, isfile, isdir
+from base64 import b64encode
+from csv import DictReader
+from itertools import islice
+from random import random
+from urllib.parse import urlsplit, urljoin
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from get_md5 import HashCache, file_content_hashes
+
+# Open Images csv format
+FIELDNAMES = ['ImageID', 'Subset', 'OriginalURL', 'OriginalLandingURL', 'License', 'AuthorProfileURL', 'Author',
+              'Title', 'OriginalSize', 'OriginalMD5', 'Thumbnail300KURL']
+
+JOURNAL_FILENAME = "download_journal.jsonl"
+# Stored next to the download folder, e.g. AcTiV-D/Downloaded_md5_cache.json
+HASH_CACHE_SUFFIX = "_md5_cache.json"
+
+# Journal status values
+STATUS_OK = "ok"
+STATUS_BAD_HASH = "bad_hash"
+STATUS_MISSING = "missing"
+STATUS_FAILED = "failed"
+
+# Status codes that will not get better by retrying
+PERMANENT_HTTP_ERRORS = {400, 401, 403, 404, 410}
+MAX_REDIRECTS = 5
+CHUNK_SIZE = 1 << 20
+
+
+class DownloadError(Exception):
+    def __init__(self, message, permanent=False):
+        super().__init__(message)
+        self.permanent = permanent
+
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP(S) connections, one per host per worker thread.
+    """
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def get(self, scheme, netloc):
+        connections = self.local.__dict__.setdefault('connections', {})
+        key = (scheme, netloc)
+        if key not in connections:
+            if scheme == 'https':
+                connections[key] = http.client.HTTPSConnection(netloc, timeout=self.timeout)
+            else:
+                connections[key] = http.client.HTTPConnection(netloc, timeout=self.timeout)
+        return connections[key]
+
+    def discard(self, scheme, netloc):
+        connections = self.local.__dict__.setdefault('connections', {})
+        connection = connections.pop((scheme, netloc), None)
+        if connection is not None:
+            connection.close()
+
+
+class DownloadStats:
+    """
+    Thread-safe throughput and failure counters.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.counts = {'downloaded': 0, 'resumed': 0, 'verified': 0, 'bad_hash': 0, 'missing': 0, 'failed': 0,
+                       'retries': 0}
+        self.bytes = 0
+
+    def add(self, name, value=1):
+        with self.lock:
+            self.counts[name] += value
+
+    def add_bytes(self, value):
+        with self.lock:
+            self.bytes += value
+
+    def summary(self):
+        elapsed = max(time.time() - self.start_time, 1e-6)
+        with self.lock:
+            counts = dict(self.counts)
+            mb = self.bytes / float(1 << 20)
+        return "Downloaded {0} ({1:.1f} MB, {2:.2f} MB/s, {3:.1f} files/s), resumed {4}, verified {5}, " \
+               "bad hash {6}, missing {7}, failed {8}, retries {9}".format(
+                counts['downloaded'], mb, mb / elapsed, counts['downloaded'] / elapsed, counts['resumed'],
+                counts['verified'], counts['bad_hash'], counts['missing'], counts['failed'], counts['retries'])
+
+
+def load_journal(journal_path):
+    # Last entry for a url wins
+    journal = {}
+    if isfile(journal_path):
+        with open(journal_path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A run killed mid-write can leave a partial last line
+                    continue
+                journal[entry['url']] = entry
+    return journal
+
+
+def journal_entry_is_current(entry, file_name):
+    # A finished download is trusted as long as the file on disk has not been touched since
+    if entry is None or entry['status'] != STATUS_OK or not isfile(file_name):
+        return False
+    stat = os.stat(file_name)
+    return entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns
+
+
+def fetch(pool, url, file_name):
+    # Stream url into file_name, returning the base64 MD5 of the bytes written (same format as Open Images csv)
+    for _ in range(MAX_REDIRECTS + 1):
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        connection = pool.get(parts.scheme, parts.netloc)
+        try:
+            connection.request('GET', path, headers={'Connection': 'keep-alive'})
+            response = connection.getresponse()
+        except (http.client.HTTPException, OSError):
+            # Stale keep-alive connection or network error; drop it so the retry opens a fresh one
+            pool.discard(parts.scheme, parts.netloc)
+            raise
+
+        if response.status in (301, 302, 303, 307, 308):
+            response.read()
+            url = urljoin(url, response.getheader('Location'))
+            continue
+
+        if response.status != 200:
+            response.read()
+            raise DownloadError("HTTP {0} for {1}".format(response.status, url),
+                                permanent=response.status in PERMANENT_HTTP_ERRORS)
+
+        hasher = hashlib.md5()
+        partial_name = file_name + ".part"
+        try:
+            with open(partial_name, 'wb') as f:
+                buf = response.read(CHUNK_SIZE)
+                while len(buf) > 0:
+                    hasher.update(buf)
+                    f.write(buf)
+                    buf = response.read(CHUNK_SIZE)
+            # read(amt) returns short data instead of raising when the server hangs up early
+            if response.length:
+                raise http.client.IncompleteRead(b'', response.length)
+        except (http.client.HTTPException, OSError):
+            # Connection broke mid-body; it cannot be reused and the partial file is worthless
+            pool.discard(parts.scheme, parts.netloc)
+            if isfile(partial_name):
+                os.remove(partial_name)
+            raise
+        if response.will_close:
+            pool.discard(parts.scheme, parts.netloc)
+        os.replace(partial_name, file_name)
+        return b64encode(hasher.digest()).decode('ascii')
+
+    raise DownloadError("Too many redirects for {0}".format(url), permanent=True)
+
+
+def local_file_names(rows, downloaded_folder):
+    # URL basename, prefixed with the ImageID when another row already uses that basename, so concurrent downloads
+    # never share a destination or .part file
+    file_names = []
+    taken = set()
+    for image_id, url, _ in rows:
+        name = url.split('/')[-1]
+        if name in taken:
+            name = "{0}_{1}".format(image_id, name)
+        if name in taken:
+            name = "{0}_{1}".format(len(file_names), name)
+        taken.add(name)
+        file_names.append(join(downloaded_folder, name))
+    return file_names
+
+
+def journal_ok_entry(url, expected_md5, file_name):
+    stat = os.stat(file_name)
+    return {'url': url, 'status': STATUS_OK, 'md5': expected_md5, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def download_one(pool, stats, hash_cache, url, expected_md5, file_name, max_retries):
+    attempt = 0
+    while True:
+        try:
+            md5 = fetch(pool, url, file_name)
+            break
+        except DownloadError as e:
+            if e.permanent or attempt >= max_retries:
+                stats.add('missing' if e.permanent else 'failed')
+                return STATUS_MISSING if e.permanent else STATUS_FAILED
+        except (http.client.HTTPException, OSError):
+            if attempt >= max_retries:
+                stats.add('failed')
+                return STATUS_FAILED
+        # Exponential backoff with jitter before retrying
+        stats.add('retries')
+        time.sleep((2 ** attempt) * 0.5 * (1 + random()))
+        attempt += 1
+
+    if md5 != expected_md5:
+        os.remove(file_name)
+        hash_cache.discard(file_name)
+        stats.add('bad_hash')
+        return STATUS_BAD_HASH
+
+    # Hash was computed while streaming so record it rather than re-reading the file later
+    hash_cache.put(file_name, md5)
+    stats.add('downloaded')
+    stats.add_bytes(os.path.getsize(file_name))
+    return STATUS_OK
+
+
+def download_filler_images(filler_images_file, downloaded_folder, data_generation_limit=1000, num_workers=16,
+                           max_retries=3, timeout=30):
+    """
+    Download and verify Open Images fillers concurrently, resuming from the journal in downloaded_folder.
+    :param filler_images_file (str) : Open Images csv listing
+    :param downloaded_folder (str)  : folder to store downloaded images and the download journal
+    :return: filler_images (list)   : verified local file names in csv order
+    """
+    if not isdir(downloaded_folder):
+        os.mkdir(downloaded_folder)
+
+    with open(filler_images_file, 'r', encoding='latin-1') as f:
+        rows = [(line['ImageID'], line['OriginalURL'], line['OriginalMD5'])
+                for line in islice(DictReader(f, fieldnames=FIELDNAMES), 1, data_generation_limit)]
+
+    journal_path = join(downloaded_folder, JOURNAL_FILENAME)
+    journal = load_journal(journal_path)
+    hash_cache = HashCache(downloaded_folder.rstrip(os.sep) + HASH_CACHE_SUFFIX)
+    pool = ConnectionPool(timeout=timeout)
+    stats = DownloadStats()
+    statuses = [None] * len(rows)
+    file_names = local_file_names(rows, downloaded_folder)
+
+    pending = []
+    for i, (_, url, expected_md5) in enumerate(rows):
+        entry = journal.get(url)
+        # Skip anything already finished or known to be unusable
+        if journal_entry_is_current(entry, file_names[i]) and entry.get('md5') == expected_md5:
+            statuses[i] = STATUS_OK
+            stats.add('resumed')
+        elif entry is not None and entry['status'] in (STATUS_BAD_HASH, STATUS_MISSING):
+            statuses[i] = entry['status']
+        else:
+            pending.append(i)
+
+    with open(journal_path, 'a') as journal_file, ThreadPoolExecutor(max_workers=num_workers) as executor:
+        # Files left over from a run without a journal entry are verified in one concurrent batch before any
+        # network traffic; the hash cache means unchanged files are not read again. Verified files are journaled so
+        # the next run trusts them without hashing
+        leftovers = [i for i in pending if isfile(file_names[i])]
+        digests = file_content_hashes([file_names[i] for i in leftovers], hash_cache, num_workers)
+        for i, digest in zip(leftovers, digests):
+            if digest is not None and digest == rows[i][2]:
+                statuses[i] = STATUS_OK
+                stats.add('verified')
+                journal_file.write(json.dumps(journal_ok_entry(rows[i][1], rows[i][2], file_names[i])) + "\n")
+        journal_file.flush()
+        pending = [i for i in pending if statuses[i] is None]
+
+        print("Downloading {0} Open Images ({1} already in journal, {2} verified on disk)".format(
+            len(pending), len(rows) - len(pending) - stats.counts['verified'], stats.counts['verified']))
+
+        futures = {executor.submit(download_one, pool, stats, hash_cache, rows[i][1], rows[i][2], file_names[i],
+                                   max_retries): i for i in pending}
+        for completed, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            try:
+                statuses[i] = future.result()
+            except Exception as e:
+                print("Error - ", rows[i][1], e)
+                statuses[i] = STATUS_FAILED
+                stats.add('failed')
+
+            if statuses[i] == STATUS_OK:
+                entry = journal_ok_entry(rows[i][1], rows[i][2], file_names[i])
+            else:
+                entry = {'url': rows[i][1], 'status': statuses[i]}
+            journal_file.write(json.dumps(entry) + "\n")
+            journal_file.flush()
+
+            if completed % 1000 == 0:
+                hash_cache.save()
+                print(stats.summary())
+
+    hash_cache.save()
+    print(stats.summary())
+    return [file_name for file_name, status in zip(file_names, statuses) if status == STATUS_OK]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Download Open Images filler images listed in a csv file')
+
+    parser.add_argument(
+        '--filler_images_file',
+        type=str,
+        default="/arabic_text/OpenImages/2017_11/train/images.csv",
+        help='Location of file containing filler image details in Open Images csv format. Default = /arabic_text/OpenImages/2017_11/train/images.csv')
+
+    parser.add_argument(
+        '--downloaded_folder',
+        type=str,
+        default="/arabic_text/AcTiV-D/Downloaded",
+        help='Folder to download images into. Default = /arabic_text/AcTiV-D/Downloaded')
+
+    parser.add_argument(
+        '--data_generation_limit',
+        type=int,
+        default=1000,
+        help='Number of csv rows to download. Default = 1000')
+
+    parser.add_argument(
+        '--num_download_workers',
+        type=int,
+        default=16,
+        help='Number of concurrent downloads. Default = 16')
+
+    args = parser.parse_args()
+    filler_images = download_filler_images(args.filler_images_file, args.downloaded_folder,
+                                           args.data_generation_limit, args.num_download_workers)
+    print("Number of Open Images:", len(filler_images))
@@ -0,0 +1,317 @@
+import json
+from os.path import join, isfile, basename
+from collections import defaultdict
+from lxml import etree
+import numpy as np
+
+# Class ids as in data/object-detection.pbtxt
+CLASS_NAMES = {1: 'arabic', 2: 'english'}
+
+# AcTiV-D ground truth held out for evaluation by parse_activ, as (channel, xml file)
+ACTIV_TEST_FILES = [("AljazeeraHD", "gtest_Aj.xml"), ("Negative", "gtest_Ne.xml")]
+
+
+def activ_file_name(channel, frame):
+    # File name format for ActiV is France24_vd01_frame_11.png; Negative and Generated carry their extension
+    extension = frame.attrib.get('ext', 'png')
+    return channel + "_" + frame.attrib['source'] + "_frame_" + frame.attrib['id'] + "." + extension
+
+
+def load_activ_ground_truth(activ_D_folder, test_files=ACTIV_TEST_FILES):
+    """
+    Read AcTiV-D style xml ground truth.
+    :param activ_D_folder (str) : location of AcTiV-D dataset
+    :param test_files (list)    : (channel, xml file) pairs
+    :return: ground_truth (dict): image file name -> {'boxes': Nx4 [xmin,ymin,xmax,ymax], 'classes': N, 'channel'}
+    """
+    ground_truth = {}
+    for channel, xml_file in test_files:
+        path_to_xml = join(activ_D_folder, channel, xml_file)
+        if not isfile(path_to_xml):
+            print("\t{0} was not located; skipping".format(path_to_xml))
+            continue
+        # English text from COCO-Text is the negative class; everything else is Arabic
+        label_num = 2 if channel == 'Negative' else 1
+        for frame in etree.parse(path_to_xml).getroot():
+            boxes = [[int(r.attrib['x']), int(r.attrib['y']), int(r.attrib['x']) + int(r.attrib['width']),
+                      int(r.attrib['y']) + int(r.attrib['height'])] for r in frame]
+            ground_truth[activ_file_name(channel, frame)] = {
+                'boxes': np.array(boxes, dtype=np.float64).reshape(-1, 4),
+                'classes': np.full(len(boxes), label_num, dtype=np.int64),
+                'channel': channel}
+    return ground_truth
+
+
+def load_coco_text_ground_truth(ct, imgIds, label_num=2):
+    """
+    Ground truth for COCO-Text images; every annotation is counted as label_num (english).
+    :param ct (COCO_Text)   : loaded COCO_Text api object
+    :param imgIds (list)    : images to evaluate
+    :return: ground_truth (dict) : image file name -> {'boxes', 'classes', 'channel'}
+    """
+    columns = ct.columns()
+    ground_truth = {}
+    for img in ct.loadImgs(imgIds):
+        # [x,y,width,height] -> [xmin,ymin,xmax,ymax]
+        boxes = columns.imgBboxes(img['id']).copy()
+        boxes[:, 2:] += boxes[:, :2]
+        ground_truth[img['file_name']] = {'boxes': boxes, 'classes': np.full(len(boxes), label_num, dtype=np.int64),
+                                          'channel': 'COCO-Text'}
+    return ground_truth
+
+
+def coco_text_image_ids(ct, split='val', image_ids=None):
+    """
+    Images of the COCO-Text set being evaluated, whether or not anything was detected in them.
+    :param ct (COCO_Text)    : loaded COCO_Text api object
+    :param split (str)       : 'train', 'val' or 'test'
+    :param image_ids (list)  : explicit COCO ids to evaluate instead of the split
+    :return: imgIds (list)   : COCO ids known to ct
+    """
+    if image_ids is None:
+        return list(getattr(ct, split))
+    unknown = [imgId for imgId in image_ids if imgId not in ct.imgs]
+    if len(unknown) > 0:
+        print("Warning - {0} image ids are not in COCO-Text; skipping".format(len(unknown)))
+    return [imgId for imgId in image_ids if imgId in ct.imgs]
+
+
+def load_detections(results):
+    """
+    Load detections in COCO results format: {'image_id', 'bbox': [x,y,width,height], 'score', 'category_id'}.
+    :param results (str or list) : results json array, json lines file, or already loaded list of dicts
+    :return: detections (dict)   : image file name -> {'boxes': Nx4 [xmin,ymin,xmax,ymax], 'scores', 'classes'}
+    """
+    if isinstance(results, str):
+        with open(results, 'r') as f:
+            text = f.read()
+        if text.lstrip().startswith('['):
+            results = json.loads(text)
+        else:
+            results = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    grouped = defaultdict(list)
+    for det in results:
+        # Images are matched by file name so paths from any machine line up with the ground truth
+        image_id = det['image_id']
+        grouped[basename(image_id) if isinstance(image_id, str) else image_id].append(det)
+
+    detections = {}
+    for image_id, dets in grouped.items():
+        boxes = np.array([det['bbox'] for det in dets], dtype=np.float64).reshape(-1, 4)
+        boxes[:, 2:] += boxes[:, :2]
+        detections[image_id] = {'boxes': boxes,
+                                'scores': np.array([det['score'] for det in dets], dtype=np.float64),
+                                'classes': np.array([det['category_id'] for det in dets], dtype=np.int64)}
+    return detections
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """
+    Pairwise intersection over union of [xmin,ymin,xmax,ymax] boxes.
+    :return: ious (ndarray) : len(boxes_a) x len(boxes_b)
+    """
+    ixmin = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    iymin = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    ixmax = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    iymax = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    intersection = np.clip(ixmax - ixmin, 0, None) * np.clip(iymax - iymin, 0, None)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-12), 0.0)
+
+
+def match_image(det_boxes, gt_boxes, iou_thresholds):
+    """
+    Greedily match score-sorted detections to ground truth of one image and class.
+    :return: true_positives (ndarray) : len(iou_thresholds) x len(det_boxes) bool
+    """
+    true_positives = np.zeros((len(iou_thresholds), len(det_boxes)), dtype=bool)
+    if len(det_boxes) == 0 or len(gt_boxes) == 0:
+        return true_positives
+    # One IoU matrix serves every threshold
+    ious = iou_matrix(det_boxes, gt_boxes)
+    for t, threshold in enumerate(iou_thresholds):
+        available = np.ones(len(gt_boxes), dtype=bool)
+        for i in range(len(det_boxes)):
+            candidates = np.where(available, ious[i], -1.0)
+            j = int(np.argmax(candidates))
+            if candidates[j] >= threshold:
+                true_positives[t, i] = True
+                available[j] = False
+    return true_positives
+
+
+def average_precision(recall, precision):
+    # All-point interpolated AP (area under the monotone precision envelope)
+    mrec = np.concatenate(([0.0], recall, [1.0]))
+    mpre = np.concatenate(([0.0], precision, [0.0]))
+    mpre = np.maximum.accumulate(mpre[::-1])[::-1]
+    changes = np.where(mrec[1:] != mrec[:-1])[0]
+    return float(np.sum((mrec[changes + 1] - mrec[changes]) * mpre[changes + 1]))
+
+
+def summarize(scores, true_positives, num_gt, score_threshold):
+    # Precision/recall curve over all detections plus the operating point at score_threshold
+    order = np.argsort(-scores, kind='stable')
+    scores = scores[order]
+    true_positives = true_positives[:, order]
+    tp = np.cumsum(true_positives, axis=1)
+    fp = np.cumsum(~true_positives, axis=1)
+    above = int(np.searchsorted(-scores, -score_threshold, side='right'))
+
+    summary = []
+    for t in range(true_positives.shape[0]):
+        recall = tp[t] / float(num_gt) if num_gt > 0 else np.zeros(len(scores))
+        precision = tp[t] / np.maximum(tp[t] + fp[t], 1)
+        summary.append({
+            'ap': average_precision(recall, precision) if num_gt > 0 else float('nan'),
+            'precision': float(precision[above - 1]) if above > 0 else 0.0,
+            'recall': float(recall[above - 1]) if above > 0 else 0.0,
+            'num_detections': above,
+            'num_ground_truth': int(num_gt)})
+    return summary
+
+
+def evaluate(ground_truth, detections, iou_thresholds=(0.5,), score_threshold=0.5):
+    """
+    Score detections against ground truth per class, overall and per channel.
+    :param ground_truth (dict)    : from load_activ_ground_truth or load_coco_text_ground_truth
+    :param detections (dict)      : from load_detections
+    :param iou_thresholds (tuple) : IoU needed for a detection to count as a match
+    :param score_threshold (float): score of the reported precision/recall operating point
+    :return: results (dict)       : (class name, channel or 'all') -> list of per threshold summaries
+    """
+    empty = {'boxes': np.zeros((0, 4)), 'scores': np.zeros(0), 'classes': np.zeros(0, dtype=np.int64)}
+    # Per (class, channel): detection scores, match flags and number of ground truth boxes
+    scores = defaultdict(list)
+    matches = defaultdict(list)
+    num_gt = defaultdict(int)
+
+    for image_id, truth in ground_truth.items():
+        dets = detections.get(image_id, empty)
+        for label_num in CLASS_NAMES:
+            gt_boxes = truth['boxes'][truth['classes'] == label_num]
+            class_dets = dets['classes'] == label_num
+            order = np.argsort(-dets['scores'][class_dets], kind='stable')
+            det_boxes = dets['boxes'][class_dets][order]
+            det_scores = dets['scores'][class_dets][order]
+            true_positives = match_image(det_boxes, gt_boxes, iou_thresholds)
+            for key in ((label_num, 'all'), (label_num, truth['channel'])):
+                scores[key].append(det_scores)
+                matches[key].append(true_positives)
+                num_gt[key] += len(gt_boxes)
+
+    missing = len(set(detections) - set(ground_truth))
+    if missing > 0:
+        print("Warning - {0} images with detections have no ground truth; ignored".format(missing))
+
+    results = {}
+    for key in sorted(scores, key=lambda k: (k[0], k[1] != 'all', k[1])):
+        label_num, channel = key
+        if num_gt[key] == 0 and sum(len(s) for s in scores[key]) == 0:
+            continue
+        results[(CLASS_NAMES[label_num], channel)] = summarize(np.concatenate(scores[key]),
+                                                               np.concatenate(matches[key], axis=1),
+                                                               num_gt[key], score_threshold)
+    return results
+
+
+def print_results(results, iou_thresholds, score_threshold):
+    print("{0:<10} {1:<16} {2:>5} {3:>8} {4:>10} {5:>8} {6:>6} {7:>6}".format(
+        "class", "channel", "IoU", "AP", "precision", "recall", "dets", "gt"))
+    for (class_name, channel), summary in results.items():
+        for threshold, row in zip(iou_thresholds, summary):
+            print("{0:<10} {1:<16} {2:>5.2f} {3:>8.4f} {4:>10.4f} {5:>8.4f} {6:>6} {7:>6}".format(
+                class_name, channel, threshold, row['ap'], row['precision'], row['recall'], row['num_detections'],
+                row['num_ground_truth']))
+    print("Precision and recall are reported for detections with score >= {0}".format(score_threshold))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Evaluate detections against AcTiV-D or COCO-Text ground truth')
+
+    parser.add_argument(
+        '--detections',
+        type=str,
+        required=True,
+        help='Detections in COCO results format, as a json array or json lines')
+
+    parser.add_argument(
+        '--ground_truth',
+        type=str,
+        default='activ',
+        choices=['activ', 'coco_text'],
+        help='Ground truth source. Default = activ')
+
+    parser.add_argument(
+        '--activ_D_folder',
+        type=str,
+        default="/arabic_text/AcTiV-D",
+        help='Location of AcTiV dataset. Default = /arabic_text/AcTiV-D')
+
+    parser.add_argument(
+        '--coco_text_file',
+        type=str,
+        default="COCO_Text.json",
+        help='COCO-Text annotation file when --ground_truth coco_text. Default = COCO_Text.json')
+
+    parser.add_argument(
+        '--coco_text_split',
+        type=str,
+        default='val',
+        choices=['train', 'val', 'test'],
+        help='COCO-Text split to evaluate; every image in it counts, including those without detections. '
+             'Default = val')
+
+    parser.add_argument(
+        '--image_ids',
+        type=int,
+        nargs='+',
+        default=None,
+        help='Evaluate exactly these COCO ids instead of --coco_text_split')
+
+    parser.add_argument(
+        '--iou_thresholds',
+        type=float,
+        nargs='+',
+        default=[0.5],
+        help='IoU thresholds to evaluate at. Default = 0.5')
+
+    parser.add_argument(
+        '--score_threshold',
+        type=float,
+        default=0.5,
+        help='Minimum score for the reported precision and recall. Default = 0.5')
+
+    parser.add_argument(
+        '--output_json',
+        type=str,
+        default=None,
+        help='Optionally write the results to this json file')
+
+    args = parser.parse_args()
+
+    detections = load_detections(args.detections)
+    if args.ground_truth == 'activ':
+        ground_truth = load_activ_ground_truth(args.activ_D_folder)
+    else:
+        import coco_text
+        ct = coco_text.COCO_Text(args.coco_text_file)
+        # Detections may name images by COCO id or by file name. Every image of the evaluated set gets ground
+        # truth, so images without detections still count their missed boxes
+        detections = {ct.imgs[key]['file_name'] if key in ct.imgs else key: value for key, value in detections.items()}
+        ground_truth = load_coco_text_ground_truth(ct, coco_text_image_ids(ct, args.coco_text_split, args.image_ids))
+
+    print("Evaluating {0} images".format(len(ground_truth)))
+    results = evaluate(ground_truth, detections, args.iou_thresholds, args.score_threshold)
+    print_results(results, args.iou_thresholds, args.score_threshold)
+
+    if args.output_json is not None:
+        with open(args.output_json, 'w') as f:
+            json.dump([{'class': class_name, 'channel': channel, 'iou_threshold': threshold, **row}
+                       for (class_name, channel), summary in results.items()
+                       for threshold, row in zip(args.iou_thresholds, summary)], f, indent=2)
@@ -1,14 +1,107 @@
+import os
+import json
+import mmap
 import hashlib
+import threading
 from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
 
-def file_content_hash(in_filename):
+# Files at least this big are hashed through a memory map instead of a read loop
+MMAP_THRESHOLD = 1 << 20
+
+
+def file_content_hash(in_filename, cache=None):
     # Get MD5 hash of file contents
-    BLOCKSIZE = 65536
+    if cache is not None:
+        cached = cache.get(in_filename)
+        if cached is not None:
+            return cached
+
+    BLOCKSIZE = 1 << 20
     hasher = hashlib.md5()
     with open(in_filename, 'rb') as afile:
-        buf = afile.read(BLOCKSIZE)
-        while len(buf) > 0:
-            hasher.update(buf)
+        if os.fstat(afile.fileno()).st_size >= MMAP_THRESHOLD:
+            with mmap.mmap(afile.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                hasher.update(mapped)
+        else:
             buf = afile.read(BLOCKSIZE)
+            while len(buf) > 0:
+                hasher.update(buf)
+                buf = afile.read(BLOCKSIZE)
+
+    digest = b64encode(hasher.digest()).decode('ascii')
+    if cache is not None:
+        cache.put(in_filename, digest)
+    return digest
+
+
+def file_content_hashes(in_filenames, cache=None, num_workers=8):
+    # Hash many files concurrently; hashlib releases the GIL so threads overlap I/O and hashing.
+    # A file that vanished or cannot be read gets None instead of failing the whole batch
+    def hash_or_none(in_filename):
+        try:
+            return file_content_hash(in_filename, cache)
+        except OSError as e:
+            print("Warning - could not hash {0}: {1}".format(in_filename, e))
+            return None
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        return list(executor.map(hash_or_none, in_filenames))
+
+
+class HashCache:
+    """
+    Persistent MD5 cache keyed by (path, size, mtime_ns, inode) so unchanged files are verified without being read.
+    :param cache_file (str) : json file holding the cache; created on save
+    """
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.dirty = False
+        if os.path.isfile(cache_file):
+            try:
+                with open(cache_file, 'r') as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                print("Warning - ignoring unreadable hash cache {0}".format(cache_file))
+
+    @staticmethod
+    def signature(in_filename):
+        stat = os.stat(in_filename)
+        return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+    def get(self, in_filename):
+        key = os.path.abspath(in_filename)
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            return None
+        try:
+            if entry[:3] == self.signature(in_filename):
+                return entry[3]
+        except OSError:
+            pass
+        return None
+
+    def put(self, in_filename, digest):
+        entry = self.signature(in_filename) + [digest]
+        with self.lock:
+            self.entries[os.path.abspath(in_filename)] = entry
+            self.dirty = True
+
+    def discard(self, in_filename):
+        with self.lock:
+            if self.entries.pop(os.path.abspath(in_filename), None) is not None:
+                self.dirty = True
 
-    return b64encode(hasher.digest()).decode('ascii')
\ No newline at end of file
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            # Write to a temporary file first so an interrupted save never corrupts the cache
+            temp_file = self.cache_file + ".tmp"
+            with open(temp_file, 'w') as f:
+                json.dump(self.entries, f)
+            os.replace(temp_file, self.cache_file)
+            self.dirty = False
@@ -0,0 +1,280 @@
+import os
+import sys
+import json
+import time
+import queue
+import hashlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, Future
+import numpy as np
+from PIL import Image
+from detect import DetectionEngine, DEFAULT_GRAPH, DEFAULT_LABELS, load_label_map, list_images, detect_images
+
+# Tesseract language for each detected class of data/object-detection.pbtxt
+CLASS_LANGUAGES = {'arabic': 'ara', 'english': 'eng'}
+# Crops shorter than this are upscaled before recognition; Tesseract does poorly on very small text
+MIN_TEXT_HEIGHT = 32
+
+
+def ocr_crop(task):
+    # Worker side: recognize one text line crop. pytesseract is only needed in the OCR workers
+    import pytesseract
+    crop, lang, psm = task
+    image = Image.fromarray(crop)
+    if image.height < MIN_TEXT_HEIGHT:
+        scale = MIN_TEXT_HEIGHT / float(image.height)
+        image = image.resize((max(1, int(round(image.width * scale))), MIN_TEXT_HEIGHT), Image.BICUBIC)
+    return pytesseract.image_to_string(image, lang=lang, config='--psm {0}'.format(psm)).strip()
+
+
+def crop_box(image, box, margin=4):
+    """
+    Zero-copy view of a detection in the decoded image, widened by margin pixels on every side.
+    :param box (ndarray) : normalized [ymin, xmin, ymax, xmax]
+    """
+    rows, cols = image.shape[:2]
+    ymin, xmin, ymax, xmax = box * np.array([rows, cols, rows, cols], dtype=np.float64)
+    return image[max(0, int(ymin) - margin):min(rows, int(np.ceil(ymax)) + margin),
+                 max(0, int(xmin) - margin):min(cols, int(np.ceil(xmax)) + margin)]
+
+
+def crop_digest(crop):
+    # Content hash of a crop; identical overlays in different frames hash the same
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(str(crop.shape).encode('ascii'))
+    hasher.update(np.ascontiguousarray(crop).data)
+    return hasher.digest()
+
+
+class OCRStage:
+    """
+    Tesseract on a process pool with backpressure and a result cache.
+
+    submit() returns a future for the text of a crop. At most max_in_flight crops are queued or being recognized;
+    past that, submit blocks, so a fast producer (the detector) is held back instead of piling up crops in memory,
+    while still running ahead of OCR by max_in_flight crops. Results are kept in an LRU keyed by
+    (crop hash, language), and a crop identical to one still being recognized shares its future, so static
+    captions and tickers repeated across frames are recognized once.
+    :param num_workers (int)   : OCR processes; default is one per core
+    :param max_in_flight (int) : crops queued or in progress before submit blocks; default 2 per worker
+    :param cache_size (int)    : most cached results
+    :param psm (int)           : Tesseract page segmentation mode; 7 treats each crop as a single text line
+    """
+    def __init__(self, num_workers=None, max_in_flight=None, cache_size=4096, psm=7):
+        num_workers = num_workers or os.cpu_count()
+        # Spawned workers never inherit the detector's TensorFlow threads, which are not fork safe
+        self.executor = ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context('spawn'))
+        self.slots = threading.BoundedSemaphore(max_in_flight or 2 * num_workers)
+        self.cache_size = cache_size
+        self.psm = psm
+        self.cache = OrderedDict()
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def submit(self, crop, lang):
+        key = (crop_digest(crop), lang)
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                future = Future()
+                future.set_result(self.cache[key])
+                return future
+            if key in self.in_flight:
+                self.hits += 1
+                return self.in_flight[key]
+            self.misses += 1
+
+        # Backpressure: wait for a free slot before handing the pool more work
+        self.slots.acquire()
+        future = self.executor.submit(ocr_crop, (np.ascontiguousarray(crop), lang, self.psm))
+        with self.lock:
+            self.in_flight[key] = future
+        future.add_done_callback(lambda done: self.finished(key, done))
+        return future
+
+    def finished(self, key, future):
+        self.slots.release()
+        with self.lock:
+            self.in_flight.pop(key, None)
+            if future.cancelled() or future.exception() is not None:
+                return
+            self.cache[key] = future.result()
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+def ocr_images(engine, ocr, image_paths, labels, batch_size=4, num_threads=4, min_score=0.5, margin=4,
+               languages=CLASS_LANGUAGES, max_pending_images=32):
+    """
+    Detect -> crop -> OCR pipeline. Detection runs on its own thread and submits the crops of each image to the
+    OCR stage as soon as the image is detected; this generator collects the texts in detection order. The two
+    stages overlap, bounded by the OCR stage's in-flight limit and max_pending_images detected images.
+    :return: iterator of (image_path, (width, height), [(box [xmin,ymin,xmax,ymax] in pixels, score, class, label,
+             text)])
+    """
+    detected = queue.Queue(maxsize=max_pending_images)
+    done = object()
+
+    def detector():
+        try:
+            for image_path, size, (boxes, scores, classes), image in detect_images(
+                    engine, image_paths, batch_size, num_threads, with_images=True):
+                texts = []
+                for box, score, category in zip(boxes, scores, classes):
+                    if score < min_score:
+                        continue
+                    crop = crop_box(image, box, margin)
+                    if crop.size == 0:
+                        continue
+                    label = labels.get(int(category), str(category))
+                    future = ocr.submit(crop, languages.get(label, 'ara+eng'))
+                    texts.append((box, score, int(category), label, future))
+                detected.put((image_path, size, texts))
+        except Exception as error:
+            detected.put(error)
+        detected.put(done)
+
+    threading.Thread(target=detector, daemon=True).start()
+    while True:
+        item = detected.get()
+        if item is done:
+            return
+        if isinstance(item, Exception):
+            raise item
+        image_path, (width, height), texts = item
+
+        results = []
+        for box, score, category, label, future in texts:
+            try:
+                text = future.result()
+            except Exception as error:
+                print("OCR failed on a crop of {0}: {1}".format(image_path, error), file=sys.stderr)
+                text = None
+            ymin, xmin, ymax, xmax = box * np.array([height, width, height, width], dtype=np.float64)
+            results.append(([float(xmin), float(ymin), float(xmax), float(ymax)], float(score), category, label, text))
+        yield image_path, (width, height), results
+
+
+def main(graph_path, label_map_path, inputs, output_file, batch_size=4, num_threads=4, num_ocr_workers=None,
+         min_score=0.5, margin=4, psm=7, cache_size=4096, cpu_only=False):
+
+    image_paths = list_images(inputs)
+    labels = load_label_map(label_map_path)
+    print("Reading text in {0} images".format(len(image_paths)), file=sys.stderr)
+
+    ocr = OCRStage(num_ocr_workers, cache_size=cache_size, psm=psm)
+    out = sys.stdout if output_file == '-' else open(output_file, 'w')
+    try:
+        with DetectionEngine(graph_path, cpu_only) as engine:
+            start = time.time()
+            counter = 0
+            crops = 0
+            for image_path, (width, height), results in ocr_images(engine, ocr, image_paths, labels, batch_size,
+                                                                   num_threads, min_score, margin):
+                out.write(json.dumps({'image_id': image_path, 'width': width, 'height': height,
+                                      'texts': [{'box': [round(value, 1) for value in box], 'score': round(score, 5),
+                                                 'category_id': category, 'label': label, 'text': text}
+                                                for box, score, category, label, text in results]},
+                                     ensure_ascii=False) + "\n")
+                counter += 1
+                crops += len(results)
+            elapsed = time.time() - start
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        ocr.close()
+
+    print("Read {0} text regions in {1} images in {2:.1f} s ({3:.2f} images/sec); "
+          "OCR cache {4} hits, {5} misses".format(crops, counter, elapsed, counter / elapsed if elapsed > 0 else 0.0,
+                                                  ocr.hits, ocr.misses), file=sys.stderr)
+
+
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Detect Arabic and English text and recognize it with Tesseract')
+
+    parser.add_argument(
+        'inputs',
+        type=str,
+        nargs='+',
+        help='Image files, folders of images or glob patterns')
+
+    parser.add_argument(
+        '--graph',
+        type=str,
+        default=DEFAULT_GRAPH,
+        help='Exported frozen graph. Default = /prog/models/exported/frozen_inference_graph.pb')
+
+    parser.add_argument(
+        '--labels',
+        type=str,
+        default=DEFAULT_LABELS,
+        help='Label map. Default = data/object-detection.pbtxt')
+
+    parser.add_argument(
+        '--output',
+        type=str,
+        default='texts.jsonl',
+        help='JSON lines output with one line per image, or - for stdout. Default = texts.jsonl')
+
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=4,
+        help='Images per detector session run. Default = 4')
+
+    parser.add_argument(
+        '--num_threads',
+        type=int,
+        default=4,
+        help='Number of image decoding threads. Default = 4')
+
+    parser.add_argument(
+        '--num_ocr_workers',
+        type=int,
+        default=None,
+        help='Number of Tesseract processes. Default = number of CPUs')
+
+    parser.add_argument(
+        '--min_score',
+        type=float,
+        default=0.5,
+        help='Only read detections scoring at least this. Default = 0.5')
+
+    parser.add_argument(
+        '--margin',
+        type=int,
+        default=4,
+        help='Pixels added around each detection before recognition. Default = 4')
+
+    parser.add_argument(
+        '--psm',
+        type=int,
+        default=7,
+        help='Tesseract page segmentation mode. Default = 7 (single text line)')
+
+    parser.add_argument(
+        '--cache_size',
+        type=int,
+        default=4096,
+        help='Number of recognized crops kept for reuse. Default = 4096')
+
+    parser.add_argument(
+        '--cpu_only',
+        default=False,
+        action='store_true',
+        help='Run the detection graph on CPU even if a GPU is available. Default = False')
+
+    args = parser.parse_args()
+    main(args.graph, args.labels, args.inputs, args.output, args.batch_size, args.num_threads, args.num_ocr_workers,
+         args.min_score, args.margin, args.psm, args.cache_size, args.cpu_only)
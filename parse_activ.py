@@ -1,79 +1,338 @@
 from lxml import etree
-import tensorflow as tf
-from object_detection.utils import dataset_util
-from os.path import join, isfile
+import re
+from os.path import join, isfile, dirname, abspath
 from PIL import Image
 import io
 from global_config import INPUT_HEIGHT, INPUT_WIDTH, ONE_IMAGE_SIZE, USE_GRAYSCALE
-from random import shuffle
-
+from random import Random
+from array import array
+from sys import intern
+from itertools import islice
+from multiprocessing import Pool
+import tfrecord_io
+from record_cache import RecordCache, example_content_hashes, record_key
+from shuffle_stream import buffered_shuffle, external_shuffle
+
+# Pipeline config whose image_resizer decides how far records are downscaled
+DEFAULT_PIPELINE_CONFIG = join(dirname(abspath(__file__)), "models", "model", "faster_rcnn_resnet50_coco.config")
+
+
+def load_resizer_bounds(pipeline_config):
+    """
+    Read the keep_aspect_ratio_resizer bounds from an object detection pipeline config.
+    :param pipeline_config (str) : path to a *.config file
+    :return: (min_dimension, max_dimension), or None if the config has no keep_aspect_ratio_resizer
+    """
+    with open(pipeline_config, 'r') as f:
+        config = f.read()
+    resizer = re.search(r'keep_aspect_ratio_resizer\s*\{([^}]*)\}', config)
+    if resizer is None:
+        return None
+    min_dimension = re.search(r'min_dimension\s*:\s*(\d+)', resizer.group(1))
+    max_dimension = re.search(r'max_dimension\s*:\s*(\d+)', resizer.group(1))
+    # Defaults from the object detection image_resizer.proto
+    return (int(min_dimension.group(1)) if min_dimension else 600,
+            int(max_dimension.group(1)) if max_dimension else 1024)
+
+
+def record_settings(resizer_bounds=None, png_compress_level=6):
+    # Settings that change how a record is encoded; passed to the workers and part of every record cache key
+    return {'USE_GRAYSCALE': USE_GRAYSCALE, 'ONE_IMAGE_SIZE': ONE_IMAGE_SIZE, 'INPUT_WIDTH': INPUT_WIDTH,
+            'INPUT_HEIGHT': INPUT_HEIGHT,
+            'resize': list(resizer_bounds) if resizer_bounds is not None else 'width_1000',
+            'png_compress_level': png_compress_level}
+
+
+def target_size(width, height, settings):
+    """
+    Size to store an image at, or None to keep it as is. With resizer bounds this is the size the model's
+    keep_aspect_ratio_resizer would produce, so records never hold pixels the model throws away. Images are only
+    ever made smaller; upscaling is left to the model.
+    """
+    if settings['resize'] == 'width_1000':
+        if width > 1000 or height > 1000:
+            return 1000, int(float(height) * (1000 / float(width)))
+        return None
 
-def create_tf_example(example, mode):
+    min_dimension, max_dimension = settings['resize']
+    scale = min_dimension / float(min(width, height))
+    if max(width, height) * scale > max_dimension:
+        scale = max_dimension / float(max(width, height))
+    if scale >= 1:
+        return None
+    return int(round(width * scale)), int(round(height * scale))
+
+
+class FrameRecord:
+    """
+    Compact record of one annotated frame. Channel, source, extension and image folder strings are interned so
+    every frame of a channel shares one copy, and the boxes are packed into a single int array of
+    (xmin, xmax, ymin, ymax) quadruples instead of four growing lists.
+    """
+    __slots__ = ('channel', 'source', 'frame_num', 'extension', 'path_to_image', 'boxes')
+
+    def __init__(self, channel, source, frame_num, extension, path_to_image, boxes):
+        self.channel = channel
+        self.source = source
+        self.frame_num = frame_num
+        self.extension = extension
+        self.path_to_image = path_to_image
+        self.boxes = boxes
+
+    @property
+    def file_name(self):
+        # File name format for ActiV is France24_vd01_frame_11.png
+        return self.channel + "_" + self.source + "_frame_" + self.frame_num + "." + self.extension
+
+    @property
+    def image_format(self):
+        return b'jpeg' if self.extension in ['jpg','jpeg'] else b'png'
+
+    @property
+    def label(self):
+        # Negative samples come from COCO-Text and hold english text; everything else is arabic
+        return b'english' if self.channel == 'Negative' else b'arabic'
+
+    @property
+    def label_num(self):
+        return 2 if self.channel == 'Negative' else 1
+
+    @property
+    def num_boxes(self):
+        return len(self.boxes) // 4
+
+    @property
+    def bbox_xmins(self):
+        return self.boxes[0::4].tolist()
+
+    @property
+    def bbox_xmaxs(self):
+        return self.boxes[1::4].tolist()
+
+    @property
+    def bbox_ymins(self):
+        return self.boxes[2::4].tolist()
+
+    @property
+    def bbox_ymaxs(self):
+        return self.boxes[3::4].tolist()
+
+
+def iter_frames(path_to_xml, channel, path_to_image):
+    """
+    Stream the frames of an AcTiV-D style annotation file as FrameRecords. Each frame element is cleared, and
+    detached from the root, once read, so memory use does not grow with the size of the file.
+    """
+    channel = intern(channel)
+    path_to_image = intern(path_to_image)
+    for _, frame in etree.iterparse(path_to_xml, events=('end',), tag='frame'):
+        # Negative sampling and Generated text have file extension in xml
+        extension = intern(frame.get('ext', 'png'))
+
+        boxes = array('i')
+        for rectangle in frame:
+            x = int(rectangle.get('x'))
+            y = int(rectangle.get('y'))
+            boxes.extend((x, x + int(rectangle.get('width')), y, y + int(rectangle.get('height'))))
+
+        yield FrameRecord(channel, intern(frame.get('source')), frame.get('id'), extension, path_to_image, boxes)
+
+        frame.clear()
+        while frame.getprevious() is not None:
+            del frame.getparent()[0]
+
+
+def create_tf_example(example, mode, settings):
     # Some images referenced in the xml aren't in the dataset
+    image_path = join(example.path_to_image, example.file_name)
     try:
-        activ_image = Image.open(join(example['path_to_image'], example['file_name']), mode='r')
+        # Opening only parses the header; pixels are decoded on first use
+        activ_image = Image.open(image_path, mode='r')
     except:
-        print("Could not find {0}; skipping".format(join(example['path_to_image'], example['file_name'])))
+        print("Could not find {0}; skipping".format(image_path))
         return None
 
-    if USE_GRAYSCALE:
-        activ_image = activ_image.convert('L').convert('RGB')
-
     # Normalized x,y coordinates
     width, height = activ_image.size
-    xmins = [x / float(width) for x in example['bbox_xmins']]
-    xmaxs = [x / float(width) for x in example['bbox_xmaxs']]
-    ymins = [y / float(height) for y in example['bbox_ymins']]
-    ymaxs = [y / float(height) for y in example['bbox_ymaxs']]
+    xmins = [x / float(width) for x in example.bbox_xmins]
+    xmaxs = [x / float(width) for x in example.bbox_xmaxs]
+    ymins = [y / float(height) for y in example.bbox_ymins]
+    ymaxs = [y / float(height) for y in example.bbox_ymaxs]
 
     # Skip the image if it doesn't match INPUT_WIDTH x INPUT_HEIGHT
     if mode != "test" and ONE_IMAGE_SIZE and (height != INPUT_HEIGHT or width != INPUT_WIDTH):
         #print("Input image does not match expected size {0}x{1}; skipping".format(INPUT_WIDTH,INPUT_HEIGHT))
         return None
-    
-    # If needed, resize now that the normalized box coordinates have been calculated
-    if width > 1000 or height > 1000:
-        basewidth = 1000
-        wpercent = (basewidth/float(width))
-        hsize = int((float(height)*float(wpercent)))
-        activ_image = activ_image.resize((basewidth,hsize), Image.ANTIALIAS)
-        width, height = activ_image.size
-
-    imgByteArr = io.BytesIO()
-    if example['extension'] in ['jpg','jpeg']:
-        activ_image.save(imgByteArr, format='JPEG')
+
+    resize_to = target_size(width, height, settings)
+    pil_format = 'JPEG' if example.extension in ['jpg','jpeg'] else 'PNG'
+
+    if not USE_GRAYSCALE and resize_to is None and activ_image.format == pil_format:
+        # Nothing to change, so embed the original bytes: no decode and no lossy JPEG recompression
+        activ_image.close()
+        with open(image_path, 'rb') as f:
+            encoded_image_data = f.read()
     else:
-        activ_image.save(imgByteArr, format='PNG')
-    encoded_image_data = imgByteArr.getvalue()  # Encoded image bytes
+        if resize_to is not None and activ_image.format == 'JPEG':
+            # Let the JPEG decoder reduce by 1/2, 1/4 or 1/8 in the DCT domain; never below the target size
+            activ_image.draft('L' if USE_GRAYSCALE else 'RGB', resize_to)
 
-    filename = example['file_name'].encode('utf-8')  # Filename of the image. Empty if image is not from file
-    image_format = example['image_format']  # b'jpeg' or b'png'
+        if USE_GRAYSCALE:
+            activ_image = activ_image.convert('L').convert('RGB')
+
+        # If needed, resize now that the normalized box coordinates have been calculated
+        if resize_to is not None:
+            activ_image = activ_image.resize(resize_to, Image.LANCZOS)
+            width, height = activ_image.size
+
+        imgByteArr = io.BytesIO()
+        if pil_format == 'PNG':
+            activ_image.save(imgByteArr, format=pil_format, compress_level=settings['png_compress_level'])
+        else:
+            activ_image.save(imgByteArr, format=pil_format)
+        encoded_image_data = imgByteArr.getvalue()  # Encoded image bytes
+
+    filename = example.file_name.encode('utf-8')  # Filename of the image. Empty if image is not from file
+    image_format = example.image_format  # b'jpeg' or b'png'
 
     # List of string class name of bounding box (1 per box)
-    classes_text = [example['label'] for i in range(len(xmins))]
+    classes_text = [example.label for i in range(len(xmins))]
 
     # List of integer class id of bounding box (1 per box)
-    classes = [example['label_num'] for i in range(len(xmins))]
-
-    tf_example = tf.train.Example(features=tf.train.Features(feature={
-        'image/height': dataset_util.int64_feature(height),
-        'image/width': dataset_util.int64_feature(width),
-        'image/filename': dataset_util.bytes_feature(filename),
-        'image/source_id': dataset_util.bytes_feature(filename),
-        'image/encoded': dataset_util.bytes_feature(encoded_image_data),
-        'image/format': dataset_util.bytes_feature(image_format),
-        'image/object/bbox/xmin': dataset_util.float_list_feature(xmins),
-        'image/object/bbox/xmax': dataset_util.float_list_feature(xmaxs),
-        'image/object/bbox/ymin': dataset_util.float_list_feature(ymins),
-        'image/object/bbox/ymax': dataset_util.float_list_feature(ymaxs),
-        'image/object/class/text': dataset_util.bytes_list_feature(classes_text),
-        'image/object/class/label': dataset_util.int64_list_feature(classes),
-    }))
+    classes = [example.label_num for i in range(len(xmins))]
+
+    tf_example = tfrecord_io.encode_example({
+        'image/height': tfrecord_io.int64_feature(height),
+        'image/width': tfrecord_io.int64_feature(width),
+        'image/filename': tfrecord_io.bytes_feature(filename),
+        'image/source_id': tfrecord_io.bytes_feature(filename),
+        'image/encoded': tfrecord_io.bytes_feature(encoded_image_data),
+        'image/format': tfrecord_io.bytes_feature(image_format),
+        'image/object/bbox/xmin': tfrecord_io.float_list_feature(xmins),
+        'image/object/bbox/xmax': tfrecord_io.float_list_feature(xmaxs),
+        'image/object/bbox/ymin': tfrecord_io.float_list_feature(ymins),
+        'image/object/bbox/ymax': tfrecord_io.float_list_feature(ymaxs),
+        'image/object/class/text': tfrecord_io.bytes_list_feature(classes_text),
+        'image/object/class/label': tfrecord_io.int64_list_feature(classes),
+    })
 
     return tf_example
 
 
-def main(activ_D_folder, program_data_folder):
+def serialize_example(task):
+    # Worker side of the parallel build; records are already serialized bytes so they cross processes cheaply
+    example, mode, settings = task
+    return create_tf_example(example, mode, settings)
+
+
+def shard_paths(program_data_folder, mode, num_shards):
+    # A single shard keeps the original file name, e.g. training.tfrecord
+    if num_shards == 1:
+        return [join(program_data_folder, mode + ".tfrecord")]
+    return [join(program_data_folder, "{0}-{1:05d}-of-{2:05d}.tfrecord".format(mode, shard, num_shards))
+            for shard in range(num_shards)]
+
+
+def write_examples(examples, mode, program_data_folder, num_shards=1, num_workers=None, record_cache=None,
+                   settings=None, batch_size=4096):
+    """
+    Serialize examples on a process pool and write them round-robin over num_shards files. Results are consumed in
+    example order, so record order within and across shards depends only on the order of examples. Examples may be
+    any iterable and are taken batch_size at a time, so a streamed input is never held in memory as a whole. With a
+    record_cache, only new or changed examples are built; the rest are copied from the cache. Every shard gets a
+    .index sidecar of record offsets for random access (see tfrecord_io.IndexedTFRecordFile).
+    :param settings (dict)  : encoding settings from record_settings; defaults to the legacy 1000 px width limit
+    :return: (count, total, paths) : number of records written, number of examples read and the shard files
+    """
+    if settings is None:
+        settings = record_settings()
+    paths = shard_paths(program_data_folder, mode, num_shards)
+    writers = [tfrecord_io.TFRecordWriter(path, index=True) for path in paths]
+    counter = 0
+    total = 0
+    hits = 0
+    examples = iter(examples)
+
+    with Pool(processes=num_workers) as pool:
+        while True:
+            batch = list(islice(examples, batch_size))
+            if len(batch) == 0:
+                break
+            total += len(batch)
+
+            if record_cache is not None:
+                content_hashes = example_content_hashes(batch, record_cache.hash_cache)
+                keys = [record_key(example, mode, content_hash, settings)
+                        for example, content_hash in zip(batch, content_hashes)]
+                cached = record_cache.contains(keys)
+            else:
+                keys = [None] * len(batch)
+                cached = set()
+            misses = [example for example, key in zip(batch, keys) if key not in cached]
+            hits += len(batch) - len(misses)
+
+            built = pool.imap(serialize_example, ((example, mode, settings) for example in misses), chunksize=16)
+            for example, key in zip(batch, keys):
+                if key in cached:
+                    serialized = record_cache.get(key)
+                else:
+                    serialized = next(built)
+                    if serialized is not None and record_cache is not None:
+                        record_cache.put(key, serialized)
+
+                if serialized is not None:
+                    writers[counter % num_shards].write(serialized, example.file_name, example.num_boxes)
+                    counter += 1
+                else:
+                    #print("Error with {0}; skipping".format(example.file_name))
+                    continue
+
+    for writer in writers:
+        writer.close()
+    if record_cache is not None:
+        print("\tRecord cache: {0} hits, {1} misses".format(hits, total - hits))
+    return counter, total, paths
+
+
+def iter_mode_examples(activ_D_folder, mode, channels, files):
+    # Frames of every channel annotation file for one mode, in file order
+    for channel, file in zip(channels, files):
+        path_to_image = join(activ_D_folder, channel, mode + "Files")
+        path_to_xml = join(activ_D_folder, channel, file)
+
+        # Skip to next entry if file doesn't exist
+        if not isfile(path_to_xml):
+            print("\t{0} was not located; skipping".format(path_to_xml))
+            continue
+
+        counter = 0
+        for frame in iter_frames(path_to_xml, channel, path_to_image):
+            counter += 1
+            yield frame
+
+        print("\tProcessed {0} frames for channel {1}".format(counter, channel))
+
+
+def shuffled(examples, shuffle_mode, seed, shuffle_buffer_size, shuffle_buckets, temp_folder):
+    """
+    Shuffle the example stream. Every mode gives a reproducible order for a given seed and input.
+    memory   : load everything and shuffle uniformly (memory grows with the dataset)
+    buffer   : bounded buffer of shuffle_buffer_size examples, written as the annotations are read
+    external : spill to shuffle_buckets temporary files in temp_folder, then shuffle one bucket at a time
+    """
+    if shuffle_mode == 'buffer':
+        return buffered_shuffle(examples, shuffle_buffer_size, seed)
+    if shuffle_mode == 'external':
+        return external_shuffle(examples, shuffle_buckets, seed, temp_folder)
+    examples = list(examples)
+    # Seeded shuffle makes record order reproducible; seed None shuffles differently every run
+    Random(seed).shuffle(examples)
+    return examples
+
+
+def main(activ_D_folder, program_data_folder, num_shards=1, num_workers=None, seed=None, use_record_cache=True,
+         pipeline_config=DEFAULT_PIPELINE_CONFIG, png_compress_level=6, shuffle_mode='memory',
+         shuffle_buffer_size=10000, shuffle_buckets=64):
 
     # Use some of the test files as training examples and reserve two test batches for evaluation
     modes = ["training", "test"]
@@ -84,95 +343,38 @@ def main(activ_D_folder, program_data_folder):
                       "gtest_Fr.xml", "gtest_Rt.xml", "gtest_Tn.xml", "gtraining_Ge.xml"]
     testing_files = ["gtest_Aj.xml","gtest_Ne.xml"]
 
+    # Store images no larger than the model's image_resizer will make them
+    if pipeline_config is not None and isfile(pipeline_config):
+        resizer_bounds = load_resizer_bounds(pipeline_config)
+        print("Image resizer bounds from {0}: {1}".format(pipeline_config, resizer_bounds))
+    else:
+        if pipeline_config is not None:
+            print("Pipeline config {0} was not located; limiting image width to 1000".format(pipeline_config))
+        resizer_bounds = None
+    settings = record_settings(resizer_bounds, png_compress_level)
+
+    # Serialized records are cached by content so a rebuild only encodes new or changed frames
+    record_cache = RecordCache(join(program_data_folder, "record_cache.sqlite")) if use_record_cache else None
+
     for mode in modes:
 
-        # writer = tf.python_io.TFRecordWriter(FLAGS.output_path)
-        writer = tf.python_io.TFRecordWriter(join(program_data_folder, mode + ".tfrecord"))
         print("Processing {0} files".format(mode))
         if mode == "training":
             files = training_files
         else:
             files = testing_files
 
-        examples = list()
-
-        for channel, file in zip(channels, files):
-            path_to_image = join(activ_D_folder, channel, mode + "Files")
-            path_to_xml = join(activ_D_folder, channel, file)
-
-            # Skip to next entry if file doesn't exist
-            if not isfile(path_to_xml):
-                print("\t{0} was not located; skipping".format(path_to_xml))
-                continue
-            tree = etree.parse(path_to_xml)
-            xml_contents = tree.getroot()
-
-            counter = 0
-            for frame in xml_contents:
-
-                frame_attributes = dict()
-                frame_attributes['source'] = frame.attrib['source']
-                frame_attributes['frame_num'] = frame.attrib['id']
-                
-                # Negative sampling and Generated text have file extension in xml
-                if 'ext' in frame.attrib:
-                    frame_attributes['extension'] = frame.attrib['ext']
-                else:
-                    frame_attributes['extension'] = 'png'
-
-                frame_attributes['item_id'] = list()
-                frame_attributes['bbox_xmins'] = list()
-                frame_attributes['bbox_xmaxs'] = list()
-                frame_attributes['bbox_ymins'] = list()
-                frame_attributes['bbox_ymaxs'] = list()
-
-                for rectangle in frame:
-                    frame_attributes['item_id'].append(rectangle.attrib['id'])
-                    frame_attributes['bbox_xmins'].append(int(rectangle.attrib['x']))
-                    frame_attributes['bbox_xmaxs'].append(
-                        int(rectangle.attrib['x']) + int(rectangle.attrib['width']))
-                    frame_attributes['bbox_ymins'].append(int(rectangle.attrib['y']))
-                    frame_attributes['bbox_ymaxs'].append(
-                        int(rectangle.attrib['y']) + int(rectangle.attrib['height']))
-                
-                # File name format for ActiV is France24_vd01_frame_11.png
-                frame_attributes['file_name'] = channel + "_" + frame_attributes['source'] + "_frame_" + \
-                                                    frame_attributes['frame_num'] + "." + frame_attributes['extension']
-                if frame_attributes['extension'] in ['jpg','jpeg']:
-                    frame_attributes['image_format'] = b'jpeg' 
-                elif frame_attributes['extension'] in ['png']:
-                    frame_attributes['image_format'] = b'png'    
-                    
-                frame_attributes['path_to_image'] = path_to_image
-
-                # Add class label
-                if channel == 'Negative':
-                    frame_attributes['label'] = 'english'.encode('utf8')
-                    frame_attributes['label_num'] = 2
-                else:
-                    frame_attributes['label'] = 'arabic'.encode('utf8')
-                    frame_attributes['label_num'] = 1
-
-                counter += 1
-                examples.append(frame_attributes)
+        examples = shuffled(iter_mode_examples(activ_D_folder, mode, channels, files), shuffle_mode, seed,
+                            shuffle_buffer_size, shuffle_buckets, program_data_folder)
+        counter, len_examples, paths = write_examples(examples, mode, program_data_folder, num_shards, num_workers,
+                                                      record_cache, settings)
 
-            print("\tProcessed {0} frames for channel {1}".format(counter, channel))
+        print("Wrote {0} tfrecord entries from {1} examples to {2}".format(
+            counter, len_examples, paths[0] if num_shards == 1 else join(program_data_folder, mode + "-*.tfrecord")))
 
-        counter = 0
-        len_examples = len(examples)
-        shuffle(examples)
-        for example in examples:
-            tf_example = create_tf_example(example, mode)
-            if tf_example is not None:
-                writer.write(tf_example.SerializeToString())
-                counter += 1
-            else:
-                #print("Error with {0}; skipping".format(example['file_name']))
-                continue
-
-        print("Wrote {0} tfrecord entries from {1} examples to {2}".format(counter, len_examples,
-                                                                           join(program_data_folder, mode + ".tfrecord")))
-        writer.close()
+    if record_cache is not None:
+        removed = record_cache.close()
+        print("Removed {0} stale entries from the record cache".format(removed))
 
 
 if __name__ == '__main__':
@@ -196,15 +398,91 @@ if __name__ == '__main__':
         default="/prog/data",
         help='Location of scimitar repository data folder. Default = /prog/data')
 
+    parser.add_argument(
+        '--num_shards',
+        type=int,
+        default=1,
+        help='Number of tfrecord shards per mode, written as training-00000-of-000NN.tfrecord. Default = 1 \
+             (single training.tfrecord)')
+
+    parser.add_argument(
+        '--num_workers',
+        type=int,
+        default=None,
+        help='Number of worker processes used to build tfrecord entries. Default = number of CPUs')
+
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=None,
+        help='Seed for shuffling examples so record order is reproducible. Default = None (unseeded)')
+
+    parser.add_argument(
+        '--disable_record_cache',
+        default=False,
+        action='store_true',
+        help='Rebuild every record instead of reusing unchanged ones from program_data_folder/record_cache.sqlite. \
+             Default = False')
+
+    parser.add_argument(
+        '--pipeline_config',
+        type=str,
+        default=DEFAULT_PIPELINE_CONFIG,
+        help='Model pipeline config whose keep_aspect_ratio_resizer bounds the stored image size. \
+             Default = models/model/faster_rcnn_resnet50_coco.config')
+
+    parser.add_argument(
+        '--png_compress_level',
+        type=int,
+        default=6,
+        choices=range(10),
+        help='zlib compression level (0-9) for re-encoded PNG images. Default = 6')
+
+    parser.add_argument(
+        '--shuffle_mode',
+        type=str,
+        default='memory',
+        choices=['memory', 'buffer', 'external'],
+        help='How examples are shuffled: memory (all in RAM), buffer (bounded streaming buffer) or external \
+             (spill to temporary bucket files, then shuffle each bucket). Default = memory')
+
+    parser.add_argument(
+        '--shuffle_buffer_size',
+        type=int,
+        default=10000,
+        help='Number of examples held by --shuffle_mode buffer. Default = 10000')
+
+    parser.add_argument(
+        '--shuffle_buckets',
+        type=int,
+        default=64,
+        help='Number of temporary bucket files used by --shuffle_mode external. Default = 64')
+
     args = parser.parse_args()
     print(
         "Parameters set as: \n \
            AcTiV-D folder = {0} \n \
-           Program Data folder = {1} \n"
+           Program Data folder = {1} \n \
+           Number of Shards = {2} \n \
+           Number of Workers = {3} \n \
+           Seed = {4} \n \
+           Record Cache = {5} \n \
+           Pipeline Config = {6} \n \
+           PNG Compression Level = {7} \n \
+           Shuffle Mode = {8} \n"
         .format(
             args.activ_D_folder,
-            args.program_data_folder))
-    main(args.activ_D_folder, args.program_data_folder)
+            args.program_data_folder,
+            args.num_shards,
+            args.num_workers,
+            args.seed,
+            not args.disable_record_cache,
+            args.pipeline_config,
+            args.png_compress_level,
+            args.shuffle_mode))
+    main(args.activ_D_folder, args.program_data_folder, args.num_shards, args.num_workers, args.seed,
+         not args.disable_record_cache, args.pipeline_config, args.png_compress_level, args.shuffle_mode,
+         args.shuffle_buffer_size, args.shuffle_buckets)
     #tf.app.run()
     print("Done")
 
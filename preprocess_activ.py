@@ -1,104 +1,86 @@
 import os
-from os.path import join, isfile, isdir
+import shutil
+from os.path import join, isdir
 from PIL import Image
-from itertools import islice
-from csv import DictReader
-from urllib.request import urlretrieve
-from get_md5 import file_content_hash
-from sys import exc_info
+from download_fillers import download_filler_images
+from chip_store import ChipAtlas
+from annotation_writer import AnnotationWriter
 from global_config import ONE_IMAGE_SIZE, INPUT_HEIGHT, INPUT_WIDTH
-import cv2
-from random import seed, choice
-from collections import defaultdict
+import numpy as np
+from multiprocessing import Pool
+from concurrent.futures import ThreadPoolExecutor
+from random import Random
 import coco_text
 
 
-def redact_ticker(activ_D_folder):
+# Ticker location per AcTiV readme keyed by (channel, width, height) as (x_start, x_end, y_start, y_end)
+TICKER_REGIONS = {
+    # France24 should be 720 x 576
+    ("France24", 720, 576): (60, 665, 490, 526),
+    # Aljazeera should be 1920 x 1080
+    ("AljazeeraHD", 1920, 1080): (0, 1700, 980, 1040),
+    # Aljazeera should be 1920 x 1080 but a few are off by 8 rows
+    ("AljazeeraHD", 1920, 1088): (0, 1700, 980 + 8, 1040 + 8),
+}
+
+
+def redact_ticker(activ_D_folder, num_workers=None):
 
     # Ticker removal only pertains to AljazeeraHD and France24 per AcTiV readme
     channels = ["France24", "AljazeeraHD"]
     modes = ["training", "test"]
 
+    tasks = []
     for channel in channels:
-        print("Blocking out ticker from {0}".format(channel))
         for mode in modes:
             path_to_images = join(activ_D_folder, channel, mode + "Files")
             file_list = os.listdir(path_to_images)
             file_list = [x for x in file_list if x.endswith(".png")]
+            tasks += [(channel, join(path_to_images, x)) for x in file_list]
 
-            for image_filename in file_list:
-                arabic_image = Image.open(join(path_to_images, image_filename))
-                width, height = arabic_image.size
-
-                # Block out entire ticker with a random color
-                r_color = choice(range(0,255))
-                g_color = choice(range(0,255))
-                b_color = choice(range(0,255))
-
-                # France24 should be 720 x 576
-                if channel == "France24" and width == 720 and height == 576:
-                    for x in range(60, 665):
-                        for y in range(490, 526):
-                            arabic_image.putpixel((x, y), (r_color,g_color,b_color))
-                #Aljazeera should be 1920 x 1080
-                elif channel == "AljazeeraHD" and width == 1920 and height == 1080:
-                    for x in range(0, 1700):
-                        for y in range(980, 1040):
-                            arabic_image.putpixel((x, y), (r_color,g_color,b_color))
-                #Aljazeera should be 1920 x 1080 but a few are off
-                elif channel == "AljazeeraHD" and width == 1920 and height == 1088:
-                    for x in range(0, 1700):
-                        for y in range(980+8, 1040+8):
-                            arabic_image.putpixel((x, y), (r_color,g_color,b_color))
-                else:
-                    print("Warning: {0} has unexpected shape {1}".format(image_filename,arabic_image.size))
-
-                arabic_image.save(join(path_to_images, image_filename))
-
-
-def generate_training_data(activ_D_folder, activ_R_folder, ALIF_folder, filler_images_file, data_generation_limit=1000):
+    print("Blocking out ticker from {0} images in {1}".format(len(tasks), ", ".join(channels)))
 
-    # Get filler images from openimages dataset
-    fieldnames = ['ImageID', 'Subset', 'OriginalURL', 'OriginalLandingURL', 'License', 'AuthorProfileURL', 'Author', \
-                  'Title', 'OriginalSize', 'OriginalMD5', 'Thumbnail300KURL']
-    downloaded_folder = join(activ_D_folder,"Downloaded")
-    if not isdir(downloaded_folder): os.mkdir(downloaded_folder)
-    filler_images = []
-    counter = 0
+    # Each image is independent so fan out over channels, modes and files
+    with Pool(processes=num_workers) as pool:
+        for warning in pool.imap_unordered(redact_ticker_image, tasks, chunksize=16):
+            if warning is not None:
+                print(warning)
 
-    with open(filler_images_file, 'r', encoding='latin-1') as f:
-        filler_images_dict = DictReader(f, fieldnames=fieldnames)
 
-        for line in islice(filler_images_dict, 1, data_generation_limit):
+def redact_ticker_image(task):
 
-            candidate_file_name = join(downloaded_folder,line['OriginalURL'].split('/')[-1])
+    channel, image_path = task
+    arabic_image = Image.open(image_path)
+    width, height = arabic_image.size
 
-            try:
+    region = TICKER_REGIONS.get((channel, width, height))
+    if region is None:
+        return "Warning: {0} has unexpected shape {1}".format(os.path.basename(image_path), arabic_image.size)
+
+    if arabic_image.mode not in ("RGB", "RGBA"):
+        arabic_image = arabic_image.convert("RGB")
 
-                # Check if file has already been downloaded
-                if isfile(candidate_file_name) and line['OriginalMD5'] == file_content_hash(candidate_file_name):
-                    #print("Verified {0}".format(line['OriginalURL']))
-                    filler_images.append(candidate_file_name)
-                    counter += 1
+    # Block out entire ticker with a random color; seeded by file name so reruns are repeatable
+    rand = Random(os.path.basename(image_path))
+    color = [rand.choice(range(0, 255)) for _ in range(3)]
+    if arabic_image.mode == "RGBA":
+        color.append(255)
 
-                # Download file and test hash
-                else:
-                    urlretrieve(line['OriginalURL'], candidate_file_name)
+    x_start, x_end, y_start, y_end = region
+    pixels = np.array(arabic_image)
+    pixels[y_start:y_end, x_start:x_end] = color
+    Image.fromarray(pixels).save(image_path)
 
-                    if line['OriginalMD5'] != file_content_hash(candidate_file_name):
-                        os.remove(candidate_file_name)
-                        #print("Warning - {0} did not match expected hash; skipping".format(line['OriginalURL']))
-                    else:
-                        #print("Downloaded {0}".format(line['OriginalURL']))
-                        filler_images.append(candidate_file_name)
-                        counter += 1
+    return None
 
-            except:
-                print("Error - ", exc_info())
-                continue
 
-            if counter % 1000 ==0 and counter !=0:
-                print("Downloaded {0} Open Images".format(counter))
+def generate_training_data(activ_D_folder, activ_R_folder, ALIF_folder, filler_images_file, data_generation_limit=1000,
+                           num_download_workers=16, num_workers=None, generation_seed=41, resume=False):
+
+    # Get filler images from openimages dataset
+    downloaded_folder = join(activ_D_folder,"Downloaded")
+    filler_images = download_filler_images(filler_images_file, downloaded_folder, data_generation_limit,
+                                           num_download_workers)
 
     print("Number of Open Images:", len(filler_images))
 
@@ -112,7 +94,8 @@ def generate_training_data(activ_D_folder, activ_R_folder, ALIF_folder, filler_i
         for mode in modes:
             path_to_chips = join(activ_R_folder, channel, mode + "Files", "images/")
             if isdir(path_to_chips):
-                file_list = os.listdir(path_to_chips)
+                # Sort so chip triplets do not depend on directory listing order
+                file_list = sorted(os.listdir(path_to_chips))
                 file_list = [join(path_to_chips, x) for x in file_list if x.endswith(".png")]
                 arabic_chips += file_list
 
@@ -122,7 +105,7 @@ def generate_training_data(activ_D_folder, activ_R_folder, ALIF_folder, filler_i
     for mode in modes:
         path_to_chips = join(ALIF_folder, mode)
         if isdir(path_to_chips):
-            file_list = os.listdir(path_to_chips)
+            file_list = sorted(os.listdir(path_to_chips))
             file_list = [join(path_to_chips, x) for x in file_list if x.endswith(".jpg")]
             arabic_chips += file_list
 
@@ -134,7 +117,11 @@ def generate_training_data(activ_D_folder, activ_R_folder, ALIF_folder, filler_i
     arabic_chip_triplets = []
     for i in range(step):
         # triplets
-        arabic_chip_triplets.append([arabic_chips[i],arabic_chips[i+step],arabic_chips[i+2*step]])
+        arabic_chip_triplets.append([i, i+step, i+2*step])
+
+    # Decode the chip inventory once into a memory mapped atlas that every worker shares
+    atlas_prefix = join(activ_D_folder, "chip_atlas")
+    ChipAtlas.load_or_build(atlas_prefix, arabic_chips, num_workers)
 
     # Create a folder to store generated images
     generated_folder = join(activ_D_folder,"Generated")
@@ -143,116 +130,177 @@ def generate_training_data(activ_D_folder, activ_R_folder, ALIF_folder, filler_i
     if not isdir(join(generated_folder,"trainingFiles")):
         os.mkdir(join(generated_folder,"trainingFiles"))
 
-    seed(41)
-    counter = 0
-    # Start XML file text
-    xml_file_output = '''<?xml version="1.0" encoding="UTF-8"?>\n\n<Protocol4 channel="Generated">\n\n'''
+    # Annotations stream to disk as samples finish so a long run can be resumed from its last checkpoint
+    with AnnotationWriter(join(generated_folder, "gtraining_Ge.xml"), "Generated", resume) as writer:
+        start = writer.frames_written
+        tasks = ((counter, filler_image, chip_triplet, generated_folder, generation_seed)
+                 for counter, (filler_image, chip_triplet) in enumerate(zip(filler_images, arabic_chip_triplets))
+                 if counter >= start)
 
-    # Put activR and ALIF chips into openimage candidates
-    # for filler_image, arabic_chip in zip(filler_images,arabic_chips):
-    for filler_image, arabic_chips in zip(filler_images, arabic_chip_triplets):
+        # Put activR and ALIF chips into openimage candidates. Every sample seeds its own randomness from its index,
+        # so the ordered results are identical no matter how many workers there are or where a run resumed
+        with Pool(processes=num_workers, initializer=init_generation_worker, initargs=(atlas_prefix,)) as pool:
+            for counter, (suffix, rectangles) in enumerate(pool.imap(generate_sample, tasks, chunksize=8), start + 1):
+                writer.add_frame(counter - 1, suffix, rectangles)
 
-        filler = cv2.imread(filler_image)
-        suffix = filler_image[filler_image.rfind(".")+1:]
-
-        if ONE_IMAGE_SIZE:
-            # Resize openimage candidates to INPUT_HEIGHT, INPUT_WIDTH to align with AcTiV-D dataset
-            resized_filler = cv2.resize(filler, (INPUT_WIDTH, INPUT_HEIGHT), interpolation=cv2.INTER_LINEAR)
-        else:
-            # Control for extra large images because inserted arabic chip becomes unreadable
-            filler_rows, filler_cols, _ = filler.shape
-            # Input shape for resnet50 and resnet inception is 600x1024
-            if filler_rows > 1000 or filler_cols > 1000:
-                new_dims = choice(range(600,1001,2))
-                resized_filler = cv2.resize(filler, (new_dims, new_dims), interpolation=cv2.INTER_LINEAR)
-            else:
-                resized_filler = filler
-
-        resized_filler_rows, resized_filler_cols, _ = resized_filler.shape
-
-        #xml_file_output += '''<frame source="vd00" id="{0}">'''.format(str(counter))
-        xml_file_output += '''<frame source="vd00" id="{0}" ext="{1}">\n'''.format(str(counter),suffix)
-        pixels_used = defaultdict(bool)
-        rectangle_num = 0
-
-        for arabic_chip in arabic_chips:
-
-            rectangle_num +=1
-            chip = cv2.imread(arabic_chip)
-            chip_rows, chip_cols, _ = chip.shape
-            column_placement_list = list(range(0, resized_filler_cols - chip_cols))
-            row_placement_list = list(range(0, resized_filler_rows - chip_rows))
-
-            # If chip is too big (likely too long) for image then use as negative training example
-            if len(column_placement_list) == 0 or len(row_placement_list) == 0:
-                continue
-
-            # Chip fits in Filler Image
-            else:
-                placed_chip = False
-                attempts = 0
-                # Look for location to place chip that doesn't overlap with previous chips
-                while not placed_chip and attempts < 50:
-                    chip_column_start = choice(column_placement_list)
-                    chip_row_start = choice(row_placement_list)
-
-                    use_columns = range(chip_column_start, chip_column_start + chip_cols)
-                    use_rows = range(chip_row_start, chip_row_start + chip_rows)
-
-                    placed_chip = check_pixels_used(pixels_used,use_columns,use_rows)
-                    attempts += 1
-
-                # Continue to next chip if this chip was not placed after max attempts
-                if not placed_chip:
-                    continue
-
-                # Blend chip into filler background image
-                background = resized_filler[chip_row_start:chip_row_start + chip_rows,
-                                            chip_column_start:chip_column_start + chip_cols]
-                # Give equal weighting to reduce hard edges
-                blended = cv2.addWeighted(background, 0.3, chip, 0.7, 0)
-                resized_filler[chip_row_start:chip_row_start + chip_rows,
-                               chip_column_start:chip_column_start + chip_cols] = blended
-
-                # Record location as xml format
-                xml_file_output += '''<rectangle id="{4}" height="{0}" width="{1}" y="{2}" x="{3}"/>\n'''.format(
-                    chip_rows, chip_cols, chip_row_start, chip_column_start, rectangle_num)
-
-        xml_file_output += '''</frame>\n'''
-
-        cv2.imwrite(join(generated_folder, "trainingFiles", "Generated_vd00_frame_" + str(counter) + "." + suffix),
-                    resized_filler)
-
-        counter += 1
-        if counter % 1000 == 0:
-            print("Generated {0} training examples".format(counter))
-
-    # End XML file text
-    xml_file_output += "\n</Protocol4>"
-    #print(xml_file_output)
-    with open(join(generated_folder,"gtraining_Ge.xml"),'w') as f:
-        f.write(xml_file_output)
+                if counter % 1000 == 0:
+                    print("Generated {0} training examples".format(counter))
 
     # Print out final count
-    print("Generated {0} training examples".format(counter))
+    print("Generated {0} training examples".format(writer.frames_written))
+
 
+# Per worker process chip atlas, set up by init_generation_worker
+chip_atlas = None
 
-def check_pixels_used(pixels_used, use_columns, use_rows):
 
-    # Check if any pixel in proposed chip placement has been used. If so, return False
-    for col in use_columns:
-        for row in use_rows:
-            if pixels_used[str(col)+"_"+str(row)]:
-                return False
-    # If no conflicts exist, mark pixels as used and return True
-    for col in use_columns:
-        for row in use_rows:
-            pixels_used[str(col)+"_"+str(row)] = True
+def init_generation_worker(atlas_prefix):
+    global chip_atlas
+    chip_atlas = ChipAtlas(atlas_prefix)
 
-    return True
 
+def load_filler(filler_image, rand):
 
-def add_negative_sampling_data(activ_D_folder, COCO_folder, total_negative_samples=1000, testing_samples=100):
+    if ONE_IMAGE_SIZE:
+        # Resize openimage candidates to INPUT_HEIGHT, INPUT_WIDTH to align with AcTiV-D dataset
+        target_size = (INPUT_WIDTH, INPUT_HEIGHT)
+    else:
+        # Control for extra large images because inserted arabic chip becomes unreadable. Only the header is read to
+        # get the size; the test is symmetric so EXIF rotation does not matter
+        with Image.open(filler_image) as header:
+            filler_cols, filler_rows = header.size
+        # Input shape for resnet50 and resnet inception is 600x1024
+        if filler_rows > 1000 or filler_cols > 1000:
+            new_dims = rand.choice(range(600,1001,2))
+            target_size = (new_dims, new_dims)
+        else:
+            target_size = None
+
+    # Each filler is used by exactly one sample, so it is decoded straight into the buffer the chips are blended into
+    import cv2
+    filler = cv2.imread(filler_image)
+    if target_size is None:
+        return filler
+    return cv2.resize(filler, target_size, interpolation=cv2.INTER_LINEAR)
+
+
+def sample_random(generation_seed, counter):
+    # Independent random stream per sample derived from (global seed, sample index)
+    return Random("{0}:{1}".format(generation_seed, counter))
+
+
+def generate_sample(task):
+    # OpenCV is only imported by the stages that decode pixels, so importing this module stays cheap
+    import cv2
+
+    counter, filler_image, chip_triplet, generated_folder, generation_seed = task
+    rand = sample_random(generation_seed, counter)
+
+    suffix = filler_image[filler_image.rfind(".")+1:]
+    resized_filler = load_filler(filler_image, rand)
+
+    resized_filler_rows, resized_filler_cols, _ = resized_filler.shape
+
+    rectangles = []
+    occupancy = OccupancyGrid(resized_filler_rows, resized_filler_cols)
+    rectangle_num = 0
+
+    for chip_index in chip_triplet:
+
+        rectangle_num +=1
+        chip = chip_atlas.chip(chip_index)
+        if chip is None:
+            continue
+        chip_rows, chip_cols, _ = chip.shape
+
+        # Find location to place chip that doesn't overlap with previous chips. If chip is too big (likely too
+        # long) for image or there is no free space left, leave it out
+        placement = occupancy.place(chip_rows, chip_cols, rand)
+        if placement is None:
+            continue
+        chip_row_start, chip_column_start = placement
+
+        # Blend chip into filler background image
+        background = resized_filler[chip_row_start:chip_row_start + chip_rows,
+                                    chip_column_start:chip_column_start + chip_cols]
+        # Give equal weighting to reduce hard edges
+        blended = cv2.addWeighted(background, 0.3, chip, 0.7, 0)
+        resized_filler[chip_row_start:chip_row_start + chip_rows,
+                       chip_column_start:chip_column_start + chip_cols] = blended
+
+        # Record location for the xml annotation
+        rectangles.append((rectangle_num, chip_rows, chip_cols, chip_row_start, chip_column_start))
+
+    cv2.imwrite(join(generated_folder, "trainingFiles", "Generated_vd00_frame_" + str(counter) + "." + suffix),
+                resized_filler)
+
+    return suffix, rectangles
+
+
+class OccupancyGrid:
+    """
+    Boolean mask of filler pixels already covered by placed chips.
+    :param rows (int) : filler height
+    :param cols (int) : filler width
+    """
+    # Blind placement attempts before falling back to sampling from the exact set of free positions
+    RANDOM_ATTEMPTS = 3
+
+    def __init__(self, rows, cols):
+        self.used = np.zeros((rows, cols), dtype=bool)
+        self.empty = True
+
+    def is_free(self, row, col, chip_rows, chip_cols):
+        return not self.used[row:row + chip_rows, col:col + chip_cols].any()
+
+    def mark(self, row, col, chip_rows, chip_cols):
+        self.used[row:row + chip_rows, col:col + chip_cols] = True
+        self.empty = False
+
+    def free_positions(self, chip_rows, chip_cols, row_limit, col_limit):
+        # Count used pixels under every chip-sized window with a summed-area table; zero means the window is free
+        summed = np.zeros((self.used.shape[0] + 1, self.used.shape[1] + 1), dtype=np.int32)
+        np.cumsum(np.cumsum(self.used, axis=0, dtype=np.int32), axis=1, out=summed[1:, 1:])
+        windows = summed[chip_rows:chip_rows + row_limit, chip_cols:chip_cols + col_limit] \
+            - summed[:row_limit, chip_cols:chip_cols + col_limit] \
+            - summed[chip_rows:chip_rows + row_limit, :col_limit] \
+            + summed[:row_limit, :col_limit]
+        return np.flatnonzero(windows == 0)
+
+    def place(self, chip_rows, chip_cols, rand):
+        """
+        Pick a top left corner uniformly from the positions where the chip fits without overlapping, and mark it used.
+        :param rand (Random) : source of randomness
+        :return: (row, col) or None if the chip cannot be placed
+        """
+        # Keep the placement range used before: start positions in [0, filler size - chip size)
+        row_limit = self.used.shape[0] - chip_rows
+        col_limit = self.used.shape[1] - chip_cols
+        if row_limit <= 0 or col_limit <= 0:
+            return None
+
+        # Rejection sampling is cheap while the filler is mostly empty
+        for _ in range(1 if self.empty else self.RANDOM_ATTEMPTS):
+            row = rand.randrange(row_limit)
+            col = rand.randrange(col_limit)
+            if self.is_free(row, col, chip_rows, chip_cols):
+                self.mark(row, col, chip_rows, chip_cols)
+                return row, col
+
+        free = self.free_positions(chip_rows, chip_cols, row_limit, col_limit)
+        if len(free) == 0:
+            return None
+        row, col = divmod(int(free[rand.randrange(len(free))]), col_limit)
+        self.mark(row, col, chip_rows, chip_cols)
+        return row, col
+
+
+def add_negative_sampling_data(activ_D_folder, COCO_folder, total_negative_samples=1000, testing_samples=100,
+                               resume=False, num_workers=None, max_dimension=None):
+
+    if not os.path.isdir(COCO_folder):
+        print("COCO_folder not found at {0}".format(COCO_folder))
+        quit()
 
     # Create a folder to store negative sampling images
     negative_folder = join(activ_D_folder,"Negative")
@@ -269,6 +317,7 @@ def add_negative_sampling_data(activ_D_folder, COCO_folder, total_negative_sampl
                              catIds=[('legibility', 'legible'),
                                      ('class', 'machine printed'),
                                      ('language', 'english')])[:total_negative_samples+testing_samples])
+    columns = ct.columns()
 
     modes = ["training", "test"]
 
@@ -281,51 +330,34 @@ def add_negative_sampling_data(activ_D_folder, COCO_folder, total_negative_sampl
             print("unknown mode; quitting")
             quit()
 
-        # Start XML file text
-        xml_file_output = '''<?xml version="1.0" encoding="UTF-8"?>\n\n<Protocol4 channel="Negative">\n\n'''
-
-        counter = 0
-
-        for negative_image_dict in negative_images_subset:
-            #xml_file_output += '''<frame source="vd00" id="{0}">'''.format(str(counter))
-
-            if not os.path.isdir(COCO_folder):
-                print("COCO_folder not found at {0}".format(COCO_folder))
-                quit()
-            
-            # Make path to COCO train2014 folder to load image
-            negative_image = cv2.imread(join(COCO_folder,negative_image_dict['file_name']))
-            suffix = negative_image_dict['file_name'][negative_image_dict['file_name'].rfind(".")+1:]
-            xml_file_output += '''<frame source="vd00" id="{0}" ext="{1}">\n'''.format(str(counter),suffix)
-            
-            # Get annotations
-            annIds = ct.getAnnIds(imgIds=negative_image_dict['id'])
-            anns = ct.loadAnns(annIds)
-            rectangle_num = 0
-
-            for ann in anns:
-                rectangle_num += 1
-                # Per COCO-Text “bbox” : [x,y,width,height],
-                x, y, width, height = ann['bbox']
-                xml_file_output += '''<rectangle id="{4}" height="{0}" width="{1}" y="{2}" x="{3}"/>\n'''.format(
-                    int(height), int(width), int(y), int(x), rectangle_num)
-
-            xml_file_output += '''</frame>\n'''
-
-            # Save in Negative folder under AcTiV-D
-            cv2.imwrite(join(negative_folder, mode+"Files", "Negative_vd00_frame_" + str(counter) + "." + suffix),
-                        negative_image)
-
-            counter += 1
-            if counter % 200 == 0 and counter != total_negative_samples and counter != testing_samples:
-                print("Added {0} negative {1} examples".format(counter,mode))
-
-        # End XML file text
-        xml_file_output += "\n</Protocol4>"
-
-        #print(xml_file_output)
-        with open(join(negative_folder,"g"+mode+"_Ne.xml"),'w') as f:
-            f.write(xml_file_output)
+        # Annotations stream to disk; with resume the frames covered by the last checkpoint are skipped
+        with AnnotationWriter(join(negative_folder, "g"+mode+"_Ne.xml"), "Negative", resume) as writer:
+            start = writer.frames_written
+            tasks = []
+            for counter, negative_image_dict in enumerate(negative_images_subset[start:], start):
+                suffix = negative_image_dict['file_name'][negative_image_dict['file_name'].rfind(".")+1:]
+                # Make path to COCO train2014 folder and the destination in the Negative folder under AcTiV-D
+                tasks.append((join(COCO_folder, negative_image_dict['file_name']),
+                              join(negative_folder, mode+"Files", "Negative_vd00_frame_" + str(counter) + "." + suffix),
+                              max_dimension))
+
+            # Images are linked or copied unchanged on a thread pool; results come back in order for the xml
+            with ThreadPoolExecutor(max_workers=num_workers) as executor:
+                for counter, (negative_image_dict, scale) in enumerate(
+                        zip(negative_images_subset[start:], executor.map(import_image, tasks)), start):
+                    suffix = negative_image_dict['file_name'][negative_image_dict['file_name'].rfind(".")+1:]
+
+                    # Get annotation boxes; per COCO-Text “bbox” : [x,y,width,height], truncated to int pixels
+                    bboxes = columns.imgBboxes(negative_image_dict['id'])
+                    if scale != 1.0:
+                        bboxes = bboxes * scale
+                    rectangles = [(rectangle_num, height, width, y, x) for rectangle_num, (x, y, width, height)
+                                  in enumerate(bboxes.astype(np.int64).tolist(), 1)]
+                    writer.add_frame(counter, suffix, rectangles)
+
+                    if (counter + 1) % 200 == 0 and counter + 1 != total_negative_samples and \
+                            counter + 1 != testing_samples:
+                        print("Added {0} negative {1} examples".format(counter + 1, mode))
 
         # Print out final count
         if mode == 'training':
@@ -334,20 +366,82 @@ def add_negative_sampling_data(activ_D_folder, COCO_folder, total_negative_sampl
             print("Added {0} negative {1} examples".format(testing_samples, mode))
 
 
+def import_image(task):
+
+    # Bring a source image into the dataset, returning the scale applied to it. The size comes from the image header
+    # and pixels are only decoded when a resize is needed; otherwise the original bytes are kept so there is no
+    # re-encoding loss. The test is symmetric so EXIF rotation does not matter
+    source, destination, max_dimension = task
+
+    if max_dimension is not None:
+        with Image.open(source) as header:
+            longest = max(header.size)
+        if longest > max_dimension:
+            import cv2
+            image = cv2.imread(source)
+            rows, cols, _ = image.shape
+            scale = max_dimension / float(max(rows, cols))
+            image = cv2.resize(image, (int(round(cols * scale)), int(round(rows * scale))),
+                               interpolation=cv2.INTER_AREA)
+            if os.path.lexists(destination):
+                os.remove(destination)
+            cv2.imwrite(destination, image)
+            return scale
+
+    link_or_copy(source, destination)
+    return 1.0
+
+
+def link_or_copy(source, destination):
+
+    # Replace rather than write through an existing destination, which may be a hard link to the source
+    if os.path.lexists(destination):
+        os.remove(destination)
+
+    # Hard link when source and destination share a file system
+    try:
+        os.link(source, destination)
+        return
+    except OSError:
+        pass
+
+    # copy_file_range lets the kernel reflink or copy without moving bytes through user space
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        if hasattr(os, 'copy_file_range'):
+            try:
+                remaining = os.fstat(src.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+                if remaining == 0:
+                    return
+            except OSError:
+                pass
+            src.seek(0)
+            dst.seek(0)
+            dst.truncate()
+        shutil.copyfileobj(src, dst, 1 << 20)
+
+
 def main(remove_ticker, generate_data, data_generation_limit, activ_D_folder, activ_R_folder, ALIF_folder,
-         filler_images_file, add_negative_sampling, negative_sample_limit, COCO_folder):
+         filler_images_file, add_negative_sampling, negative_sample_limit, COCO_folder, num_workers=None,
+         num_download_workers=16, generation_seed=41, resume=False, negative_max_dimension=None):
 
     # PART 1 - Block out box over ticker in aljazeera and france24 pictures per readme instructions
     if remove_ticker:
-        redact_ticker(activ_D_folder)
+        redact_ticker(activ_D_folder, num_workers)
 
     # PART 2 - Generate new training examples by combining openimages data with AcTiV recognition chips
     if generate_data:
-        generate_training_data(activ_D_folder, activ_R_folder, ALIF_folder, filler_images_file, data_generation_limit)
+        generate_training_data(activ_D_folder, activ_R_folder, ALIF_folder, filler_images_file, data_generation_limit,
+                               num_download_workers, num_workers, generation_seed, resume=resume)
 
     # PART 3 - Add negative sampling images with non-Arabic text
     if add_negative_sampling:
-        add_negative_sampling_data(activ_D_folder, COCO_folder, negative_sample_limit)
+        add_negative_sampling_data(activ_D_folder, COCO_folder, negative_sample_limit, resume=resume,
+                                   num_workers=num_workers, max_dimension=negative_max_dimension)
 
 
 if __name__ == '__main__':
@@ -418,6 +512,37 @@ if __name__ == '__main__':
         default=2000,
         help='Limit of number of negative samples to add to training from COCO-text. Default = 2000')
 
+    parser.add_argument(
+        '--num_workers',
+        type=int,
+        default=None,
+        help='Number of worker processes used for preprocessing. Default = number of CPUs')
+
+    parser.add_argument(
+        '--num_download_workers',
+        type=int,
+        default=16,
+        help='Number of concurrent Open Images downloads. Default = 16')
+
+    parser.add_argument(
+        '--generation_seed',
+        type=int,
+        default=41,
+        help='Seed for generated data; each sample derives its randomness from this seed and its index. Default = 41')
+
+    parser.add_argument(
+        '--resume',
+        default=False,
+        action='store_true',
+        help='Resume interrupted data generation or negative sampling from the last annotation checkpoint. Default = False')
+
+    parser.add_argument(
+        '--negative_max_dimension',
+        type=int,
+        default=None,
+        help='Downscale negative samples whose longest side exceeds this many pixels. Default = None (images are \
+             linked or copied unchanged)')
+
     args = parser.parse_args()
     print(
         "Parameters set as: \n \
@@ -430,7 +555,12 @@ if __name__ == '__main__':
            Filler images file = {6} \n \
            Add Negative Samples = {7} \n \
            Negative Sample Limit = {8} \n \
-           COCO dataset = {9} \n"
+           COCO dataset = {9} \n \
+           Number of Workers = {10} \n \
+           Number of Download Workers = {11} \n \
+           Generation Seed = {12} \n \
+           Resume = {13} \n \
+           Negative Max Dimension = {14} \n"
         .format(
             args.remove_ticker,
             args.generate_data,
@@ -441,7 +571,14 @@ if __name__ == '__main__':
             args.filler_images_file,
             args.add_negative_sampling,
             args.negative_sample_limit,
-            args.COCO_folder))
+            args.COCO_folder,
+            args.num_workers,
+            args.num_download_workers,
+            args.generation_seed,
+            args.resume,
+            args.negative_max_dimension))
     main(args.remove_ticker, args.generate_data, args.data_generation_limit, args.activ_D_folder, args.activ_R_folder,
-         args.ALIF_folder, args.filler_images_file, args.add_negative_sampling, args.negative_sample_limit, args.COCO_folder)
+         args.ALIF_folder, args.filler_images_file, args.add_negative_sampling, args.negative_sample_limit, args.COCO_folder,
+         args.num_workers, args.num_download_workers, args.generation_seed, args.resume,
+         args.negative_max_dimension)
     print("Done")
\ No newline at end of file
@@ -0,0 +1,97 @@
+import os
+import json
+import hashlib
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from get_md5 import HashCache, file_content_hash
+
+# Bump when the layout of serialized records changes so old entries are never reused
+CACHE_VERSION = 1
+
+
+def example_content_hashes(examples, hash_cache, num_workers=8):
+    # MD5 of each example image, None when the image is missing; unchanged files come from hash_cache unread
+    def content_hash(example):
+        try:
+            return file_content_hash(os.path.join(example.path_to_image, example.file_name), hash_cache)
+        except OSError:
+            return None
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        return list(executor.map(content_hash, examples))
+
+
+def record_key(example, mode, content_hash, settings):
+    """
+    Content address of a serialized tf.train.Example: image bytes, everything from the annotation that ends up in
+    the record, and the settings that change how the image is encoded.
+    :param settings (dict) : encoding settings, e.g. USE_GRAYSCALE, ONE_IMAGE_SIZE and the resize policy
+    :return: key (str)     : hex digest, or None if the image is missing
+    """
+    if content_hash is None:
+        return None
+    key = {'version': CACHE_VERSION, 'content': content_hash, 'mode': mode, 'file_name': example.file_name,
+           'extension': example.extension, 'image_format': example.image_format.decode('ascii'),
+           'label': example.label.decode('utf-8'), 'label_num': example.label_num,
+           'boxes': [example.bbox_xmins, example.bbox_xmaxs, example.bbox_ymins, example.bbox_ymaxs],
+           'settings': settings}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class RecordCache:
+    """
+    Serialized tf.train.Example bytes keyed by record_key, stored in a SQLite file.
+    :param cache_file (str) : SQLite database, created if missing
+    """
+    def __init__(self, cache_file):
+        self.connection = sqlite3.connect(cache_file)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS records (key TEXT PRIMARY KEY, data BLOB)')
+        # Keys touched by this build are tracked in the database rather than in memory, for datasets of any size
+        self.connection.execute('CREATE TEMP TABLE used (key TEXT PRIMARY KEY)')
+        # Image checksums live next to the record cache so unchanged images are not re-read to get their key
+        self.hash_cache = HashCache(os.path.splitext(cache_file)[0] + "_md5_cache.json")
+        self.uncommitted = 0
+
+    def contains(self, keys):
+        # Batch membership test
+        found = set()
+        unique = list(set(key for key in keys if key is not None))
+        for start in range(0, len(unique), 500):
+            batch = unique[start:start + 500]
+            query = 'SELECT key FROM records WHERE key IN ({0})'.format(','.join('?' * len(batch)))
+            found.update(row[0] for row in self.connection.execute(query, batch))
+        return found
+
+    def get(self, key):
+        row = self.connection.execute('SELECT data FROM records WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        self.mark_used(key)
+        return bytes(row[0])
+
+    def put(self, key, data):
+        if key is None:
+            return
+        self.mark_used(key)
+        self.connection.execute('INSERT OR REPLACE INTO records (key, data) VALUES (?, ?)', (key, sqlite3.Binary(data)))
+        # Commit in batches so an interrupted build keeps most of its work
+        self.uncommitted += 1
+        if self.uncommitted >= 1000:
+            self.connection.commit()
+            self.uncommitted = 0
+
+    def mark_used(self, key):
+        self.connection.execute('INSERT OR IGNORE INTO used (key) VALUES (?)', (key,))
+
+    def prune(self):
+        # Drop entries not used by this build so the cache tracks the current dataset
+        return self.connection.execute('DELETE FROM records WHERE key NOT IN (SELECT key FROM used)').rowcount
+
+    def close(self, prune=True):
+        removed = self.prune() if prune else 0
+        self.connection.commit()
+        if removed > 0:
+            self.connection.execute('VACUUM')
+        self.connection.close()
+        self.hash_cache.save()
+        return removed
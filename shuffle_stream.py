@@ -0,0 +1,63 @@
+import os
+import pickle
+import tempfile
+from random import Random
+
+
+def buffered_shuffle(items, buffer_size=10000, seed=None):
+    """
+    Shuffle a stream through a bounded buffer: each incoming item replaces a random buffered item, which is emitted.
+    Memory holds at most buffer_size items; items move at most about buffer_size positions from their input order,
+    so make the buffer large compared to the runs of similar items in the input (e.g. one channel's frames).
+    :param items (iterable)   : items to shuffle
+    :param buffer_size (int)  : number of items held in memory
+    :param seed (int)         : seed for a reproducible order; None shuffles differently every run
+    """
+    rand = Random(seed)
+    buffer = []
+    for item in items:
+        if len(buffer) < buffer_size:
+            buffer.append(item)
+            continue
+        j = rand.randrange(buffer_size)
+        yield buffer[j]
+        buffer[j] = item
+
+    rand.shuffle(buffer)
+    for item in buffer:
+        yield item
+
+
+def external_shuffle(items, num_buckets=64, seed=None, temp_folder=None):
+    """
+    Uniform shuffle of a stream larger than memory in two passes. The first pass appends every item to a randomly
+    chosen temporary bucket file; the second loads one bucket at a time, shuffles it in memory and emits it. Memory
+    holds one bucket, about 1/num_buckets of the stream.
+    :param items (iterable)   : picklable items to shuffle
+    :param num_buckets (int)  : number of temporary bucket files
+    :param seed (int)         : seed for a reproducible order; None shuffles differently every run
+    :param temp_folder (str)  : where bucket files are spilled; default is the system temp folder
+    """
+    rand = Random(seed)
+    with tempfile.TemporaryDirectory(prefix="shuffle_", dir=temp_folder) as bucket_folder:
+        bucket_paths = [os.path.join(bucket_folder, "bucket_{0:05d}.pkl".format(i)) for i in range(num_buckets)]
+        buckets = [open(path, 'wb') for path in bucket_paths]
+        try:
+            for item in items:
+                pickle.dump(item, buckets[rand.randrange(num_buckets)], protocol=pickle.HIGHEST_PROTOCOL)
+        finally:
+            for bucket in buckets:
+                bucket.close()
+
+        for path in bucket_paths:
+            bucket_items = []
+            with open(path, 'rb') as bucket:
+                while True:
+                    try:
+                        bucket_items.append(pickle.load(bucket))
+                    except EOFError:
+                        break
+            os.remove(path)
+            rand.shuffle(bucket_items)
+            for item in bucket_items:
+                yield item
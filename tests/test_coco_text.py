@@ -0,0 +1,90 @@
+import json
+import itertools
+import random
+import pytest
+import coco_text
+
+LEGIBILITY = ('legible', 'illegible')
+CLASSES = ('machine printed', 'handwritten', 'others')
+LANGUAGES = ('english', 'not english', 'na')
+PROPERTIES = [
+    [],
+    [('legibility', 'legible')],
+    [('class', 'handwritten')],
+    ('language', 'english'),
+    [('legibility', 'legible'), ('class', 'machine printed')],
+    [('legibility', 'illegible'), ('class', 'others'), ('language', 'na')],
+    [['legibility', 'legible'], ['language', 'not english']],
+    [('legibility', 'unknown')],
+]
+
+
+@pytest.fixture
+def annotation_file(tmp_path):
+    # Tiny COCO-Text json with every combination of properties spread over a few images, some without anns
+    rand = random.Random(3)
+    imgs, anns, imgToAnns = {}, {}, {}
+    for img_id in range(1, 13):
+        imgs[str(img_id)] = {'id': img_id, 'set': ('train', 'val', 'test')[img_id % 3], 'file_name': str(img_id)}
+        imgToAnns[str(img_id)] = []
+    combinations = list(itertools.product(LEGIBILITY, CLASSES, LANGUAGES)) * 2
+    for ann_id, (legibility, cls, language) in enumerate(combinations, 100):
+        img_id = rand.randint(1, 9)
+        anns[str(ann_id)] = {'id': ann_id, 'image_id': img_id, 'bbox': [1, 2, rand.randint(1, 20), 10],
+                             'area': rand.randint(10, 200), 'legibility': legibility, 'class': cls,
+                             'language': language}
+        imgToAnns[str(img_id)].append(ann_id)
+    path = tmp_path / "COCO_Text.json"
+    path.write_text(json.dumps({'info': {'version': '1.4'}, 'cats': {}, 'imgs': imgs, 'anns': anns,
+                                'imgToAnns': imgToAnns}))
+    return str(path)
+
+
+def baseline_ann_ids(ct, imgIds=[], catIds=[], areaRng=[]):
+    # The full scans the category indexes replaced
+    imgIds = imgIds if type(imgIds) == list else [imgIds]
+    catIds = catIds if type(catIds) == list else [catIds]
+    anns = [annId for imgId in imgIds for annId in ct.imgToAnns.get(imgId, [])] if imgIds else list(ct.anns)
+    anns = [annId for annId in anns if all(ct.anns[annId][a] == b for (a, b) in catIds)]
+    return [annId for annId in anns if not areaRng or areaRng[0] < ct.anns[annId]['area'] < areaRng[1]]
+
+
+def baseline_img_ids(ct, imgIds=[], catIds=[]):
+    imgIds = imgIds if type(imgIds) == list else [imgIds]
+    catIds = catIds if type(catIds) == list else [catIds]
+    if not imgIds and not catIds:
+        return list(ct.imgs)
+    matching = set(ct.anns[annId]['image_id'] for annId in baseline_ann_ids(ct, catIds=catIds))
+    return list(set(imgIds) & matching if catIds else set(imgIds))
+
+
+@pytest.mark.parametrize('use_snapshot', [False, True])
+def test_queries_match_full_scan(annotation_file, use_snapshot):
+    if use_snapshot:
+        # The first load writes the snapshot, the second reads it
+        coco_text.COCO_Text(annotation_file)
+    ct = coco_text.COCO_Text(annotation_file, use_snapshot=use_snapshot)
+    all_imgs = list(ct.imgs)
+    img_filters = [[], [1, 2, 3], 5, [10, 11, 40]]
+
+    for properties in PROPERTIES:
+        for imgIds in img_filters:
+            for areaRng in ([], [50, 150]):
+                assert sorted(ct.getAnnIds(imgIds, properties, areaRng)) == \
+                    sorted(baseline_ann_ids(ct, imgIds, properties, areaRng))
+                columns = ct.columns().getAnnIds(imgIds, properties, areaRng)
+                assert sorted(columns.tolist()) == sorted(baseline_ann_ids(ct, imgIds, properties, areaRng))
+            assert sorted(ct.getImgIds(imgIds, properties)) == sorted(baseline_img_ids(ct, imgIds, properties))
+        assert sorted(ct.getImgIds(all_imgs, properties)) == sorted(baseline_img_ids(ct, all_imgs, properties))
+        assert ct.columns().getImgIds(catIds=properties).tolist() == \
+            sorted(set(ct.anns[annId]['image_id'] for annId in baseline_ann_ids(ct, catIds=properties)))
+
+
+
+def test_snapshot_keeps_dataset_and_splits(annotation_file):
+    built = coco_text.COCO_Text(annotation_file)
+    loaded = coco_text.COCO_Text(annotation_file)
+    for key in ('imgs', 'anns', 'imgToAnns'):
+        assert loaded.dataset[key] == built.dataset[key]
+    assert (loaded.train, loaded.val, loaded.test) == (built.train, built.val, built.test)
+    assert loaded.loadRes([{'image_id': 1, 'bbox': [0, 0, 2, 2]}]).dataset['imgs'] == list(built.dataset['imgs'])
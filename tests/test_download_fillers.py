@@ -0,0 +1,146 @@
+import io
+import os
+import csv
+import json
+import hashlib
+import threading
+from base64 import b64encode
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+import pytest
+from PIL import Image
+from download_fillers import FIELDNAMES, JOURNAL_FILENAME, download_filler_images
+
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    # Serves the fixture folder, records every GET, and can cut a response short
+    requests = None
+    truncated = set()
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        if self.path in self.truncated:
+            self.send_response(200)
+            self.send_header('Content-Length', '100000')
+            self.end_headers()
+            self.wfile.write(b'\xff\xd8' * 100)
+            self.close_connection = True
+            return
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server(tmp_path):
+    served = tmp_path / "served"
+    served.mkdir()
+    handler = type('Handler', (FixtureHandler,), {'requests': [], 'truncated': set()})
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), partial(handler, directory=str(served)))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd, handler, served
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def fixture_image(folder, name, color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (32, 24), color).save(buffer, format='JPEG')
+    data = buffer.getvalue()
+    (folder / name).write_bytes(data)
+    return b64encode(hashlib.md5(data).digest()).decode('ascii')
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(FIELDNAMES)
+        for image_id, url, md5 in rows:
+            writer.writerow([image_id, 'train', url, '', '', '', '', '', '0', md5, ''])
+
+
+def run(tmp_path, rows, **kwargs):
+    csv_file = tmp_path / "images.csv"
+    write_csv(csv_file, rows)
+    return download_filler_images(str(csv_file), str(tmp_path / "Downloaded"), len(rows) + 1, num_workers=4,
+                                  max_retries=0, timeout=5, **kwargs)
+
+
+def read_journal(tmp_path):
+    with open(tmp_path / "Downloaded" / JOURNAL_FILENAME) as f:
+        return {entry['url']: entry for entry in map(json.loads, f)}
+
+
+def test_downloads_verify_and_journal(tmp_path, server):
+    httpd, handler, served = server
+    base = "http://127.0.0.1:{0}/".format(httpd.server_address[1])
+    good = fixture_image(served, "good.jpg", 'red')
+    fixture_image(served, "corrupt.jpg", 'blue')
+    rows = [('a1', base + "good.jpg", good),
+            ('a2', base + "corrupt.jpg", good),
+            ('a3', base + "absent.jpg", good)]
+
+    downloaded = run(tmp_path, rows)
+
+    assert downloaded == [str(tmp_path / "Downloaded" / "good.jpg")]
+    assert (tmp_path / "Downloaded" / "good.jpg").read_bytes() == (served / "good.jpg").read_bytes()
+    assert not (tmp_path / "Downloaded" / "corrupt.jpg").exists()
+    journal = read_journal(tmp_path)
+    assert journal[base + "good.jpg"]['status'] == 'ok'
+    assert journal[base + "corrupt.jpg"]['status'] == 'bad_hash'
+    assert journal[base + "absent.jpg"]['status'] == 'missing'
+
+
+def test_resume_from_journal_makes_no_requests(tmp_path, server):
+    httpd, handler, served = server
+    base = "http://127.0.0.1:{0}/".format(httpd.server_address[1])
+    good = fixture_image(served, "good.jpg", 'red')
+    rows = [('a1', base + "good.jpg", good), ('a2', base + "absent.jpg", good)]
+
+    first = run(tmp_path, rows)
+    assert len(handler.requests) == 2
+    del handler.requests[:]
+
+    assert run(tmp_path, rows) == first
+    # Finished and permanently missing files are both settled by the journal
+    assert handler.requests == []
+
+
+def test_leftover_files_are_verified_and_journaled(tmp_path, server):
+    httpd, handler, served = server
+    base = "http://127.0.0.1:{0}/".format(httpd.server_address[1])
+    good = fixture_image(served, "good.jpg", 'red')
+    (tmp_path / "Downloaded").mkdir()
+    (tmp_path / "Downloaded" / "good.jpg").write_bytes((served / "good.jpg").read_bytes())
+
+    assert run(tmp_path, [('a1', base + "good.jpg", good)]) == [str(tmp_path / "Downloaded" / "good.jpg")]
+    assert handler.requests == []
+    assert read_journal(tmp_path)[base + "good.jpg"]['status'] == 'ok'
+
+
+def test_broken_body_leaves_no_partial_file(tmp_path, server):
+    httpd, handler, served = server
+    base = "http://127.0.0.1:{0}/".format(httpd.server_address[1])
+    good = fixture_image(served, "good.jpg", 'red')
+    handler.truncated.add("/cut.jpg")
+
+    assert run(tmp_path, [('a1', base + "cut.jpg", good), ('a2', base + "good.jpg", good)]) == \
+        [str(tmp_path / "Downloaded" / "good.jpg")]
+    assert sorted(os.listdir(tmp_path / "Downloaded")) == [JOURNAL_FILENAME, "good.jpg"]
+    assert read_journal(tmp_path)[base + "cut.jpg"]['status'] == 'failed'
+
+
+def test_shared_basenames_get_separate_files(tmp_path, server):
+    httpd, handler, served = server
+    base = "http://127.0.0.1:{0}/".format(httpd.server_address[1])
+    (served / "x").mkdir()
+    (served / "y").mkdir()
+    red = fixture_image(served / "x", "image.jpg", 'red')
+    blue = fixture_image(served / "y", "image.jpg", 'blue')
+
+    downloaded = run(tmp_path, [('a1', base + "x/image.jpg", red), ('a2', base + "y/image.jpg", blue)])
+
+    assert downloaded == [str(tmp_path / "Downloaded" / "image.jpg"), str(tmp_path / "Downloaded" / "a2_image.jpg")]
+    assert (tmp_path / "Downloaded" / "a2_image.jpg").read_bytes() == (served / "y" / "image.jpg").read_bytes()
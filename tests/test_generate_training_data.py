@@ -0,0 +1,85 @@
+import os
+import numpy as np
+import pytest
+from PIL import Image
+import preprocess_activ
+
+cv2 = pytest.importorskip('cv2')
+
+NUM_FILLERS = 20
+NUM_CHIPS = 3 * NUM_FILLERS
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    # Noise fillers, one of them large enough to be resized with a random size, and small text-like chips
+    random = np.random.RandomState(0)
+    filler_folder = tmp_path / "fillers"
+    filler_folder.mkdir()
+    fillers = []
+    for i in range(NUM_FILLERS):
+        cols, rows = (1100, 400) if i == 3 else (320, 240)
+        path = str(filler_folder / "filler_{0}.jpg".format(i))
+        Image.fromarray(random.randint(0, 256, (rows, cols, 3), dtype=np.uint8)).save(path)
+        fillers.append(path)
+
+    chip_folder = tmp_path / "activ_R" / "France24" / "trainingFiles" / "images"
+    chip_folder.mkdir(parents=True)
+    for i in range(NUM_CHIPS):
+        chip = random.randint(0, 256, (random.randint(10, 30), random.randint(40, 140), 3), dtype=np.uint8)
+        cv2.imwrite(str(chip_folder / "chip_{0:03d}.png".format(i)), chip)
+    return tmp_path, fillers
+
+
+def generate(monkeypatch, tmp_path, fillers, name, num_workers, resume=False):
+    # Downloading is covered by test_download_fillers; here the fillers are already local
+    monkeypatch.setattr(preprocess_activ, 'download_filler_images', lambda *args: list(fillers))
+    activ_D_folder = tmp_path / name
+    activ_D_folder.mkdir(exist_ok=True)
+    preprocess_activ.generate_training_data(str(activ_D_folder), str(tmp_path / "activ_R"), str(tmp_path / "ALIF"),
+                                            "unused.csv", num_workers=num_workers, generation_seed=7, resume=resume)
+    return activ_D_folder / "Generated"
+
+
+def generated_files(generated_folder):
+    return {name: (generated_folder / "trainingFiles" / name).read_bytes()
+            for name in os.listdir(generated_folder / "trainingFiles")}
+
+
+def test_output_does_not_depend_on_worker_count(monkeypatch, inputs):
+    tmp_path, fillers = inputs
+    serial = generate(monkeypatch, tmp_path, fillers, "serial", 1)
+    parallel = generate(monkeypatch, tmp_path, fillers, "parallel", 3)
+
+    assert len(generated_files(serial)) == NUM_FILLERS
+    assert generated_files(serial) == generated_files(parallel)
+    assert (serial / "gtraining_Ge.xml").read_bytes() == (parallel / "gtraining_Ge.xml").read_bytes()
+
+
+def test_resume_after_interrupted_run_matches_uninterrupted(monkeypatch, inputs):
+    tmp_path, fillers = inputs
+    reference = generate(monkeypatch, tmp_path, fillers, "reference", 2)
+
+    # A filler that cannot be decoded stops the run part way, as a crash would
+    broken = list(fillers)
+    broken[13] = str(tmp_path / "not_yet_an_image.jpg")
+    with open(broken[13], 'wb') as f:
+        f.write(b'not an image')
+    with pytest.raises(Exception):
+        generate(monkeypatch, tmp_path, broken, "resumed", 2)
+    partial = (tmp_path / "resumed" / "Generated" / "gtraining_Ge.xml").read_text()
+    # Results arrive in chunks, so the frames before the failing chunk are on disk
+    assert 0 < partial.count("<frame ") <= 13
+    assert "</Protocol4>" not in partial
+
+    os.replace(fillers[13], broken[13])
+    resumed = generate(monkeypatch, tmp_path, broken, "resumed", 2, resume=True)
+
+    assert generated_files(resumed) == generated_files(reference)
+    assert (resumed / "gtraining_Ge.xml").read_bytes() == (reference / "gtraining_Ge.xml").read_bytes()
+
+    # Resuming a finished file generates nothing and leaves it unchanged
+    os.remove(resumed / "trainingFiles" / "Generated_vd00_frame_0.jpg")
+    resumed = generate(monkeypatch, tmp_path, broken, "resumed", 2, resume=True)
+    assert not (resumed / "trainingFiles" / "Generated_vd00_frame_0.jpg").exists()
+    assert (resumed / "gtraining_Ge.xml").read_bytes() == (reference / "gtraining_Ge.xml").read_bytes()
@@ -0,0 +1,88 @@
+import os
+import struct
+import pytest
+import tfrecord_io
+from tfrecord_golden import GOLDEN_EXAMPLES, GOLDEN_RAW_RECORDS
+
+GOLDEN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "golden.tfrecord")
+
+FEATURES = {'bytes': tfrecord_io.bytes_list_feature, 'float': tfrecord_io.float_list_feature,
+            'int64': tfrecord_io.int64_list_feature}
+
+
+def encode(features):
+    return tfrecord_io.encode_example({name: FEATURES[kind](values) for name, (kind, values) in features.items()})
+
+
+def golden_frames():
+    # (length bytes, length crc, data, data crc) of each record, split by hand rather than by read_records
+    with open(GOLDEN_FILE, 'rb') as f:
+        data = f.read()
+    frames = []
+    offset = 0
+    while offset < len(data):
+        length_bytes = data[offset:offset + 8]
+        length, length_crc = struct.unpack('<QI', data[offset:offset + 12])
+        record = data[offset + 12:offset + 12 + length]
+        data_crc, = struct.unpack('<I', data[offset + 12 + length:offset + 16 + length])
+        frames.append((length_bytes, length_crc, record, data_crc))
+        offset += length + 16
+    return frames
+
+
+@pytest.fixture(params=['native', 'numpy'])
+def crc_backend(request, monkeypatch):
+    # Run against both the optional crc32c package and the NumPy fallback
+    if request.param == 'native':
+        if tfrecord_io._native_crc32c is None:
+            pytest.skip("crc32c package not installed")
+    else:
+        monkeypatch.setattr(tfrecord_io, '_native_crc32c', None)
+    return request.param
+
+
+def test_crc32c_check_values(crc_backend):
+    assert tfrecord_io.crc32c(b'123456789') == 0xE3069283
+    assert tfrecord_io.crc32c(b'\x00' * 32) == 0x8A9136AA
+    assert tfrecord_io.crc32c(b'\xff' * 32) == 0x62A8AB43
+    # Vectorized path agrees with the table loop
+    data = bytes((i * 31 + 7) & 0xFF for i in range(3 * tfrecord_io.VECTORIZE_THRESHOLD + 5))
+    assert tfrecord_io._crc32c_vectorized(data) == tfrecord_io._crc32c_update(0xFFFFFFFF, data) ^ 0xFFFFFFFF
+
+
+def test_examples_match_tensorflow_serialization():
+    records = [record for _, _, record, _ in golden_frames()]
+    assert len(records) == len(GOLDEN_EXAMPLES) + len(GOLDEN_RAW_RECORDS)
+    for features, record in zip(GOLDEN_EXAMPLES, records):
+        assert encode(features) == record
+
+
+def test_checksums_match_tensorflow(crc_backend):
+    for length_bytes, length_crc, record, data_crc in golden_frames():
+        assert tfrecord_io.masked_crc32c(length_bytes) == length_crc
+        assert tfrecord_io.masked_crc32c(record) == data_crc
+
+
+def test_writer_output_is_byte_identical(tmp_path, crc_backend):
+    path = str(tmp_path / "written.tfrecord")
+    with tfrecord_io.TFRecordWriter(path, index=True) as writer:
+        for features in GOLDEN_EXAMPLES:
+            writer.write(encode(features))
+        for record in GOLDEN_RAW_RECORDS:
+            writer.write(record)
+
+    with open(path, 'rb') as written, open(GOLDEN_FILE, 'rb') as golden:
+        assert written.read() == golden.read()
+    with tfrecord_io.IndexedTFRecordFile(path) as indexed:
+        assert [indexed.read(i) for i in range(len(indexed))] == list(tfrecord_io.read_records(GOLDEN_FILE))
+
+
+def test_reader_rejects_corrupt_records(tmp_path):
+    with open(GOLDEN_FILE, 'rb') as f:
+        data = bytearray(f.read())
+    data[20] ^= 0x01
+    path = str(tmp_path / "corrupt.tfrecord")
+    with open(path, 'wb') as f:
+        f.write(data)
+    with pytest.raises(IOError):
+        list(tfrecord_io.read_records(path))
@@ -0,0 +1,75 @@
+"""
+Examples in tests/data/golden.tfrecord. The file was written by TensorFlow from these same values; regenerate it
+(only needed if the examples change) in an environment with TensorFlow installed:
+
+    python3 tests/tfrecord_golden.py tests/data/golden.tfrecord
+"""
+
+# Stand-in for encoded image bytes; the records only carry them, so they need not decode
+FAKE_PNG = b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 2
+
+# Feature name -> (type, values), in the shape parse_activ.create_tf_example writes
+GOLDEN_EXAMPLES = [
+    {
+        'image/height': ('int64', [1080]),
+        'image/width': ('int64', [1920]),
+        'image/filename': ('bytes', [b'France24_vd01_frame_11.png']),
+        'image/source_id': ('bytes', [b'France24_vd01_frame_11.png']),
+        'image/encoded': ('bytes', [FAKE_PNG]),
+        'image/format': ('bytes', [b'png']),
+        'image/object/bbox/xmin': ('float', [0.1, 0.25]),
+        'image/object/bbox/xmax': ('float', [0.5, 0.75]),
+        'image/object/bbox/ymin': ('float', [0.05, 0.8]),
+        'image/object/bbox/ymax': ('float', [0.15, 0.9]),
+        'image/object/class/text': ('bytes', [b'arabic', b'english']),
+        'image/object/class/label': ('int64', [1, 2]),
+    },
+    {
+        # Negative example without boxes: empty lists
+        'image/height': ('int64', [480]),
+        'image/width': ('int64', [640]),
+        'image/filename': ('bytes', [b'Negative_vd00_frame_0.jpg']),
+        'image/encoded': ('bytes', [b'\xff\xd8\xff\xe0']),
+        'image/object/bbox/xmin': ('float', []),
+        'image/object/class/text': ('bytes', []),
+        'image/object/class/label': ('int64', []),
+    },
+    {
+        # Varint, float and string edge cases
+        'image/filename': ('bytes', ['فرانس24_frame_3.png'.encode('utf-8'), b'']),
+        'int64/edges': ('int64', [0, 1, 127, 128, 300, 16383, 16384, -1, -300, 2 ** 63 - 1, -2 ** 63]),
+        'float/edges': ('float', [0.0, -0.0, 1.5, -2.75, 3.0e38, 1.0e-40, 0.1]),
+    },
+    {
+        # Long enough for the vectorized CRC32C path of tfrecord_io
+        'image/encoded': ('bytes', [bytes((i * 7 + 3) & 0xFF for i in range(20000))]),
+        'image/format': ('bytes', [b'jpeg']),
+    },
+]
+
+# Records framed as they are, not tf.train.Examples
+GOLDEN_RAW_RECORDS = [b'', b'not an example']
+
+
+def tensorflow_example(features):
+    import tensorflow as tf
+    feature = {}
+    for name, (kind, values) in features.items():
+        if kind == 'bytes':
+            feature[name] = tf.train.Feature(bytes_list=tf.train.BytesList(value=values))
+        elif kind == 'float':
+            feature[name] = tf.train.Feature(float_list=tf.train.FloatList(value=values))
+        else:
+            feature[name] = tf.train.Feature(int64_list=tf.train.Int64List(value=values))
+    return tf.train.Example(features=tf.train.Features(feature=feature)).SerializeToString(deterministic=True)
+
+
+if __name__ == '__main__':
+    import sys
+    import tensorflow as tf
+
+    with tf.io.TFRecordWriter(sys.argv[1]) as writer:
+        for features in GOLDEN_EXAMPLES:
+            writer.write(tensorflow_example(features))
+        for record in GOLDEN_RAW_RECORDS:
+            writer.write(record)
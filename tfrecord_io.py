@@ -0,0 +1,341 @@
+import os
+import mmap
+import struct
+from random import Random
+import numpy as np
+
+try:
+    # Optional C implementation; the NumPy fallback below produces the same checksums
+    from crc32c import crc32c as _native_crc32c
+except ImportError:
+    _native_crc32c = None
+
+# Reflected Castagnoli polynomial used by TFRecord framing
+CRC32C_POLY = 0x82F63B78
+CRC_MASK_DELTA = 0xA282EAD8
+# Below this many bytes a plain table loop is faster than setting up the vectorized lanes
+VECTORIZE_THRESHOLD = 4096
+
+
+def _crc32c_table():
+    table = np.arange(256, dtype=np.uint32)
+    for _ in range(8):
+        table = np.where(table & 1, (table >> np.uint32(1)) ^ np.uint32(CRC32C_POLY), table >> np.uint32(1))
+    return table
+
+
+CRC32C_TABLE = _crc32c_table()
+_CRC32C_TABLE_LIST = CRC32C_TABLE.tolist()
+
+
+def _crc32c_update(crc, data):
+    # Byte at a time register update without the initial/final inversion
+    table = _CRC32C_TABLE_LIST
+    for byte in data:
+        crc = table[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc
+
+
+def _crc32c_vectorized(data):
+    """
+    CRC32C of a large buffer. The buffer is cut into equal chunks whose registers are advanced together, one byte
+    column per NumPy step, and then folded back in order. Since the register update is linear, the register
+    after chunk i is zeros(chunk_len)(register before) ^ register of chunk i started from zero. The zero operator
+    is found by advancing 32 extra lanes, started from the basis vectors over zero bytes.
+    """
+    data = np.frombuffer(data, dtype=np.uint8)
+    lanes = int(min(8192, max(64, 2 * np.sqrt(len(data)))))
+    chunk_len = len(data) // lanes
+    columns = np.zeros((chunk_len, lanes + 32), dtype=np.uint32)
+    columns[:, :lanes] = data[:lanes * chunk_len].reshape(lanes, chunk_len).T
+
+    registers = np.zeros(lanes + 32, dtype=np.uint32)
+    registers[lanes:] = np.left_shift(np.uint32(1), np.arange(32, dtype=np.uint32))
+    eight = np.uint32(8)
+    low_byte = np.uint32(0xFF)
+    for column in columns:
+        registers = CRC32C_TABLE[(registers ^ column) & low_byte] ^ (registers >> eight)
+
+    # Byte tables of the zero operator so applying it is four lookups
+    basis_images = registers[lanes:]
+    bits = (np.arange(256)[:, None] >> np.arange(8)) & 1
+    shift_tables = [np.bitwise_xor.reduce(np.where(bits, basis_images[8 * k:8 * k + 8], 0), axis=1).tolist()
+                    for k in range(4)]
+    t0, t1, t2, t3 = shift_tables
+
+    crc = 0xFFFFFFFF
+    for register in registers[:lanes].tolist():
+        crc = t0[crc & 0xFF] ^ t1[(crc >> 8) & 0xFF] ^ t2[(crc >> 16) & 0xFF] ^ t3[crc >> 24] ^ register
+    crc = _crc32c_update(crc, data[lanes * chunk_len:].tobytes())
+    return crc ^ 0xFFFFFFFF
+
+
+def crc32c(data):
+    # CRC-32C (Castagnoli) checksum of a bytes-like object
+    if _native_crc32c is not None:
+        return _native_crc32c(data)
+    if len(data) < VECTORIZE_THRESHOLD:
+        return _crc32c_update(0xFFFFFFFF, bytes(data)) ^ 0xFFFFFFFF
+    return _crc32c_vectorized(data)
+
+
+def masked_crc32c(data):
+    # TFRecord stores a rotated and offset checksum so CRCs of data containing CRCs stay well distributed
+    crc = crc32c(data)
+    return (((crc >> 15) | (crc << 17)) + CRC_MASK_DELTA) & 0xFFFFFFFF
+
+
+INDEX_SUFFIX = ".index"
+
+
+class TFRecordWriter:
+    """
+    Writes TFRecord files without TensorFlow. Each record is framed as
+    uint64 length, uint32 masked CRC32C of the length, data, uint32 masked CRC32C of the data (all little endian),
+    the same layout tf.python_io.TFRecordWriter produces with no compression.
+
+    With index=True a sidecar <path>.index gets one tab separated line per record:
+    byte offset of the record frame, data length, number of boxes, image file name.
+    :param path (str)    : output file
+    :param index (bool)  : also write the <path>.index sidecar
+    """
+    def __init__(self, path, index=False):
+        self.file = open(path, 'wb')
+        self.index = open(path + INDEX_SUFFIX, 'w') if index else None
+        self.offset = 0
+
+    def write(self, record, filename='', num_boxes=0):
+        length = struct.pack('<Q', len(record))
+        self.file.write(length)
+        self.file.write(struct.pack('<I', masked_crc32c(length)))
+        self.file.write(record)
+        self.file.write(struct.pack('<I', masked_crc32c(record)))
+        if self.index is not None:
+            self.index.write("{0}\t{1}\t{2}\t{3}\n".format(self.offset, len(record), num_boxes, filename))
+        self.offset += len(record) + 16
+
+    def close(self):
+        self.file.close()
+        if self.index is not None:
+            self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_records(path, verify=True):
+    # Yields the raw records of a TFRecord file, checking both checksums unless verify is False
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(12)
+            if len(header) == 0:
+                return
+            if len(header) < 12:
+                raise IOError("Truncated record header in {0}".format(path))
+            length, length_crc = struct.unpack('<QI', header)
+            if verify and masked_crc32c(header[:8]) != length_crc:
+                raise IOError("Corrupt record length in {0}".format(path))
+            record = f.read(length)
+            footer = f.read(4)
+            if len(record) < length or len(footer) < 4:
+                raise IOError("Truncated record in {0}".format(path))
+            if verify and masked_crc32c(record) != struct.unpack('<I', footer)[0]:
+                raise IOError("Corrupt record data in {0}".format(path))
+            yield record
+
+
+class IndexedTFRecordFile:
+    """
+    Random access into a TFRecord file through its .index sidecar. The file is memory mapped, so fetching a record
+    is a slice of the map: O(1) and no reads beyond the record's own pages. Files without a sidecar (e.g. written by
+    TensorFlow) are indexed by walking the record headers once; file names and box counts are then unknown.
+    :param path (str)    : TFRecord file
+    :param verify (bool) : check the data checksum of every record read
+    """
+    def __init__(self, path, verify=True):
+        self.path = path
+        self.verify = verify
+        if os.path.isfile(path + INDEX_SUFFIX):
+            self.offsets, self.lengths, self.num_boxes, self.filenames = self.load_index(path + INDEX_SUFFIX)
+        else:
+            self.offsets, self.lengths = self.scan_offsets(path)
+            self.num_boxes = np.full(len(self.offsets), -1, dtype=np.int64)
+            self.filenames = [''] * len(self.offsets)
+
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else b''
+
+    @staticmethod
+    def load_index(index_path):
+        offsets, lengths, num_boxes, filenames = [], [], [], []
+        with open(index_path, 'r') as f:
+            for line in f:
+                offset, length, boxes, filename = line.rstrip('\n').split('\t', 3)
+                offsets.append(int(offset))
+                lengths.append(int(length))
+                num_boxes.append(int(boxes))
+                filenames.append(filename)
+        return (np.array(offsets, dtype=np.int64), np.array(lengths, dtype=np.int64),
+                np.array(num_boxes, dtype=np.int64), filenames)
+
+    @staticmethod
+    def scan_offsets(path):
+        # Hop from header to header without reading record data
+        offsets, lengths = [], []
+        with open(path, 'rb') as f:
+            offset = 0
+            header = f.read(8)
+            while len(header) == 8:
+                length = struct.unpack('<Q', header)[0]
+                offsets.append(offset)
+                lengths.append(length)
+                offset += length + 16
+                f.seek(offset)
+                header = f.read(8)
+        return np.array(offsets, dtype=np.int64), np.array(lengths, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def read(self, i):
+        """
+        Raw serialized Example of record i.
+        """
+        start = int(self.offsets[i]) + 12
+        end = start + int(self.lengths[i])
+        record = self.data[start:end]
+        if self.verify and masked_crc32c(record) != struct.unpack('<I', self.data[end:end + 4])[0]:
+            raise IOError("Corrupt record {0} in {1}".format(i, self.path))
+        return record
+
+    def sample(self, k, seed=None):
+        """
+        k distinct records chosen uniformly at random, read in file order.
+        :return: list of (record number, serialized Example)
+        """
+        chosen = sorted(Random(seed).sample(range(len(self)), min(k, len(self))))
+        return [(i, self.read(i)) for i in chosen]
+
+    def iter_range(self, start_byte, end_byte):
+        """
+        Records whose frame starts in [start_byte, end_byte). Splitting the file size into consecutive ranges gives
+        every record to exactly one reader, e.g. start_byte = size * n // num_readers for reader n.
+        :return: iterator of (record number, serialized Example)
+        """
+        first = int(np.searchsorted(self.offsets, start_byte, side='left'))
+        last = int(np.searchsorted(self.offsets, end_byte, side='left'))
+        for i in range(first, last):
+            yield i, self.read(i)
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# Protocol buffer encoding of tf.train.Example. Field numbers follow tensorflow/core/example/feature.proto and
+# example.proto: Example.features = 1, Features.feature = 1 (map<string, Feature>), Feature.bytes_list = 1,
+# Feature.float_list = 2, Feature.int64_list = 3, and <Type>List.value = 1 (numeric lists packed).
+
+def _varint(value):
+    if value < 0:
+        # int64 values are sign extended to ten bytes
+        value += 1 << 64
+    encoded = bytearray()
+    while value > 0x7F:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def _length_delimited(field_number, payload):
+    return _varint((field_number << 3) | 2) + _varint(len(payload)) + payload
+
+
+def bytes_list_feature(value):
+    return _length_delimited(1, b''.join(_length_delimited(1, item) for item in value))
+
+
+def float_list_feature(value):
+    packed = np.asarray(value, dtype='<f4').tobytes()
+    return _length_delimited(2, _length_delimited(1, packed) if len(packed) > 0 else b'')
+
+
+def int64_list_feature(value):
+    packed = b''.join(_varint(int(item)) for item in value)
+    return _length_delimited(3, _length_delimited(1, packed) if len(packed) > 0 else b'')
+
+
+def bytes_feature(value):
+    return bytes_list_feature([value])
+
+
+def float_feature(value):
+    return float_list_feature([value])
+
+
+def int64_feature(value):
+    return int64_list_feature([value])
+
+
+def encode_example(feature):
+    """
+    Serialize a tf.train.Example. Parses with tf.train.Example.FromString and reads back with the Object Detection
+    API decoders like a TensorFlow built record.
+    :param feature (dict) : feature name -> encoded Feature from the *_feature helpers above
+    :return: serialized Example (bytes)
+    """
+    # Map entries are written in key order, as deterministic protobuf serialization does
+    entries = b''.join(_length_delimited(1, _length_delimited(1, name.encode('utf-8')) + _length_delimited(2, value))
+                       for name, value in sorted(feature.items()))
+    return _length_delimited(1, entries)
+
+
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Inspect a TFRecord file through its .index sidecar')
+
+    parser.add_argument(
+        'tfrecord',
+        type=str,
+        help='TFRecord file, e.g. /prog/data/training.tfrecord')
+
+    parser.add_argument(
+        '--record',
+        type=int,
+        nargs='*',
+        default=[],
+        help='Record numbers to show')
+
+    parser.add_argument(
+        '--sample',
+        type=int,
+        default=0,
+        help='Show this many randomly chosen records. Default = 0')
+
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=None,
+        help='Seed for --sample. Default = None (unseeded)')
+
+    args = parser.parse_args()
+    with IndexedTFRecordFile(args.tfrecord) as records:
+        print("{0}: {1} records, {2} boxes".format(args.tfrecord, len(records), int(records.num_boxes.sum())))
+        shown = [(i, records.read(i)) for i in args.record] + records.sample(args.sample, args.seed)
+        for i, record in shown:
+            print("\t{0}\t{1}\toffset {2}\t{3} bytes\t{4} boxes".format(
+                i, records.filenames[i], records.offsets[i], len(record), records.num_boxes[i]))